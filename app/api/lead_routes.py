@@ -1,28 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Header
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
-import tempfile
-import shutil
+from typing import List, Optional
+from datetime import datetime
+import csv
+import io
+import json
 import os
 from slugify import slugify
 
-from app.services import lead_service, followup_service, handoff_service, media_service, nlu_service
-from app.schemas.lead import Lead, LeadCreate, LeadUpdate
+from app.services import lead_service, followup_service, handoff_service, media_service, audio_service, job_service
+from app.services import lead_import_service
+from app.services.transcription_service import transcription_pool, TranscriptionQueueFull, TranscriptionUnavailable
+from app.schemas.lead import Lead, LeadCreate, LeadUpdate, LeadImportResult, LeadPage
 from app.schemas.followup import FollowUp
+from app.schemas.job import Job
 from app.models.followup import FollowUp as FollowUpModel
-from app.core.database import SessionLocal
+from app.core.database import ReadSessionLocal, get_db, get_read_db
+from app.core.config import LEADS_PAGE_SIZE, LEADS_MAX_PAGE_SIZE, LEADS_EXPORT_FETCH_SIZE
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # --- Endpoints de Leads (sem alterações) ---
 @router.post("/leads/", response_model=Lead, tags=["Leads"], operation_id="create_lead")
 def create_new_lead(lead: LeadCreate, db: Session = Depends(get_db)):
@@ -30,18 +29,112 @@ def create_new_lead(lead: LeadCreate, db: Session = Depends(get_db)):
     db_lead = lead_service.get_lead_by_phone(db, phone_number=lead.phone_number)
     if db_lead:
         return db_lead
+    # Lead e cadência de follow-ups no mesmo commit
     new_lead = lead_service.create_lead(db=db, lead=lead)
     followup_service.schedule_initial_followups(db=db, lead=new_lead)
+    db.commit()
     return new_lead
 
 
+@router.post("/leads/bulk", response_model=LeadImportResult, tags=["Leads"], operation_id="bulk_import_leads")
+def bulk_import_leads(file: UploadFile = File(...), format: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Importa uma lista de leads (CSV com cabeçalho ou NDJSON, uma linha por lead).
+    Faz upsert por `phone_number` em lotes e agenda os follow-ups dos leads novos
+    na mesma transação. Campos vazios não apagam dados existentes; linhas com erro
+    aparecem no relatório sem interromper a importação.
+    """
+    fmt = format or lead_import_service.detect_format(file.filename, file.content_type)
+    if fmt not in lead_import_service.IMPORT_FORMATS:
+        raise HTTPException(status_code=422, detail="Formato deve ser 'csv' ou 'ndjson' (use ?format=).")
+    file.file.seek(0)
+    return lead_import_service.import_leads(db, file.file, fmt)
+
+
+def _lead_filters(status: Optional[str] = None, location: Optional[str] = None, broker_id: Optional[int] = None,
+                  updated_since: Optional[datetime] = None, updated_before: Optional[datetime] = None) -> dict:
+    return {"status": status, "location": location, "broker_id": broker_id,
+            "updated_since": updated_since, "updated_before": updated_before}
+
+
+@router.get("/leads", response_model=LeadPage, tags=["Leads"], operation_id="list_leads")
+def list_leads(cursor: Optional[str] = None, limit: int = LEADS_PAGE_SIZE,
+               filters: dict = Depends(_lead_filters), db: Session = Depends(get_read_db)):
+    """
+    Lista leads com filtros (status, location, broker_id, updated_since/updated_before)
+    e paginação por cursor: passe o `next_cursor` da resposta para buscar a próxima página.
+    """
+    if not 1 <= limit <= LEADS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit deve estar entre 1 e {LEADS_MAX_PAGE_SIZE}.")
+    try:
+        after_id = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="cursor inválido.")
+    leads, next_id = lead_service.list_leads(db, after_id, limit, **filters)
+    return LeadPage(items=leads, next_cursor=str(next_id) if next_id is not None else None)
+
+
+def _export_chunks(fmt: str, filters: dict, rows_per_chunk: int = 500):
+    """Gera o arquivo em blocos; usa sessão própria (na réplica) porque roda depois que a rota já retornou."""
+    db = ReadSessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=lead_service.EXPORT_COLUMNS) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        pending = 0
+        for row in lead_service.iter_leads_for_export(db, LEADS_EXPORT_FETCH_SIZE, **filters):
+            if writer:
+                writer.writerow({key: value.isoformat() if isinstance(value, datetime) else value
+                                 for key, value in row.items()})
+            else:
+                buffer.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+            pending += 1
+            if pending >= rows_per_chunk:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@router.get("/leads/export", tags=["Leads"], operation_id="export_leads")
+def export_leads(format: str = "ndjson", filters: dict = Depends(_lead_filters)):
+    """
+    Exporta os leads filtrados em NDJSON ou CSV, em streaming. A leitura usa cursor
+    no servidor, então a memória fica constante mesmo para milhões de linhas.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=422, detail="format deve ser 'ndjson' ou 'csv'.")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"leads-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(_export_chunks(format, filters), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 @router.get("/leads/{phone_number}", response_model=Lead, tags=["Leads"], operation_id="get_lead_by_phone")
-def read_lead(phone_number: str, db: Session = Depends(get_db)):
-    # ... (código existente)
-    db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
-    if db_lead is None:
+def read_lead(phone_number: str, response: Response, if_none_match: Optional[str] = Header(None),
+              db: Session = Depends(get_read_db)):
+    """
+    Retorna o lead (via cache de leitura) com ETag. Clientes que repetem a consulta
+    com If-None-Match recebem 304 sem corpo enquanto o lead não mudar.
+    """
+    cached = lead_service.get_lead_snapshot(db, phone_number=phone_number)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
-    return db_lead
+    if if_none_match and _etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers={"ETag": cached.etag})
+    response.headers["ETag"] = cached.etag
+    return cached.lead
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
 
 
 @router.patch("/leads/{phone_number}", response_model=Lead, tags=["Leads"], operation_id="update_lead")
@@ -50,31 +143,38 @@ def update_lead_data(phone_number: str, lead_update: LeadUpdate, db: Session = D
     db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
     if db_lead is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
-    return lead_service.update_lead(db=db, db_lead=db_lead, lead_update=lead_update)
+    db_lead = lead_service.update_lead(db=db, db_lead=db_lead, lead_update=lead_update)
+    db.commit()
+    return db_lead
 
 
 # --- Endpoints de Follow-ups ---
 @router.get("/leads/{phone_number}/followups", response_model=List[FollowUp], tags=["Follow-ups"],
             operation_id="get_lead_followups")
-def read_lead_followups(phone_number: str, db: Session = Depends(get_db)):
+def read_lead_followups(phone_number: str, db: Session = Depends(get_read_db)):
     # ... (código existente)
-    db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
-    if db_lead is None:
+    cached = lead_service.get_lead_snapshot(db, phone_number=phone_number)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
-    return followup_service.get_followups_by_lead_id(db, lead_id=db_lead.id)
+    return followup_service.get_followups_by_lead_id(db, lead_id=cached.lead.id)
 
 
 # --- MUDANÇA PRINCIPAL AQUI ---
 @router.get("/followups/{followup_id}/audio", tags=["Follow-ups"], operation_id="get_followup_audio")
-def get_followup_as_audio(followup_id: int, db: Session = Depends(get_db)):
+def get_followup_as_audio(followup_id: int, stream: bool = False, db: Session = Depends(get_db)):
     """
     Gera e retorna a mensagem de um follow-up em áudio de alta qualidade via servidor GPU.
+    Com `stream=true` o áudio é enviado em blocos conforme a síntese avança.
     """
     followup_task = db.query(FollowUpModel).filter(FollowUpModel.id == followup_id).first()
     if not followup_task:
         raise HTTPException(status_code=404, detail="Tarefa de follow-up não encontrada")
 
     try:
+        if stream:
+            audio_chunks = media_service.open_speech_stream(followup_task.message_template)
+            return StreamingResponse(audio_chunks, media_type="audio/mpeg")
+
         # Chama o serviço que agora busca o áudio da GPU
         audio_bytes = media_service.generate_speech_from_text(followup_task.message_template)
 
@@ -87,34 +187,68 @@ def get_followup_as_audio(followup_id: int, db: Session = Depends(get_db)):
 # --- Endpoints de Mídia e Handoff (sem alterações) ---
 @router.post("/leads/{phone_number}/audio", tags=["Mídia"], operation_id="upload_audio_message")
 def handle_audio_message(
-        phone_number: str, audio_file: UploadFile = File(...), db: Session = Depends(get_db)
+        phone_number: str, audio_file: UploadFile = File(...), mode: str = "sync",
+        decoding: Optional[str] = None, chunked: bool = False, db: Session = Depends(get_db)
 ):
-    # ... (código existente)
+    """
+    Processa uma nota de voz: upload, transcrição, extração e atualização do lead.
+    Com `mode=job` responde 202 com o id do job e executa o pipeline em segundo plano
+    (acompanhe em GET /jobs/{job_id}); o modo padrão mantém a resposta síncrona.
+    `chunked=true` transcreve áudios longos em trechos paralelos (no modo job, o texto
+    parcial aparece no status) e `decoding=greedy` prioriza velocidade.
+    """
     db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
     if db_lead is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
+    if mode not in ("sync", "job"):
+        raise HTTPException(status_code=422, detail="mode deve ser 'sync' ou 'job'")
+    if decoding not in (None, "beam", "greedy"):
+        raise HTTPException(status_code=422, detail="decoding deve ser 'beam' ou 'greedy'")
+    # Backpressure: recusa cedo, antes do upload, quando a fila de transcrição está cheia
+    if mode == "sync" and transcription_pool.enabled and transcription_pool.is_full():
+        raise HTTPException(status_code=429, detail="Fila de transcrição cheia, tente novamente em instantes.",
+                            headers={"Retry-After": "5"})
     audio_file.file.seek(0)
     original_filename = audio_file.filename
     file_extension = os.path.splitext(original_filename)[1]
     safe_filename_base = slugify(os.path.splitext(original_filename)[0])
     safe_filename = f"{safe_filename_base}{file_extension}"
     audio_file.filename = safe_filename
-    object_name = media_service.upload_audio_to_storage(audio_file, phone_number)
-    audio_file.file.seek(0)
+
+    if mode == "job":
+        # Só a cópia local acontece na requisição; o restante vai para o job
+        temp_audio_path = media_service.spool_audio_upload(audio_file)
+        audio_file.file.close()
+        job = job_service.create_job(db, kind="audio_message")
+        try:
+            job_service.submit_job(
+                audio_service.run_audio_job, job.id, phone_number,
+                f"{phone_number}/{safe_filename}", temp_audio_path, audio_file.content_type,
+                decoding=decoding, chunked=chunked, temp_files=(temp_audio_path,)
+            )
+        except RuntimeError:
+            # Executor já encerrado (API desligando): o job foi marcado como failed
+            raise HTTPException(status_code=503, detail="API em desligamento, tente novamente em instantes.",
+                                headers={"Retry-After": "5"})
+        return JSONResponse(status_code=202, content={
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.id}",
+        })
+
     temp_audio_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=safe_filename) as temp_audio:
-            shutil.copyfileobj(audio_file.file, temp_audio)
-            temp_audio_path = temp_audio.name
-        transcribed_text = media_service.transcribe_audio_local(temp_audio_path)
-        print(f"Texto transcrito para análise: '{transcribed_text}'")
-        current_data = {"location": db_lead.location, "property_type": db_lead.property_type,
-                        "bedrooms": db_lead.bedrooms}
-        current_data = {k: v for k, v in current_data.items() if v is not None}
-        extracted_data = nlu_service.extract_lead_info_from_text(transcribed_text, current_data)
-        print(f"Dados extraídos pelo LLM: {extracted_data.model_dump(exclude_unset=True)}")
-        if extracted_data.model_dump(exclude_unset=True):
-            lead_service.update_lead(db=db, db_lead=db_lead, lead_update=extracted_data)
+        # Uma única leitura do upload alimenta o MinIO e o arquivo do transcritor
+        object_name, temp_audio_path = media_service.ingest_audio_upload(audio_file, phone_number)
+        try:
+            analysis = audio_service.analyze_audio(db, db_lead, temp_audio_path, decoding=decoding, chunked=chunked)
+            db.commit()
+        except TranscriptionUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except TranscriptionQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="A transcrição excedeu o tempo limite.")
     finally:
         audio_file.file.close()
         if temp_audio_path and os.path.exists(temp_audio_path):
@@ -122,11 +256,20 @@ def handle_audio_message(
     return {
         "message": "Áudio processado e lead atualizado.",
         "storage_path": object_name,
-        "transcribed_text": transcribed_text,
-        "updated_fields": extracted_data.model_dump(exclude_unset=True)
+        "transcribed_text": analysis["transcribed_text"],
+        "updated_fields": analysis["updated_fields"]
     }
 
 
+@router.get("/jobs/{job_id}", response_model=Job, tags=["Jobs"], operation_id="get_job_status")
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    """Estado de um job: etapa atual, tempos por etapa e resultado (ou erro)."""
+    job = job_service.get_job(db, job_id=job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
 @router.post("/leads/{phone_number}/handoff", response_model=Lead, tags=["Handoff"],
              operation_id="perform_lead_handoff")
 def trigger_handoff(phone_number: str, db: Session = Depends(get_db)):
@@ -134,4 +277,6 @@ def trigger_handoff(phone_number: str, db: Session = Depends(get_db)):
     db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
     if db_lead is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
-    return handoff_service.perform_handoff(db, lead=db_lead)
+    db_lead = handoff_service.perform_handoff(db, lead=db_lead)
+    db.commit()
+    return db_lead
@@ -0,0 +1,36 @@
+import math
+import time
+
+from fastapi import APIRouter, HTTPException
+
+from app.core.outbound import CircuitOpenError, ollama_backend
+from app.services import nlu_service
+from app.schemas.nlu import NLUBatchRequest, NLUBatchResponse
+from app.core.config import NLU_BATCH_MAX_ITEMS
+
+router = APIRouter()
+
+
+# --- Endpoints de NLU ---
+
+@router.post("/nlu/batch", response_model=NLUBatchResponse, response_model_exclude_unset=True,
+             tags=["NLU"], operation_id="extract_lead_info_batch")
+def extract_batch(payload: NLUBatchRequest):
+    """
+    Extrai as preferências de vários textos (ex: transcrições antigas) de uma vez.
+    Textos repetidos são analisados uma só vez e resultados anteriores vêm do cache.
+    Itens em que o Ollama falhou vêm só com os campos das regras e aparecem em
+    `errors`; com o Ollama indisponível (circuito aberto), o lote é recusado com 503.
+    """
+    if len(payload.items) > NLU_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo de {NLU_BATCH_MAX_ITEMS} itens por lote.")
+
+    started_at = time.perf_counter()
+    try:
+        results, summary = nlu_service.extract_lead_info_batch(
+            [(item.text, item.current_data) for item in payload.items])
+    except CircuitOpenError as e:
+        retry_after = max(1, math.ceil(ollama_backend.breaker.retry_after()))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+    return NLUBatchResponse(results=results, elapsed_ms=round((time.perf_counter() - started_at) * 1000, 1),
+                            **summary)
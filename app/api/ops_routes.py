@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+
+from app.core.outbound import outbound_stats
+from app.services.transcription_service import transcription_pool
+from app.services.rule_extractor import rule_stats
+from app.services.nlu_service import extraction_cache
+from app.services.llm_session import session_cache, token_stats
+from app.services.lead_cache import lead_cache
+from app.services.turn_coordinator import turn_coordinator
+from app.services.message_dedup import message_dedup
+from app.services.conversation_cache import history_writer
+from app.core.config import CONVERSATION_MODE
+from app.core.database import pool_stats
+from app.core.metrics import render_metrics
+from app.core.startup import readiness
+
+router = APIRouter()
+
+
+# --- Endpoints de Operação (observabilidade) ---
+
+@router.get("/ops/outbound", tags=["Operações"], operation_id="get_outbound_stats")
+def read_outbound_stats():
+    """Latência, erros, rejeições e estado do circuito de cada provedor externo."""
+    return outbound_stats()
+
+
+@router.get("/ops/transcription", tags=["Operações"], operation_id="get_transcription_stats")
+def read_transcription_stats():
+    """Profundidade da fila, workers e tempos médios (espera e execução) da transcrição."""
+    return transcription_pool.stats()
+
+
+@router.get("/ops/nlu", tags=["Operações"], operation_id="get_nlu_stats")
+def read_nlu_stats():
+    """Campos resolvidos pelas regras, chamadas ao LLM evitadas e uso do cache de extração."""
+    return {**rule_stats, "cache": extraction_cache.snapshot()}
+
+
+@router.get("/ops/conversation", tags=["Operações"], operation_id="get_conversation_stats")
+def read_conversation_stats():
+    """Tokens por turno em cada modo (prompt x sessão), cache de sessões do Gemini, coalescência de turnos, reentregas descartadas e gravação do histórico."""
+    return {"mode": CONVERSATION_MODE, "tokens": token_stats.snapshot(), "sessions": session_cache.snapshot(),
+            "turns": turn_coordinator.snapshot(), "dedup": message_dedup.snapshot(),
+            "history": history_writer.snapshot()}
+
+
+@router.get("/ops/leads-cache", tags=["Operações"], operation_id="get_lead_cache_stats")
+def read_lead_cache_stats():
+    """Acertos, falhas e invalidações do cache de leitura de leads."""
+    return lead_cache.snapshot()
+
+
+@router.get("/ops/db", tags=["Operações"], operation_id="get_db_pool_stats")
+def read_db_pool_stats():
+    """Ocupação de cada pool de conexões (primário, réplica, assíncrono) e tempo de espera no checkout."""
+    return pool_stats()
+
+
+@router.get("/metrics", tags=["Operações"], operation_id="get_prometheus_metrics", include_in_schema=False)
+def read_metrics():
+    """Métricas no formato de exposição do Prometheus (histogramas por etapa, rota e query; filas e pools)."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+# Sondas do orquestrador: async para não disputar o threadpool com as rotas síncronas
+
+@router.get("/healthz", tags=["Operações"], operation_id="get_liveness", include_in_schema=False)
+async def read_liveness():
+    """Liveness: o processo está de pé e o event loop responde (não depende de banco nem provedores)."""
+    return {"status": "ok"}
+
+
+@router.get("/readyz", tags=["Operações"], operation_id="get_readiness", include_in_schema=False)
+async def read_readiness():
+    """Readiness: 200 só com os componentes obrigatórios aquecidos; 503 no boot e ao encerrar. Inclui o perfil de startup."""
+    snapshot = readiness.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
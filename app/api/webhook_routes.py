@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy.orm import Session
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, Optional
 from pydantic import BaseModel
-from fastapi import Response
 # Imports dos nossos módulos de serviço e schemas
 from app.services import lead_service, conversation_service, media_service
 from app.schemas.lead import LeadCreate
-from app.core.database import SessionLocal
+from app.services.stream_parsing import SentenceBuffer
+from app.services.turn_coordinator import turn_coordinator
+from app.services.message_dedup import message_dedup
+from app.core.database import SessionLocal, AsyncSessionLocal
 
 router = APIRouter()
 
@@ -15,63 +21,252 @@ router = APIRouter()
 class WebhookPayload(BaseModel):
     phone_number: str
     message: str
+    # Id da mensagem no WhatsApp: com ele, reentregas não geram outro turno
+    message_id: Optional[str] = None
+
+
+class EvolutionMessageKey(BaseModel):
+    remoteJid: str
+    fromMe: bool = False
+    id: str
+
+
+class EvolutionMessageData(BaseModel):
+    key: EvolutionMessageKey
+    message: Optional[dict] = None
+    messageType: Optional[str] = None
+
+
+class EvolutionWebhookPayload(BaseModel):
+    """Payload nativo do webhook da Evolution API (só os campos que usamos)."""
+    event: str
+    instance: Optional[str] = None
+    data: Any = None
 
 
 class TextToSpeechPayload(BaseModel):
     text: str
 
 
-# --- Funções Auxiliares ---
+# --- Endpoints da API ---
+
+def _handle_conversation_sync(payload: WebhookPayload) -> dict:
+    """Fluxo bloqueante do turno, usado como fallback quando não há driver assíncrono."""
+    # Fase 1: lead e histórico; a conexão volta ao pool antes da chamada ao Gemini
+    with SessionLocal() as db:
+        lead = lead_service.get_lead_by_phone(db, phone_number=payload.phone_number)
+        if not lead:
+            lead = lead_service.create_lead(db, lead=LeadCreate(phone_number=payload.phone_number))
+        turn = conversation_service.prepare_turn(db, lead, payload.message)
+        db.commit()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    update_data, ai_response = conversation_service.generate_reply(turn)
 
+    # Fase 3: dados extraídos e histórico do turno num único commit
+    with SessionLocal() as db:
+        conversation_service.finish_turn(db, turn, update_data, ai_response)
+        db.commit()
+    return {"response": ai_response}
+
+
+async def _get_or_create_lead_async(db, phone_number: str):
+    # Leads em conversa ativa vêm do cache de leitura, sem SELECT a cada turno
+    cached = await lead_service.get_lead_snapshot_async(db, phone_number=phone_number)
+    if cached is not None:
+        return cached.lead
+    return await lead_service.create_lead_async(db, lead=LeadCreate(phone_number=phone_number))
+
+
+async def _begin_turn(phone_number: str, message: str) -> conversation_service.PreparedTurn:
+    """Fase 1 do turno: transação curta (lead e histórico) que devolve a conexão antes do Gemini."""
+    async with AsyncSessionLocal() as db:
+        lead = await _get_or_create_lead_async(db, phone_number)
+        turn = await conversation_service.prepare_turn_async(db, lead, message)
+        # Confirma o lead, se ele foi criado agora
+        await db.commit()
+    return turn
+
+
+async def _end_turn(turn: conversation_service.PreparedTurn, update_data: dict, ai_response: str) -> dict:
+    """Fase 3 do turno: lead e histórico numa nova transação curta."""
+    async with AsyncSessionLocal() as db:
+        update_data = await conversation_service.finish_turn_async(db, turn, update_data, ai_response)
+        await db.commit()
+    return update_data
+
+
+async def _run_turn(phone_number: str, message: str) -> str:
+    """Um turno completo para o texto do lote; nenhuma conexão fica presa durante o Gemini."""
+    if AsyncSessionLocal is None:
+        result = await run_in_threadpool(_handle_conversation_sync,
+                                         WebhookPayload(phone_number=phone_number, message=message))
+        return result["response"]
+
+    turn = await _begin_turn(phone_number, message)
+    update_data, ai_response = await conversation_service.generate_reply_async(turn)
+    await _end_turn(turn, update_data, ai_response)
+    return ai_response
+
+
+async def _handle_message(phone_number: str, message: str, message_id: Optional[str]) -> dict:
+    """Turno coordenado (debounce/serialização) e, com message_id, executado uma vez só."""
+    reply = {"coalesced_messages": 1, "is_last": True}
+
+    async def run_turn() -> str:
+        outcome = await turn_coordinator.submit(
+            phone_number, message,
+            lambda combined: _run_turn(phone_number, combined),
+        )
+        reply.update(coalesced_messages=outcome.batch_size, is_last=outcome.is_last)
+        return outcome.result
+
+    if message_id is None:
+        return {"response": await run_turn(), "coalesced_messages": reply["coalesced_messages"]}
+
+    result = await message_dedup.run_once(message_id, phone_number, run_turn)
+    return {"response": result.response, "coalesced_messages": reply["coalesced_messages"],
+            "duplicate": result.duplicate, "status": result.status,
+            # Só a primeira entrega da última mensagem do lote deve virar resposta no WhatsApp
+            "reply": not result.duplicate and reply["is_last"]}
 
-# --- Endpoints da API ---
 
 @router.post("/conversation/webhook", tags=["Conversational Demo"], operation_id="handle_conversation")
-def handle_conversation_message(payload: WebhookPayload, db: Session = Depends(get_db)):
+async def handle_conversation_message(payload: WebhookPayload):
     """
     Este endpoint simula o recebimento de uma mensagem do WhatsApp.
     Ele gerencia a conversa e atualiza o lead em tempo real.
+    Mensagens do mesmo lead que chegam juntas (janela TURN_DEBOUNCE_SECONDS) viram
+    um único turno, e os turnos de um lead nunca correm em paralelo. Todas as
+    requisições do lote recebem a mesma resposta; `coalesced_messages` diz quantas
+    mensagens ela atende. Com `message_id`, reentregas devolvem a resposta já gerada
+    (`duplicate: true`) sem novo turno.
     """
-    # Garante que o lead exista, criando um novo se necessário
-    lead = lead_service.get_lead_by_phone(db, phone_number=payload.phone_number)
-    if not lead:
-        lead = lead_service.create_lead(db, lead=LeadCreate(phone_number=payload.phone_number))
+    return await _handle_message(payload.phone_number, payload.message, payload.message_id)
 
-    # Processa a mensagem e obtém a resposta da IA
-    ai_response = conversation_service.process_user_message(db, lead, payload.message)
 
-    return {"response": ai_response}
+def _evolution_text(message: Optional[dict]) -> Optional[str]:
+    if not message:
+        return None
+    if message.get("conversation"):
+        return message["conversation"]
+    for kind, field in (("extendedTextMessage", "text"), ("imageMessage", "caption"), ("videoMessage", "caption")):
+        text = (message.get(kind) or {}).get(field)
+        if text:
+            return text
+    return None
 
 
-@router.post("/tts/generate", tags=["Conversational Demo"], operation_id="generate_speech")
-def generate_speech(payload: TextToSpeechPayload):
-    """Recebe um texto e retorna o áudio correspondente usando gTTS."""
-    try:
-        # A função que você já tem no seu media_service
-        audio_bytes = media_service.generate_speech_from_text(payload.text)
-        return Response(content=audio_bytes, media_type="audio/mpeg")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-# No topo do arquivo webhook_routes.py
+@router.post("/webhook/evolution", tags=["Conversational Demo"], operation_id="handle_evolution_webhook")
+async def handle_evolution_webhook(payload: EvolutionWebhookPayload):
+    """
+    Recebe o webhook nativo da Evolution API (evento messages.upsert). O id da
+    mensagem (`data.key.id`) torna a entrega idempotente: reentregas por timeout
+    recebem a resposta guardada, sem outra linha no histórico nem outra chamada ao Gemini.
+    Eventos que não são mensagens de texto de um contato são ignorados com 200,
+    para a Evolution não reenviar.
+    """
+    if payload.event.lower().replace("_", ".") != "messages.upsert" or not isinstance(payload.data, dict):
+        return {"status": "ignored", "reason": "event"}
+    data = EvolutionMessageData.model_validate(payload.data)
+    jid = data.key.remoteJid
+    if data.key.fromMe or not jid.endswith("@s.whatsapp.net"):
+        # Mensagens nossas, grupos e status não entram na conversa
+        return {"status": "ignored", "reason": "sender"}
+    text = _evolution_text(data.message)
+    if not text:
+        return {"status": "ignored", "reason": "message_type", "message_type": data.messageType}
 
+    return await _handle_message(jid.split("@", 1)[0], text, data.key.id)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _conversation_events(payload: WebhookPayload):
+    """Eventos do turno: ("delta", texto)... e por fim ("done", resposta, update_data)."""
+    # O streaming responde mensagem a mensagem: serializa o turno do lead, sem debounce
+    async with turn_coordinator.serialized(payload.phone_number):
+        if AsyncSessionLocal is None:
+            # Sem driver assíncrono não há streaming do Gemini: a resposta sai de uma vez
+            result = await run_in_threadpool(_handle_conversation_sync, payload)
+            yield "delta", result["response"]
+            yield "done", result["response"], {}
+            return
+
+        turn = await _begin_turn(payload.phone_number, payload.message)
+        async for event in conversation_service.stream_reply_async(turn):
+            if event[0] == "delta":
+                yield event
+                continue
+            # Confirma o turno antes de avisar o cliente que os dados foram aplicados; se
+            # ele desconectar antes disso, o turno não é gravado
+            _, update_data, ai_response = event
+            update_data = await _end_turn(turn, update_data, ai_response)
+            yield "done", ai_response, update_data
+
+
+@router.post("/conversation/stream", tags=["Conversational Demo"], operation_id="stream_conversation")
+async def stream_conversation_message(payload: WebhookPayload, tts: bool = False):
+    """
+    Mesmo turno do /conversation/webhook, mas a resposta chega por Server-Sent Events:
+    `delta` com cada trecho do texto, `sentence` a cada frase completa e `done` com a
+    resposta final e os dados aplicados ao lead. Com `tts=true`, o áudio de cada frase
+    começa a ser gerado (e fica no cache do /tts/generate) assim que ela termina.
+    """
+    loop = asyncio.get_running_loop()
+
+    def start_tts(sentence: str):
+        if tts:
+            loop.run_in_executor(None, media_service.prewarm_speech_cache, [sentence])
+
+    async def event_stream():
+        sentences = SentenceBuffer()
+        index = 0
+        async for event in _conversation_events(payload):
+            if event[0] == "delta":
+                yield _sse("delta", {"text": event[1]})
+                for sentence in sentences.feed(event[1]):
+                    start_tts(sentence)
+                    yield _sse("sentence", {"index": index, "text": sentence})
+                    index += 1
+                continue
+
+            _, ai_response, update_data = event
+            rest = sentences.flush()
+            if index == 0 and not rest:
+                # Nada foi transmitido (ex: falha no Gemini): a resposta final vira a única frase
+                rest = ai_response
+            if rest:
+                start_tts(rest)
+                yield _sse("sentence", {"index": index, "text": rest})
+            yield _sse("done", {"response": ai_response, "update_data": update_data})
+
+    # Sem buffer em proxies (nginx) para os eventos saírem na hora
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-# Adicione esta classe Pydantic
-class TextToSpeechPayload(BaseModel):
-    text: str
 
-# Adicione este novo endpoint no final do arquivo
 @router.post("/tts/generate", tags=["Conversational Demo"], operation_id="generate_speech")
-def generate_speech(payload: TextToSpeechPayload):
-    """Recebe um texto e retorna o áudio correspondente usando ElevenLabs."""
+def generate_speech(payload: TextToSpeechPayload, stream: bool = False):
+    """
+    Recebe um texto e retorna o áudio correspondente usando ElevenLabs (com cache).
+    Com `stream=true` o áudio é repassado em blocos (chunked) assim que a síntese começa.
+    """
     try:
+        if stream:
+            audio_chunks = media_service.open_speech_stream(payload.text)
+            return StreamingResponse(audio_chunks, media_type="audio/mpeg", headers={"X-TTS-Mode": "streaming"})
         audio_bytes = media_service.generate_speech_from_text(payload.text)
-        return Response(content=audio_bytes, media_type="audio/mpeg")
+        return Response(content=audio_bytes, media_type="audio/mpeg", headers={"X-TTS-Mode": "buffered"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/tts/stats", tags=["Conversational Demo"], operation_id="get_tts_stats")
+def get_tts_stats():
+    """Tempo até o primeiro byte de áudio (buffered x streaming) e acertos do cache de TTS."""
+    return {
+        "ttfb": media_service.tts_ttfb_stats.summary(),
+        "cache": media_service.tts_cache.stats,
+    }
@@ -5,4 +5,147 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Configurações do Banco de Dados
-DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@db/{os.getenv('DB_NAME')}")
\ No newline at end of file
+DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@db/{os.getenv('DB_NAME')}")
+
+# Réplica de leitura opcional: rotas só de leitura (GET de leads, follow-ups, exportação) vão para ela
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+
+# Pool de conexões (vale para o primário, a réplica e o motor assíncrono)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# statement_timeout do PostgreSQL em ms (0 desliga)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Por quantos segundos após uma escrita as leituras daquele lead ignoram a réplica (atraso de replicação)
+DB_READ_AFTER_WRITE_SECONDS = float(os.getenv("DB_READ_AFTER_WRITE_SECONDS", "5"))
+
+# Habilita o caminho assíncrono (asyncpg) para o turno de conversa.
+# Com "false", as rotas usam o fluxo bloqueante numa thread como fallback.
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "true").lower() == "true"
+
+# Janela de conversa em memória (por lead) e gravação do histórico em lote
+CONVERSATION_WINDOW_SIZE = int(os.getenv("CONVERSATION_WINDOW_SIZE", "10"))
+CONVERSATION_CACHE_MAX_LEADS = int(os.getenv("CONVERSATION_CACHE_MAX_LEADS", "5000"))
+# Validade da janela: depois dela o lead é relido do banco (limita o atraso quando outro worker o atendeu)
+CONVERSATION_WINDOW_TTL_SECONDS = float(os.getenv("CONVERSATION_WINDOW_TTL_SECONDS", "60"))
+
+# Modo da conversa com o Gemini: "session" (persona como system instruction e
+# histórico em turnos estruturados, sessão reaproveitada por lead) ou "prompt"
+# (prompt único com persona e histórico em texto, como antes)
+CONVERSATION_MODE = os.getenv("CONVERSATION_MODE", "session").lower()
+CONVERSATION_SESSION_MAX_LEADS = int(os.getenv("CONVERSATION_SESSION_MAX_LEADS", "2000"))
+CONVERSATION_SESSION_TTL_SECONDS = float(os.getenv("CONVERSATION_SESSION_TTL_SECONDS", "1800"))
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "1.0"))
+HISTORY_FLUSH_BATCH_SIZE = int(os.getenv("HISTORY_FLUSH_BATCH_SIZE", "200"))
+# Após N falhas seguidas do mesmo lote, grava linha a linha e descarta (em log) as
+# linhas que o banco rejeita; acima de HISTORY_MAX_PENDING novas mensagens não entram na fila
+HISTORY_FLUSH_MAX_ATTEMPTS = int(os.getenv("HISTORY_FLUSH_MAX_ATTEMPTS", "3"))
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "50000"))
+
+# Disparo de follow-ups: tamanho do lote travado por transação, limite de lotes
+# por execução e quantas drenagens paralelas cada processo roda
+FOLLOWUP_BATCH_SIZE = int(os.getenv("FOLLOWUP_BATCH_SIZE", "100"))
+FOLLOWUP_MAX_BATCHES_PER_RUN = int(os.getenv("FOLLOWUP_MAX_BATCHES_PER_RUN", "50"))
+FOLLOWUP_DISPATCH_CONCURRENCY = int(os.getenv("FOLLOWUP_DISPATCH_CONCURRENCY", "1"))
+
+# Agendador: "leader" (padrão) roda em todo processo, mas só o líder eleito via
+# advisory lock do Postgres executa os jobs; "off" desliga o agendador na API
+# (use então `python -m app.worker`)
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "leader").lower()
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "72019"))
+
+# Cache de áudio TTS: LRU em memória (orçamento em bytes) + bucket no MinIO
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_BUCKET = os.getenv("TTS_CACHE_BUCKET", "tts-cache")
+TTS_PREWARM_ENABLED = os.getenv("TTS_PREWARM_ENABLED", "true").lower() == "true"
+
+# Streaming de TTS: tamanho dos blocos repassados ao cliente e limite do que
+# é acumulado por requisição para alimentar o cache ao final
+TTS_STREAM_CHUNK_SIZE = int(os.getenv("TTS_STREAM_CHUNK_SIZE", str(16 * 1024)))
+TTS_STREAM_MAX_CACHEABLE_BYTES = int(os.getenv("TTS_STREAM_MAX_CACHEABLE_BYTES", str(2 * 1024 * 1024)))
+
+# Transcrição (faster-whisper): modelo, pool de processos e fila com backpressure.
+# WHISPER_WORKERS=0 mantém a transcrição dentro do processo da API.
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "2"))
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, WHISPER_WORKERS)))))
+WHISPER_MAX_QUEUE = int(os.getenv("WHISPER_MAX_QUEUE", "8"))
+WHISPER_JOB_TIMEOUT_SECONDS = float(os.getenv("WHISPER_JOB_TIMEOUT_SECONDS", "300"))
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "true").lower() == "true"
+
+# Backend de transcrição: "whisper" (padrão) ou "stub", que devolve STT_STUB_TEXT
+# após STT_STUB_LATENCY_MS sem carregar modelo (benchmarks em bench/)
+STT_BACKEND = os.getenv("STT_BACKEND", "whisper").lower()
+STT_STUB_TEXT = os.getenv("STT_STUB_TEXT", "Procuro um apartamento de 3 quartos em Balneário Camboriú")
+STT_STUB_LATENCY_MS = float(os.getenv("STT_STUB_LATENCY_MS", "300"))
+
+# Ingestão de áudio: tamanho de cada parte do multipart upload no MinIO
+# (mínimo de 5 MiB). É também o pico de memória por upload.
+AUDIO_INGEST_PART_SIZE = int(os.getenv("AUDIO_INGEST_PART_SIZE", str(5 * 1024 * 1024)))
+
+# Jobs em segundo plano (modo assíncrono do upload de áudio)
+AUDIO_JOB_WORKERS = int(os.getenv("AUDIO_JOB_WORKERS", "4"))
+
+# Transcrição de áudios longos: acima de WHISPER_CHUNKED_MIN_SECONDS o áudio é
+# dividido em trechos de até WHISPER_CHUNK_SECONDS (cortando em silêncios, via VAD)
+# e os trechos são transcritos em paralelo pelos workers.
+# WHISPER_DECODING: "beam" (beam_size=5) ou "greedy" (beam_size=1, mais rápido)
+WHISPER_CHUNKED_MIN_SECONDS = float(os.getenv("WHISPER_CHUNKED_MIN_SECONDS", "60"))
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "30"))
+WHISPER_MIN_SILENCE_MS = int(os.getenv("WHISPER_MIN_SILENCE_MS", "500"))
+WHISPER_DECODING = os.getenv("WHISPER_DECODING", "beam").lower()
+
+# Extrator por regras (antes do LLM): confiança mínima para aceitar um campo e
+# quantas palavras "não explicadas" pelas regras ainda dispensam a chamada ao LLM
+NLU_RULES_MIN_CONFIDENCE = float(os.getenv("NLU_RULES_MIN_CONFIDENCE", "0.8"))
+NLU_RULES_MAX_RESIDUAL_WORDS = int(os.getenv("NLU_RULES_MAX_RESIDUAL_WORDS", "3"))
+
+# Extração NLU: cache de resultados (por texto normalizado + dados atuais) e
+# quantas chamadas simultâneas ao Ollama o lote pode usar (fica abaixo do bulkhead)
+NLU_CACHE_MAX_ENTRIES = int(os.getenv("NLU_CACHE_MAX_ENTRIES", "10000"))
+NLU_BATCH_CONCURRENCY = int(os.getenv("NLU_BATCH_CONCURRENCY", "3"))
+NLU_BATCH_MAX_ITEMS = int(os.getenv("NLU_BATCH_MAX_ITEMS", "5000"))
+
+# Importação em massa de leads: linhas por lote (um INSERT ... ON CONFLICT por lote)
+# e quantos erros por linha entram no relatório
+LEAD_IMPORT_BATCH_SIZE = int(os.getenv("LEAD_IMPORT_BATCH_SIZE", "1000"))
+LEAD_IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("LEAD_IMPORT_MAX_REPORTED_ERRORS", "1000"))
+
+# Listagem de leads: tamanho de página padrão/máximo e linhas buscadas por vez na exportação
+LEADS_PAGE_SIZE = int(os.getenv("LEADS_PAGE_SIZE", "50"))
+LEADS_MAX_PAGE_SIZE = int(os.getenv("LEADS_MAX_PAGE_SIZE", "500"))
+LEADS_EXPORT_FETCH_SIZE = int(os.getenv("LEADS_EXPORT_FETCH_SIZE", "1000"))
+
+# Cache de leads por telefone (leitura): validade e limite de entradas
+LEAD_CACHE_TTL_SECONDS = float(os.getenv("LEAD_CACHE_TTL_SECONDS", "30"))
+LEAD_CACHE_MAX_ENTRIES = int(os.getenv("LEAD_CACHE_MAX_ENTRIES", "10000"))
+
+# Coordenação de turnos por lead: mensagens que chegam dentro da janela de
+# debounce viram uma só chamada ao LLM (0 desliga a espera); a espera total de
+# um lote nunca passa de TURN_MAX_WAIT_SECONDS desde a primeira mensagem
+TURN_DEBOUNCE_SECONDS = float(os.getenv("TURN_DEBOUNCE_SECONDS", "1.0"))
+TURN_MAX_WAIT_SECONDS = float(os.getenv("TURN_MAX_WAIT_SECONDS", "4.0"))
+
+# Deduplicação de mensagens do webhook (reentregas da Evolution API): janela em
+# memória, tempo após o qual uma mensagem "processing" abandonada pode ser
+# reprocessada e retenção dos registros no banco
+MESSAGE_DEDUP_MAX_ENTRIES = int(os.getenv("MESSAGE_DEDUP_MAX_ENTRIES", "10000"))
+MESSAGE_DEDUP_TTL_SECONDS = float(os.getenv("MESSAGE_DEDUP_TTL_SECONDS", "3600"))
+MESSAGE_CLAIM_TIMEOUT_SECONDS = float(os.getenv("MESSAGE_CLAIM_TIMEOUT_SECONDS", "300"))
+PROCESSED_MESSAGE_RETENTION_DAYS = int(os.getenv("PROCESSED_MESSAGE_RETENTION_DAYS", "7"))
+
+# Logging: nível mínimo (DEBUG, INFO, WARNING...) e formato ("text" ou "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Inicialização: a criação das tabelas e a carga inicial são um passo próprio,
+# `python -m app.init_db` (uma vez por deploy); DB_INIT_ON_STARTUP=true faz a API
+# executá-lo no boot (só para desenvolvimento local). O /readyz só responde 200
+# quando os componentes de READINESS_REQUIRED estão prontos
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "false").lower() == "true"
+READINESS_REQUIRED = [name.strip() for name in os.getenv("READINESS_REQUIRED", "database,whisper").split(",")
+                      if name.strip()]
@@ -1,13 +1,187 @@
+import logging
+import threading
+import time
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from .config import DATABASE_URL
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
+from .config import (
+    DATABASE_URL, DATABASE_READ_URL, ASYNC_DB_ENABLED, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# --- Pool com medição do tempo de espera no checkout ---
+
+class PoolWaitStats:
+    """Quantas conexões foram pedidas ao pool e quanto tempo se esperou por elas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        ms = seconds * 1000
+        with self._lock:
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total_ms += ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts, "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 2) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 2),
+            }
+
+
+class _TimedPoolMixin:
+    wait_stats: PoolWaitStats
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.wait_stats.record(time.perf_counter() - started_at, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started_at)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Estatísticas por motor ("primary", "read", "async"), expostas em /ops/db
+pool_wait_stats = {}
+
+
+def _engine_options(url: str, name: str, is_async: bool = False) -> dict:
+    """Pool e timeouts vindos do ambiente; o SQLite (desenvolvimento) fica com os padrões."""
+    if url.startswith("sqlite"):
+        return {}
+    stats = pool_wait_stats.setdefault(name, PoolWaitStats())
+    pool_class = type(f"{name.title()}Pool", (TimedAsyncQueuePool if is_async else TimedQueuePool,),
+                      {"wait_stats": stats})
+    options = {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith("postgresql"):
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
 
 # Cria o "motor" de conexão com o banco
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, "primary"))
+
+# Conexões presas por muito tempo (advisory lock de liderança do agendador) saem
+# de um motor sem pool, sem ocupar vaga do pool das requisições
+leader_engine = create_engine(DATABASE_URL, poolclass=NullPool)
 
-# Cria uma fábrica de sessões
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Cria uma fábrica de sessões. Os serviços só fazem flush; quem abre a sessão
+# (rota ou job) faz um único commit no fim, e os objetos continuam válidos depois dele.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
+# Réplica de leitura: sem DATABASE_READ_URL, as leituras usam o próprio primário
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **_engine_options(DATABASE_READ_URL, "read"))
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine,
+                                    expire_on_commit=False, info={"replica": True})
+else:
+    read_engine = engine
+    ReadSessionLocal = SessionLocal
 
 # Cria uma classe Base para nossos modelos ORM
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def get_db():
+    """Sessão do primário para a requisição (dependência do FastAPI)."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db():
+    """Sessão para rotas só de leitura: vai para a réplica quando configurada."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def is_replica_session(db) -> bool:
+    return bool(db.info.get("replica"))
+
+
+def pool_stats() -> dict:
+    """Ocupação atual e tempo de espera no checkout de cada pool."""
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["read"] = read_engine
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine
+    result = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        data = {"pool": pool.status()}
+        if name in pool_wait_stats:
+            data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(),
+                        **pool_wait_stats[name].snapshot())
+        result[name] = data
+    return result
+
+
+def _to_async_url(url: str) -> str:
+    """Converte a URL síncrona para o driver assíncrono equivalente."""
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+# Motor assíncrono (opcional). Se o driver não estiver instalado ou o recurso
+# estiver desligado, AsyncSessionLocal fica None e as rotas usam o fluxo bloqueante.
+async_engine = None
+AsyncSessionLocal = None
+
+if ASYNC_DB_ENABLED:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+        async_url = _to_async_url(DATABASE_URL)
+        async_engine = create_async_engine(async_url, **_engine_options(async_url, "async", is_async=True))
+        AsyncSessionLocal = async_sessionmaker(
+            bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    except ImportError as e:
+        logger.warning("Driver assíncrono indisponível, usando apenas o fluxo síncrono: %s", e)
@@ -0,0 +1,76 @@
+import logging
+import threading
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class AdvisoryLockLeader:
+    """
+    Eleição de líder com pg_try_advisory_lock. O lock é de sessão, então fica
+    preso a uma conexão dedicada enquanto o processo for líder; use um motor
+    sem pool (database.leader_engine) para ela não ocupar uma vaga do pool.
+    Se o líder cair, o Postgres libera o lock junto com a conexão e outro
+    processo assume na próxima verificação.
+    """
+
+    def __init__(self, engine: Engine, lock_key: int):
+        self.engine = engine
+        self.lock_key = lock_key
+        self.is_leader = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def ensure(self) -> bool:
+        """Confirma a liderança atual ou tenta obtê-la. Retorna se este processo é o líder."""
+        with self._lock:
+            # Sem Postgres (ex.: SQLite local) não há concorrência entre processos
+            if self.engine.dialect.name != "postgresql":
+                self.is_leader = True
+                return True
+
+            if self._conn is not None:
+                try:
+                    self._conn.execute(text("SELECT 1"))
+                    return True
+                except Exception as e:
+                    logger.warning("Conexão de liderança perdida, deixando de ser líder: %s", e)
+                    self._discard_connection()
+
+            conn = None
+            try:
+                conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+            except Exception as e:
+                logger.error("Erro ao tentar obter a liderança do agendador: %s", e)
+                if conn is not None:
+                    conn.close()
+                return False
+
+            if acquired:
+                self._conn = conn
+                self.is_leader = True
+                logger.info("Este processo agora é o líder do agendador.")
+            else:
+                conn.close()
+            return self.is_leader
+
+    def release(self):
+        with self._lock:
+            if self._conn is None:
+                self.is_leader = False
+                return
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            except Exception as e:
+                logger.error("Erro ao liberar a liderança do agendador: %s", e)
+            self._discard_connection()
+
+    def _discard_connection(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+        self.is_leader = False
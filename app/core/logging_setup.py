@@ -0,0 +1,90 @@
+"""
+Logging da aplicação. Os módulos só criam registros (logging.getLogger(__name__));
+um QueueHandler os entrega a uma fila e uma thread (QueueListener) escreve no
+stdout, então o caminho quente nunca espera pela escrita no terminal/coletor.
+
+LOG_FORMAT=json gera uma linha JSON por registro, com os campos passados em
+`extra=` (ex.: lead_id, stage), prontos para o agregador de logs.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import LOG_LEVEL, LOG_FORMAT
+
+# Atributos padrão do LogRecord; o que sobrar veio de `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    QueueHandler que preserva o traceback. O prepare() padrão formata o registro
+    e zera exc_info, colando o traceback na mensagem; aqui só a mensagem é
+    resolvida e o traceback vira texto em exc_text, que o formatter de saída usa.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            # O traceback com frames não precisa atravessar a fila
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Configura o logger raiz uma única vez por processo (API, worker ou scripts)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [RecordQueueHandler(_log_queue)]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(_log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Escreve o que ainda estiver na fila ao sair
+    atexit.register(_listener.stop)
+
+
+def log_queue_size() -> int:
+    return _log_queue.qsize()
@@ -0,0 +1,185 @@
+"""
+Métricas Prometheus expostas em /metrics.
+
+- Histogramas de latência por etapa do pipeline (Whisper, Ollama, Gemini,
+  ElevenLabs, MinIO, lote de follow-ups), por rota HTTP e por query no banco.
+- Gauges de filas e pools lidos no momento da coleta (sem custo no caminho quente).
+
+Com vários workers do uvicorn, defina PROMETHEUS_MULTIPROC_DIR (diretório
+vazio a cada deploy) para que os histogramas somem todos os processos.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Etapas do pipeline medidas com observe_stage()
+STAGES = (
+    "whisper_transcription", "ollama_extraction", "gemini_turn",
+    "elevenlabs_tts", "minio_upload", "followup_batch",
+)
+
+STAGE_SECONDS = Histogram(
+    "aurora_stage_duration_seconds", "Latência de cada etapa do pipeline.",
+    ["stage", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+HTTP_SECONDS = Histogram(
+    "aurora_http_request_duration_seconds", "Latência das requisições HTTP por rota.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+DB_QUERY_SECONDS = Histogram(
+    "aurora_db_query_duration_seconds", "Latência das queries no banco por tipo de comando.",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Mede o bloco como uma etapa do pipeline (outcome "error" se ele lançar exceção)."""
+    started_at = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage, outcome).observe(time.perf_counter() - started_at)
+
+
+def record_stage(stage: str, seconds: float, outcome: str = "ok"):
+    """Para etapas que não cabem num bloco (ex.: streaming, medido até o último trecho)."""
+    STAGE_SECONDS.labels(stage, outcome).observe(seconds)
+
+
+# --- Queries (todos os engines, inclusive os assíncronos) ---
+
+def _statement_kind(statement: str) -> str:
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started_at")
+    if started:
+        DB_QUERY_SECONDS.labels(_statement_kind(statement)).observe(time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_query_error(context):
+    started = context.connection.info.get("query_started_at") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# --- Rotas HTTP ---
+
+class MetricsMiddleware:
+    """Middleware ASGI: mede a requisição inteira (até o fim do corpo, inclusive em streaming)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # O template da rota (ex.: /leads/{phone_number}) mantém a cardinalidade baixa
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(scope["method"], route, str(status["code"])).observe(time.perf_counter() - started_at)
+
+
+# --- Gauges de filas e pools (lidos na coleta) ---
+
+class RuntimeCollector:
+    def collect(self):
+        # Imports tardios: estes módulos dependem da configuração e do banco
+        from app.core.database import pool_stats
+        from app.core.outbound import backends
+        from app.core.logging_setup import log_queue_size
+        from app.services.conversation_cache import history_writer
+        from app.services.job_service import job_executor
+        from app.services.transcription_service import transcription_pool
+        from app.services.turn_coordinator import turn_coordinator
+
+        pool_checked_out = GaugeMetricFamily("aurora_db_pool_checked_out", "Conexões em uso no pool.", labels=["pool"])
+        pool_overflow = GaugeMetricFamily("aurora_db_pool_overflow", "Conexões acima do pool_size.", labels=["pool"])
+        pool_wait_max = GaugeMetricFamily("aurora_db_pool_wait_max_seconds",
+                                          "Maior espera por uma conexão do pool.", labels=["pool"])
+        pool_wait_avg = GaugeMetricFamily("aurora_db_pool_wait_avg_seconds",
+                                          "Espera média por uma conexão do pool.", labels=["pool"])
+        pool_timeouts = GaugeMetricFamily("aurora_db_pool_timeouts", "Checkouts que estouraram o timeout.",
+                                          labels=["pool"])
+        for name, stats in pool_stats().items():
+            if "checked_out" not in stats:
+                continue  # SQLite: sem pool com fila
+            pool_checked_out.add_metric([name], stats["checked_out"])
+            pool_overflow.add_metric([name], max(0, stats.get("overflow", 0)))
+            pool_wait_max.add_metric([name], stats["wait_max_ms"] / 1000)
+            pool_wait_avg.add_metric([name], stats["wait_avg_ms"] / 1000)
+            pool_timeouts.add_metric([name], stats["timeouts"])
+        yield from (pool_checked_out, pool_overflow, pool_wait_max, pool_wait_avg, pool_timeouts)
+
+        in_flight = GaugeMetricFamily("aurora_outbound_in_flight", "Chamadas em andamento por provedor.",
+                                      labels=["backend"])
+        circuit_open = GaugeMetricFamily("aurora_outbound_circuit_open", "1 se o circuito do provedor está aberto.",
+                                         labels=["backend"])
+        for name, backend in backends.items():
+            snapshot = backend.snapshot()
+            in_flight.add_metric([name], snapshot["in_flight"])
+            circuit_open.add_metric([name], 0 if snapshot["circuit"] == "closed" else 1)
+        yield from (in_flight, circuit_open)
+
+        transcription = transcription_pool.stats()
+        queues = GaugeMetricFamily("aurora_queue_depth", "Itens esperando em cada fila interna.", labels=["queue"])
+        queues.add_metric(["transcription"], transcription["queue_depth"])
+        queues.add_metric(["audio_jobs"], job_executor._work_queue.qsize())
+        queues.add_metric(["history_write_behind"], history_writer.pending_count())
+        queues.add_metric(["log_records"], log_queue_size())
+        yield queues
+
+        yield GaugeMetricFamily("aurora_transcription_in_flight", "Transcrições em andamento ou na fila.",
+                                value=transcription["in_flight"])
+        yield GaugeMetricFamily("aurora_turn_active_leads", "Leads com turno em andamento ou em debounce.",
+                                value=turn_coordinator.snapshot()["active_leads"])
+
+
+runtime_collector = RuntimeCollector()
+REGISTRY.register(runtime_collector)
+
+
+def render_metrics() -> tuple:
+    """Retorna (corpo, content-type) no formato de exposição do Prometheus."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Gauges de filas e pools são do processo que atendeu a coleta
+        registry.register(runtime_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,30 +1,69 @@
 import os
+import logging
+import threading
+import time
 from minio import Minio
 from dotenv import load_dotenv
+from app.core.config import TTS_CACHE_BUCKET
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MINIO_HOST = os.getenv("MINIO_HOST")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 BUCKET_NAME = "lead-media"
+# Intervalo entre tentativas de criar os buckets com o MinIO fora do ar
+BUCKET_RETRY_SECONDS = 30
+
+# O cliente e os buckets são criados no primeiro uso (ou no aquecimento do
+# startup), nunca no import: sem MinIO no ar o import travava nos retries.
+_client = None
+_buckets_ready = False
+_retry_at = 0.0
+_lock = threading.Lock()
+
+
+def _create_client() -> Minio:
+    return Minio(
+        MINIO_HOST,
+        access_key=MINIO_ACCESS_KEY,
+        secret_key=MINIO_SECRET_KEY,
+        secure=False # Em desenvolvimento, usamos HTTP
+    )
+
+
+def ensure_buckets() -> Minio:
+    """Cria os buckets se eles não existirem (mídia dos leads e cache de áudio TTS). Lança exceção se falhar."""
+    global _client, _buckets_ready
+    with _lock:
+        if _client is None:
+            _client = _create_client()
+        if not _buckets_ready:
+            for bucket in (BUCKET_NAME, TTS_CACHE_BUCKET):
+                if not _client.bucket_exists(bucket):
+                    _client.make_bucket(bucket)
+                    logger.info("Bucket '%s' criado com sucesso.", bucket)
+                else:
+                    logger.debug("Bucket '%s' já existe.", bucket)
+            _buckets_ready = True
+        return _client
+
 
-minio_client = Minio(
-    MINIO_HOST,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=False # Em desenvolvimento, usamos HTTP
-)
-
-# Cria o bucket se ele não existir
-try:
-    found = minio_client.bucket_exists(BUCKET_NAME)
-    if not found:
-        minio_client.make_bucket(BUCKET_NAME)
-        print(f"Bucket '{BUCKET_NAME}' criado com sucesso.")
-    else:
-        print(f"Bucket '{BUCKET_NAME}' já existe.")
-except Exception as e:
-    print(f"Erro ao conectar com o MinIO ou criar bucket: {e}")
-    # Em um app real, poderíamos decidir parar a inicialização aqui
-    pass
\ No newline at end of file
+def get_minio_client() -> Minio:
+    """Cliente do MinIO; enquanto os buckets não estão garantidos, tenta criá-los (no máximo a cada 30s)."""
+    global _client, _retry_at
+    if _buckets_ready:
+        return _client
+    if time.monotonic() >= _retry_at:
+        try:
+            return ensure_buckets()
+        except Exception as e:
+            logger.error("Erro ao conectar com o MinIO ou criar bucket: %s", e)
+            # Com o MinIO fora do ar, não repete a verificação (e os retries) em toda chamada
+            _retry_at = time.monotonic() + BUCKET_RETRY_SECONDS
+    with _lock:
+        if _client is None:
+            _client = _create_client()
+        return _client
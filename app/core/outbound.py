@@ -0,0 +1,374 @@
+"""
+Camada comum para chamadas a provedores externos (ElevenLabs, Ollama, Gemini).
+
+Cada backend tem: pool de conexões keep-alive, timeouts próprios, limite de
+chamadas simultâneas (bulkhead), retry com backoff exponencial e jitter,
+circuit breaker e contadores de latência/erros.
+
+Ajustes por variável de ambiente, com o nome do backend como prefixo:
+<BACKEND>_TIMEOUT_SECONDS, <BACKEND>_CONNECT_TIMEOUT_SECONDS,
+<BACKEND>_MAX_CONCURRENCY, <BACKEND>_MAX_RETRIES,
+<BACKEND>_BREAKER_THRESHOLD e <BACKEND>_BREAKER_RESET_SECONDS.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout,
+                         httpx.TransportError)
+except ImportError:
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """O provedor está marcado como degradado; a chamada falha sem sair do processo."""
+
+
+class BulkheadFullError(Exception):
+    """Todas as vagas de concorrência do provedor estão ocupadas."""
+
+
+def _status_of(exc: Exception):
+    # requests.HTTPError, ollama.ResponseError e google.api_core expõem o status de formas diferentes
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code
+    return status
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (CircuitOpenError, BulkheadFullError)):
+        return False
+    if isinstance(exc, _TRANSPORT_ERRORS):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUS
+
+
+def counts_as_failure(exc: Exception) -> bool:
+    """Erros do cliente (400, 401, 404...) mostram que o provedor respondeu: não abrem o circuito."""
+    if is_retryable(exc):
+        return True
+    status = _status_of(exc)
+    return status is None or status >= 500
+
+
+class CircuitBreaker:
+    """Abre após N falhas seguidas; depois do tempo de espera libera uma chamada de teste."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """None se a chamada foi recusada; "trial" para a chamada de teste do half_open, senão "closed"."""
+        with self._lock:
+            if self.state == "closed":
+                return "closed"
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return "trial"
+            return None
+
+    def retry_after(self) -> float:
+        """Segundos até o circuito aberto liberar a chamada de teste (0 se já aceita chamadas)."""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def release_trial(self):
+        """A chamada de teste terminou sem resultado (cancelada, erro do cliente): libera outra."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class OutboundBackend:
+    def __init__(self, name: str, timeout: float, connect_timeout: float = 3.05, max_concurrency: int = 16,
+                 max_retries: int = 2, backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 breaker_threshold: int = 5, breaker_reset_seconds: float = 30.0, acquire_timeout: float = 1.0):
+        self.name = name
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.acquire_timeout = acquire_timeout
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+
+        # Sessão com pool keep-alive do tamanho do bulkhead
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._bulkhead = threading.BoundedSemaphore(max_concurrency)
+        self._async_bulkhead = None
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "retries": 0, "rejected": 0, "in_flight": 0,
+                      "latency_total_ms": 0.0, "latency_max_ms": 0.0}
+
+    # --- Contadores ---
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _record_latency(self, seconds: float):
+        ms = seconds * 1000
+        with self._stats_lock:
+            self.stats["latency_total_ms"] += ms
+            self.stats["latency_max_ms"] = max(self.stats["latency_max_ms"], ms)
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            data = dict(self.stats)
+        data["latency_avg_ms"] = round(data["latency_total_ms"] / data["calls"], 1) if data["calls"] else 0.0
+        data["latency_total_ms"] = round(data["latency_total_ms"], 1)
+        data["latency_max_ms"] = round(data["latency_max_ms"], 1)
+        data["circuit"] = self.breaker.state
+        return data
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: espalha as novas tentativas para não sincronizar rajadas
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_breaker(self) -> str:
+        permit = self.breaker.allow()
+        if permit is None:
+            self._count("rejected")
+            raise CircuitOpenError(f"Circuito aberto para '{self.name}', chamada recusada.")
+        return permit
+
+    def _record_error(self, exc: Exception) -> bool:
+        if counts_as_failure(exc):
+            self.breaker.record_failure()
+            return True
+        return False
+
+    # --- Chamadas ---
+
+    def _acquire(self) -> str:
+        # A vaga vem antes do circuito: uma recusa do bulkhead não consome a chamada de teste
+        if not self._bulkhead.acquire(timeout=self.acquire_timeout):
+            self._count("rejected")
+            raise BulkheadFullError(f"Limite de concorrência atingido para '{self.name}'.")
+        try:
+            permit = self._check_breaker()
+        except CircuitOpenError:
+            self._bulkhead.release()
+            raise
+        self._count("in_flight")
+        return permit
+
+    def _release(self, permit: str, recorded: bool):
+        if permit == "trial" and not recorded:
+            self.breaker.release_trial()
+        self._count("in_flight", -1)
+        self._bulkhead.release()
+
+    def _attempts(self, fn, *args, **kwargs):
+        """Executa `fn` com retry; o resultado final (sucesso/falha) fica com quem chamou."""
+        attempt = 0
+        while True:
+            self._count("calls")
+            started_at = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._record_latency(time.perf_counter() - started_at)
+                self._count("errors")
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._record_latency(time.perf_counter() - started_at)
+            return result
+
+    def call(self, fn, *args, **kwargs):
+        """Executa `fn` (bloqueante) com bulkhead, retry e circuit breaker."""
+        permit = self._acquire()
+        recorded = False
+        try:
+            try:
+                result = self._attempts(fn, *args, **kwargs)
+            except Exception as e:
+                recorded = self._record_error(e)
+                raise
+            self.breaker.record_success()
+            recorded = True
+            return result
+        finally:
+            self._release(permit, recorded)
+
+    async def acall(self, coro_fn, *args, **kwargs):
+        """Versão assíncrona de call() para SDKs com métodos aguardáveis."""
+        if self._async_bulkhead is None:
+            self._async_bulkhead = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(self._async_bulkhead.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._count("rejected")
+            raise BulkheadFullError(f"Limite de concorrência atingido para '{self.name}'.")
+        try:
+            permit = self._check_breaker()
+        except CircuitOpenError:
+            self._async_bulkhead.release()
+            raise
+        self._count("in_flight")
+        recorded = False
+        try:
+            attempt = 0
+            while True:
+                self._count("calls")
+                started_at = time.perf_counter()
+                try:
+                    result = await coro_fn(*args, **kwargs)
+                except Exception as e:
+                    self._record_latency(time.perf_counter() - started_at)
+                    self._count("errors")
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        recorded = self._record_error(e)
+                        raise
+                    self._count("retries")
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                self._record_latency(time.perf_counter() - started_at)
+                self.breaker.record_success()
+                recorded = True
+                return result
+        finally:
+            if permit == "trial" and not recorded:
+                self.breaker.release_trial()
+            self._count("in_flight", -1)
+            self._async_bulkhead.release()
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            # Libera a conexão antes de propagar o erro (importante com stream=True)
+            try:
+                response.raise_for_status()
+            finally:
+                response.close()
+        return response
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Requisição HTTP pela sessão com pool, já com timeout e checagem de status."""
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeout))
+        return self.call(self._send, method, url, **kwargs)
+
+    def stream(self, method: str, url: str, chunk_size: int, **kwargs) -> "StreamedBody":
+        """
+        Requisição com stream=True. Os cabeçalhos chegam aqui (erros viram exceção
+        na hora); a vaga do bulkhead e o resultado no circuit breaker só se
+        resolvem quando o corpo termina de ser lido, falha ou é fechado.
+        """
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeout))
+        permit = self._acquire()
+        try:
+            response = self._attempts(self._send, method, url, stream=True, **kwargs)
+        except Exception as e:
+            self._release(permit, self._record_error(e))
+            raise
+        return StreamedBody(self, response, permit, chunk_size)
+
+
+class StreamedBody:
+    """Corpo de uma resposta em streaming que segura a vaga do provedor até ser consumido ou fechado."""
+
+    def __init__(self, backend: OutboundBackend, response: requests.Response, permit: str, chunk_size: int):
+        self._backend = backend
+        self._response = response
+        self._permit = permit
+        self._chunk_size = chunk_size
+        self._recorded = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._response.iter_content(chunk_size=self._chunk_size):
+                yield chunk
+        except Exception as e:
+            self._backend._count("errors")
+            self._recorded = self._backend._record_error(e)
+            raise
+        else:
+            self._backend.breaker.record_success()
+            self._recorded = True
+        finally:
+            self.close()
+
+    def close(self):
+        """Devolve a vaga; fechar antes do fim (cliente desconectou) não conta como sucesso nem falha."""
+        if self._closed:
+            return
+        self._closed = True
+        self._response.close()
+        self._backend._release(self._permit, self._recorded)
+
+    def __del__(self):
+        self.close()
+
+
+def _env(name: str, key: str, default, cast):
+    return cast(os.getenv(f"{name.upper()}_{key}", default))
+
+
+def _build_backend(name: str, timeout: float, max_concurrency: int, max_retries: int = 2) -> OutboundBackend:
+    return OutboundBackend(
+        name,
+        timeout=_env(name, "TIMEOUT_SECONDS", timeout, float),
+        connect_timeout=_env(name, "CONNECT_TIMEOUT_SECONDS", 3.05, float),
+        max_concurrency=_env(name, "MAX_CONCURRENCY", max_concurrency, int),
+        max_retries=_env(name, "MAX_RETRIES", max_retries, int),
+        breaker_threshold=_env(name, "BREAKER_THRESHOLD", 5, int),
+        breaker_reset_seconds=_env(name, "BREAKER_RESET_SECONDS", 30, float),
+    )
+
+
+elevenlabs_backend = _build_backend("elevenlabs", timeout=30, max_concurrency=8)
+ollama_backend = _build_backend("ollama", timeout=60, max_concurrency=4)
+gemini_backend = _build_backend("gemini", timeout=30, max_concurrency=64)
+
+backends = {backend.name: backend for backend in (elevenlabs_backend, ollama_backend, gemini_backend)}
+
+
+def outbound_stats() -> dict:
+    return {name: backend.snapshot() for name, backend in backends.items()}
@@ -0,0 +1,127 @@
+"""
+Perfil de inicialização e prontidão (readiness) da API.
+
+O boot só importa módulos e registra rotas; banco, MinIO, Gemini, ElevenLabs e
+Whisper são aquecidos em threads de fundo (readiness.warm_in_background). O
+/healthz responde assim que o processo atende; o /readyz só responde 200 quando
+os componentes de READINESS_REQUIRED estão prontos e o processo não está
+encerrando. Cada etapa entra no perfil de startup exposto pelo /readyz.
+"""
+import logging
+import threading
+import time
+from typing import Callable
+
+from app.core.config import READINESS_REQUIRED
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima entre novas tentativas de aquecer um componente que falhou
+MAX_RETRY_SECONDS = 60.0
+
+# Estados que liberam o tráfego: "lazy" é um componente sem aquecimento (carrega no primeiro uso)
+READY_STATES = ("ready", "lazy")
+
+
+class StartupProfile:
+    """Duração de cada etapa do boot; `at_ms` é o instante de término desde o import deste módulo."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._last_mark = self.started_at
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def _store(self, phase: str, seconds: float):
+        self._phases[phase] = {"ms": round(seconds * 1000, 1),
+                               "at_ms": round((time.perf_counter() - self.started_at) * 1000, 1)}
+
+    def mark(self, phase: str):
+        """Fecha uma etapa sequencial do boot (tempo desde a marca anterior)."""
+        with self._lock:
+            now = time.perf_counter()
+            self._store(phase, now - self._last_mark)
+            self._last_mark = now
+
+    def record(self, phase: str, seconds: float):
+        """Etapa medida por fora (ex.: aquecimento em segundo plano)."""
+        with self._lock:
+            self._store(phase, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {phase: dict(data) for phase, data in self._phases.items()}
+
+
+class Readiness:
+    def __init__(self, required):
+        self.required = list(required)
+        self.draining = False
+        self._components = {}
+        self._became_ready = False
+        self._lock = threading.Lock()
+
+    def _set(self, name: str, **fields):
+        with self._lock:
+            self._components.setdefault(name, {"state": "pending", "attempts": 0}).update(fields)
+            if not self._became_ready and self._all_required_ready():
+                self._became_ready = True
+                startup_profile.record("ready", time.perf_counter() - startup_profile.started_at)
+                logger.info("Aplicação pronta para receber tráfego.")
+
+    def _all_required_ready(self) -> bool:
+        return all(self._components.get(name, {}).get("state") in READY_STATES for name in self.required)
+
+    def warm_in_background(self, name: str, warmup: Callable, retry: bool = True):
+        """
+        Roda `warmup` numa thread daemon. Retornar False marca o componente como
+        "lazy"; exceção marca "failed" e, com `retry`, tenta de novo com backoff.
+        """
+        self._set(name, state="warming")
+        threading.Thread(target=self._warm, args=(name, warmup, retry), name=f"warmup-{name}", daemon=True).start()
+
+    def _warm(self, name: str, warmup: Callable, retry: bool):
+        delay = 1.0
+        attempts = 0
+        while True:
+            attempts += 1
+            started_at = time.perf_counter()
+            try:
+                result = warmup()
+            except Exception as e:
+                self._set(name, state="failed", attempts=attempts, error=str(e))
+                if not retry:
+                    logger.error("Componente '%s' indisponível: %s", name, e)
+                    return
+                logger.warning("Falha ao aquecer '%s' (tentativa %s): %s; nova tentativa em %.0fs",
+                               name, attempts, e, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+                continue
+            seconds = time.perf_counter() - started_at
+            startup_profile.record(f"warmup:{name}", seconds)
+            self._set(name, state="lazy" if result is False else "ready", attempts=attempts, error=None,
+                      warmup_ms=round(seconds * 1000, 1))
+            logger.info("Componente '%s' pronto em %.1fs.", name, seconds)
+            return
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return not self.draining and self._all_required_ready()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            components = {name: dict(data) for name, data in self._components.items()}
+        for name in self.required:
+            components.setdefault(name, {"state": "unknown"})
+        return {
+            "ready": self.is_ready(),
+            "draining": self.draining,
+            "required": self.required,
+            "components": components,
+            "startup": startup_profile.snapshot(),
+        }
+
+
+startup_profile = StartupProfile()
+readiness = Readiness(READINESS_REQUIRED)
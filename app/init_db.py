@@ -0,0 +1,57 @@
+"""
+Criação das tabelas e carga inicial (corretores).
+
+Uso: `python -m app.init_db`, uma vez por deploy antes de subir a API e o worker
+(no docker-compose, o serviço `db-init`). A API só faz isso sozinha com
+DB_INIT_ON_STARTUP=true.
+"""
+import logging
+import time
+
+from app.core.logging_setup import setup_logging
+
+setup_logging()
+
+from app.core.database import engine, Base, SessionLocal
+from app.models import lead, followup, broker, conversation, job, processed_message
+from app.models.broker import Broker as BrokerModel
+
+logger = logging.getLogger(__name__)
+
+
+def create_initial_data():
+    """Cria dados iniciais (ex: corretores) se o banco estiver vazio."""
+    db = SessionLocal()
+    try:
+        # Verifica se já existem corretores para não duplicar
+        if db.query(BrokerModel).count() == 0:
+            logger.info("Criando dados iniciais de corretores...")
+            brokers = [
+                BrokerModel(name="Carlos Mendes", email="carlos.mendes@auroraprime.com",
+                            specialty_region="Balneário Camboriú"),
+                BrokerModel(name="Juliana Paiva", email="juliana.paiva@auroraprime.com",
+                            specialty_region="Florianópolis"),
+                BrokerModel(name="Marcos Andrade", email="marcos.andrade@auroraprime.com", specialty_region="Itapema")
+            ]
+            db.add_all(brokers)
+            db.commit()
+            logger.info("Dados iniciais criados.")
+    finally:
+        db.close()
+
+
+def init_database():
+    """Cria as tabelas que faltam e a carga inicial; pode rodar várias vezes."""
+    logger.info("Criando tabelas no banco de dados...")
+    Base.metadata.create_all(bind=engine)
+    create_initial_data()
+
+
+def main():
+    started_at = time.perf_counter()
+    init_database()
+    logger.info("Banco inicializado em %.1fs.", time.perf_counter() - started_at)
+
+
+if __name__ == "__main__":
+    main()
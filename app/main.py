@@ -1,76 +1,93 @@
+import logging
+import threading
 from fastapi import FastAPI
+from app.core.logging_setup import setup_logging
+
+# Logging configurado antes dos demais módulos, que já registram mensagens ao importar
+setup_logging()
+
+# Perfil de startup: o relógio começa aqui, antes dos imports pesados
+from app.core.startup import startup_profile, readiness
 from contextlib import asynccontextmanager
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from app.core.database import engine, Base, SessionLocal
-from app.models import lead, followup, broker, conversation
-from app.api import lead_routes, webhook_routes
-from app.services.followup_service import process_pending_followups
-from app.models.broker import Broker as BrokerModel
+from app.core.database import SessionLocal
+from app.models import lead, followup, broker, conversation, job, processed_message
+from app.api import lead_routes, webhook_routes, ops_routes, nlu_routes
+from app.services.conversation_cache import history_writer
+from app.core.config import SCHEDULER_MODE, TTS_PREWARM_ENABLED, WHISPER_WARMUP, DB_INIT_ON_STARTUP
+from app.core.minio_client import ensure_buckets
+from app.init_db import init_database
+from app.services import media_service
+from app.services.conversation_service import get_gemini_models
+from app.services.followup_service import FOLLOW_UP_CADENCE
+from app.services.transcription_service import transcription_pool
+from app.services.job_service import job_executor
+from app.services import rule_extractor
+from app.scheduler import start_scheduler, stop_scheduler
+from app.core.metrics import MetricsMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 
-# --- Lógica de Inicialização ---
-
-def create_initial_data():
-    """Cria dados iniciais (ex: corretores) se o banco estiver vazio."""
-    db = SessionLocal()
-    try:
-        # Verifica se já existem corretores para não duplicar
-        if db.query(BrokerModel).count() == 0:
-            print("Criando dados iniciais de corretores...")
-            brokers = [
-                BrokerModel(name="Carlos Mendes", email="carlos.mendes@auroraprime.com",
-                            specialty_region="Balneário Camboriú"),
-                BrokerModel(name="Juliana Paiva", email="juliana.paiva@auroraprime.com",
-                            specialty_region="Florianópolis"),
-                BrokerModel(name="Marcos Andrade", email="marcos.andrade@auroraprime.com", specialty_region="Itapema")
-            ]
-            db.add_all(brokers)
-            db.commit()
-            print("Dados iniciais criados.")
-    finally:
-        db.close()
+logger = logging.getLogger(__name__)
 
+# --- Lógica de Inicialização ---
 
-def check_followups_job():
-    """Função que o agendador executará para processar os follow-ups."""
+def prepare_database():
+    """Cria tabelas e dados iniciais (se configurado) e carrega o que a API lê do banco no boot."""
+    if DB_INIT_ON_STARTUP:
+        init_database()
     db = SessionLocal()
     try:
-        print("Scheduler rodando: Verificando follow-ups pendentes...")
-        process_pending_followups(db)
+        # As regiões dos corretores entram no gazetteer do extrator por regras
+        rule_extractor.load_regions_from_db(db)
     finally:
         db.close()
 
 
-# Cria o agendador
-scheduler = AsyncIOScheduler()
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gerencia o ciclo de vida da aplicação (iniciar e parar)."""
-    # Cria as tabelas do banco de dados na inicialização
-    print("Criando tabelas no banco de dados...")
-    Base.metadata.create_all(bind=engine)
-
-    # Adiciona dados iniciais se necessário
-    create_initial_data()
-
-    # Adiciona a tarefa ao scheduler para rodar a cada minuto
-    scheduler.add_job(
-        check_followups_job,
-        trigger=IntervalTrigger(minutes=1),
-        id="check_followups_job",
-        replace_existing=True,
-    )
-    scheduler.start()
-
-    print("Aplicação iniciada com sucesso.")
+    # Inicia o agendador; com vários workers só o líder eleito executa os jobs
+    if SCHEDULER_MODE != "off":
+        start_scheduler()
+
+    # Inicia a gravação em lote do histórico de conversas
+    history_writer.start()
+
+    # Nada abaixo bloqueia o boot: banco, provedores e modelos aquecem em segundo
+    # plano e o /readyz só libera o tráfego quando os obrigatórios estão prontos
+    readiness.warm_in_background("database", prepare_database)
+    readiness.warm_in_background("minio", ensure_buckets)
+    readiness.warm_in_background("gemini", get_gemini_models, retry=False)
+    readiness.warm_in_background("elevenlabs", media_service.check_elevenlabs, retry=False)
+    # Sobe os workers de transcrição e carrega o modelo Whisper
+    readiness.warm_in_background("whisper", lambda: media_service.warmup_transcription(WHISPER_WARMUP))
+
+    # Pré-aquece o cache de TTS com as mensagens fixas de follow-up, sem travar o boot
+    if TTS_PREWARM_ENABLED:
+        threading.Thread(
+            target=media_service.prewarm_speech_cache,
+            args=(list(FOLLOW_UP_CADENCE.values()),),
+            name="tts-prewarm",
+            daemon=True,
+        ).start()
+
+    startup_profile.mark("lifespan")
+    logger.info("Aplicação iniciada com sucesso; aquecendo componentes em segundo plano.")
     yield
 
+    # O /readyz passa a responder 503 para o balanceador parar de mandar tráfego
+    readiness.draining = True
+
     # Desliga o scheduler ao encerrar a aplicação
-    scheduler.shutdown()
-    print("Aplicação encerrada.")
+    await stop_scheduler()
+
+    # Persiste as mensagens que ainda estão na fila antes de sair
+    history_writer.stop()
+
+    # Deixa os jobs em execução terminarem antes de derrubar o pool de transcrição; os
+    # que ainda estavam na fila viram "failed" e têm o arquivo temporário apagado
+    job_executor.shutdown(wait=True, cancel_futures=True)
+    transcription_pool.shutdown()
+    logger.info("Aplicação encerrada.")
 
 
 # --- Criação da Aplicação FastAPI ---
@@ -90,12 +107,20 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos os cabeçalhos
 )
 
+# Latência por rota para o /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Inclui os roteadores da nossa API
 app.include_router(lead_routes.router)
 app.include_router(webhook_routes.router)
+app.include_router(ops_routes.router)
+app.include_router(nlu_routes.router)
 
 
 @app.get("/", tags=["Root"])
 def read_root():
     """Endpoint raiz para verificar se a API está no ar."""
-    return {"status": "ok", "message": "Bem-vindo à API do SDR Virtual da Aurora Prime!"}
\ No newline at end of file
+    return {"status": "ok", "message": "Bem-vindo à API do SDR Virtual da Aurora Prime!"}
+
+
+startup_profile.mark("imports")
@@ -7,7 +7,7 @@ class ConversationHistory(Base):
     __tablename__ = "conversation_history"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    lead_id: Mapped[int] = mapped_column(ForeignKey("leads.id"))
+    lead_id: Mapped[int] = mapped_column(ForeignKey("leads.id"), index=True)
     role: Mapped[str] = mapped_column(String)  # 'user' ou 'assistant'
     content: Mapped[str] = mapped_column(Text)
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
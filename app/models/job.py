@@ -0,0 +1,20 @@
+from sqlalchemy import String, Text, DateTime, JSON, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+from datetime import datetime
+
+
+class Job(Base):
+    """Processamento em segundo plano (ex.: pipeline de áudio) acompanhado por polling."""
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    kind: Mapped[str] = mapped_column(String)
+    status: Mapped[str] = mapped_column(String, default="queued")  # queued, running, completed, failed
+    stage: Mapped[str] = mapped_column(String, nullable=True)
+    stage_timings: Mapped[dict] = mapped_column(JSON, default=dict)  # etapa -> duração em ms
+    result: Mapped[dict] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
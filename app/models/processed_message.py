@@ -0,0 +1,18 @@
+from sqlalchemy import String, Text, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+from datetime import datetime
+
+
+class ProcessedMessage(Base):
+    """Mensagem recebida pelo webhook (id do WhatsApp/Evolution), para descartar reentregas."""
+    __tablename__ = "processed_messages"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    message_id: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    phone_number: Mapped[str] = mapped_column(String, index=True)
+    status: Mapped[str] = mapped_column(String, default="processing")  # processing, done
+    response: Mapped[str] = mapped_column(Text, nullable=True)
+
+    claimed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    completed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+from app.core.config import FOLLOWUP_DISPATCH_CONCURRENCY, SCHEDULER_LOCK_KEY
+from app.core.database import leader_engine, SessionLocal
+from app.core.leader import AdvisoryLockLeader
+from app.services.followup_service import process_pending_followups
+from app.services.message_dedup import purge_processed_messages
+
+logger = logging.getLogger(__name__)
+
+# Cria o agendador e o eleitor de líder (um por processo)
+scheduler = AsyncIOScheduler()
+leader = AdvisoryLockLeader(leader_engine, SCHEDULER_LOCK_KEY)
+
+
+def run_followup_dispatch() -> int:
+    """Drena os follow-ups vencidos com uma sessão própria (roda fora do event loop)."""
+    db = SessionLocal()
+    try:
+        return process_pending_followups(db)
+    finally:
+        db.close()
+
+
+async def check_followups_job():
+    """Função que o agendador executará para processar os follow-ups."""
+    # Só o líder executa; os demais processos apenas tentam assumir a liderança
+    if not await asyncio.to_thread(leader.ensure):
+        return
+
+    logger.debug("Scheduler rodando: verificando follow-ups pendentes...")
+    # O trabalho é síncrono e vai para threads; as drenagens paralelas não se
+    # atropelam graças ao FOR UPDATE SKIP LOCKED
+    results = await asyncio.gather(*[
+        asyncio.to_thread(run_followup_dispatch) for _ in range(FOLLOWUP_DISPATCH_CONCURRENCY)
+    ])
+    if sum(results):
+        logger.info("Follow-ups enviados nesta execução: %s", sum(results))
+
+
+def run_processed_messages_purge() -> int:
+    db = SessionLocal()
+    try:
+        return purge_processed_messages(db)
+    finally:
+        db.close()
+
+
+async def purge_processed_messages_job():
+    """Apaga os registros de deduplicação do webhook que já passaram da retenção."""
+    if not await asyncio.to_thread(leader.ensure):
+        return
+    removed = await asyncio.to_thread(run_processed_messages_purge)
+    if removed:
+        logger.info("Registros de mensagens processadas removidos: %s", removed)
+
+
+def start_scheduler():
+    """Registra os jobs e inicia o agendador no event loop atual."""
+    # Adiciona a tarefa ao scheduler para rodar a cada minuto
+    scheduler.add_job(
+        check_followups_job,
+        trigger=IntervalTrigger(minutes=1),
+        id="check_followups_job",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        purge_processed_messages_job,
+        trigger=IntervalTrigger(hours=1),
+        id="purge_processed_messages_job",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.start()
+
+
+async def stop_scheduler():
+    """Desliga o agendador e devolve a liderança para outro processo assumir."""
+    if scheduler.running:
+        scheduler.shutdown()
+    await asyncio.to_thread(leader.release)
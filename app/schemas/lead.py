@@ -1,7 +1,7 @@
 from .broker import Broker as BrokerSchema
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 # Schema base com todos os campos que podem ser fornecidos
 class LeadBase(BaseModel):
@@ -35,6 +35,33 @@ class LeadUpdate(BaseModel):
     status: Optional[str] = None
     intent_level: Optional[str] = None
 
+# Linha de uma importação em massa (CSV/NDJSON): telefone + campos de qualificação
+class LeadImportRow(BaseModel):
+    phone_number: str
+    location: Optional[str] = None
+    property_type: Optional[str] = None
+    bedrooms: Optional[int] = None
+    parking_spots: Optional[int] = None
+    min_area_sqm: Optional[int] = None
+    investment_range: Optional[str] = None
+    move_in_deadline: Optional[str] = None
+    payment_method: Optional[str] = None
+
+# Resultado da importação em massa
+class LeadImportError(BaseModel):
+    row: int
+    phone_number: Optional[str] = None
+    error: str
+
+class LeadImportResult(BaseModel):
+    processed: int
+    created: int
+    updated: int
+    failed: int
+    followups_scheduled: int
+    elapsed_ms: float
+    errors: List[LeadImportError]
+
 # Schema para leitura (o que a API retorna)
 class Lead(LeadBase):
     id: int
@@ -44,4 +71,9 @@ class Lead(LeadBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Página da listagem de leads (paginação por cursor)
+class LeadPage(BaseModel):
+    items: List[Lead]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from .lead import LeadUpdate
+
+# Um texto a analisar, com os dados que o lead já tem (opcional)
+class NLUBatchItem(BaseModel):
+    text: str
+    current_data: Optional[Dict[str, Any]] = None
+
+class NLUBatchRequest(BaseModel):
+    items: List[NLUBatchItem]
+
+# Resultados na mesma ordem dos itens enviados; `errors` (índice -> motivo) lista os
+# itens em que o Ollama falhou e que trazem só os campos das regras
+class NLUBatchResponse(BaseModel):
+    results: List[LeadUpdate]
+    total: int
+    unique: int
+    cache_hits: int
+    failed: int = 0
+    errors: Optional[Dict[int, str]] = None
+    elapsed_ms: float
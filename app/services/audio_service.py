@@ -0,0 +1,104 @@
+import os
+import logging
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.lead import Lead
+from app.services import lead_service, media_service, nlu_service
+from app.services.job_service import JobTracker
+from app.services.transcription_service import beam_size_for
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _untracked_stage(name: str):
+    yield
+
+
+def _transcribe_and_extract(db_lead: Lead, temp_audio_path: str, stage, block: bool, decoding: str,
+                            chunked: bool, on_partial):
+    """Transcrição e extração; só lê os campos já carregados do lead, sem usar a sessão."""
+    with stage("transcription"):
+        transcribed_text = media_service.transcribe_audio_local(
+            temp_audio_path, beam_size=beam_size_for(decoding), block=block,
+            chunked=chunked, on_partial=on_partial
+        )
+    logger.debug("Texto transcrito para análise: '%s'", transcribed_text, extra={"lead_id": db_lead.id})
+
+    with stage("extraction"):
+        current_data = {"location": db_lead.location, "property_type": db_lead.property_type,
+                        "bedrooms": db_lead.bedrooms}
+        current_data = {k: v for k, v in current_data.items() if v is not None}
+        extracted_data = nlu_service.extract_lead_info_from_text(transcribed_text, current_data)
+    logger.info("Dados extraídos do áudio: %s", extracted_data.model_dump(exclude_unset=True),
+                extra={"lead_id": db_lead.id})
+    return transcribed_text, extracted_data
+
+
+def analyze_audio(db: Session, db_lead: Lead, temp_audio_path: str, stage=_untracked_stage,
+                  block: bool = False, decoding: str = None, chunked: bool = False, on_partial=None) -> dict:
+    """
+    Etapas comuns aos modos síncrono e de job: transcrição, extração e atualização do lead.
+    `stage` recebe o nome de cada etapa (usado pelo job para registrar progresso e tempos).
+    `decoding` ("beam" ou "greedy") e `chunked` controlam a transcrição de áudios longos.
+    """
+    transcribed_text, extracted_data = _transcribe_and_extract(db_lead, temp_audio_path, stage, block,
+                                                               decoding, chunked, on_partial)
+    updated_fields = extracted_data.model_dump(exclude_unset=True)
+    if updated_fields:
+        with stage("lead_update"):
+            lead_service.update_lead(db=db, db_lead=db_lead, lead_update=extracted_data)
+
+    return {"transcribed_text": transcribed_text, "updated_fields": updated_fields}
+
+
+def run_audio_job(job_id: str, phone_number: str, object_name: str, temp_audio_path: str, content_type: str,
+                  decoding: str = None, chunked: bool = False):
+    """
+    Pipeline completo em segundo plano: upload, transcrição, extração e atualização.
+    Nenhuma conexão fica presa durante o Whisper: o lead é lido numa sessão curta e
+    a atualização é gravada em outra.
+    """
+    tracker = JobTracker(job_id)
+    try:
+        tracker.start()
+        with tracker.stage("upload"):
+            media_service.upload_audio_file_to_storage(temp_audio_path, object_name, content_type)
+
+        with SessionLocal() as db:
+            db_lead = lead_service.get_lead_by_phone(db, phone_number=phone_number)
+        if db_lead is None:
+            raise ValueError("Lead não encontrado")
+
+        # Transcrição por trechos publica o texto parcial no job conforme os trechos terminam
+        def publish_partial(chunks_done: int, chunks_total: int, partial_text: str):
+            tracker.partial({"partial_transcript": partial_text, "chunks_done": chunks_done,
+                             "chunks_total": chunks_total})
+
+        # Em segundo plano o job espera vaga na fila de transcrição em vez de receber 429
+        transcribed_text, extracted_data = _transcribe_and_extract(
+            db_lead, temp_audio_path, tracker.stage, block=True, decoding=decoding, chunked=chunked,
+            on_partial=publish_partial
+        )
+        updated_fields = extracted_data.model_dump(exclude_unset=True)
+        if updated_fields:
+            with tracker.stage("lead_update"), SessionLocal() as db:
+                db_lead = db.get(Lead, db_lead.id)
+                if db_lead is None:
+                    raise ValueError("Lead não encontrado")
+                lead_service.update_lead(db=db, db_lead=db_lead, lead_update=extracted_data)
+                db.commit()
+        tracker.complete({
+            "message": "Áudio processado e lead atualizado.",
+            "storage_path": object_name,
+            "transcribed_text": transcribed_text,
+            "updated_fields": updated_fields,
+        })
+    except Exception as e:
+        logger.exception("Erro no job de áudio %s: %s", job_id, e, extra={"job_id": job_id})
+        tracker.fail(str(e))
+    finally:
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
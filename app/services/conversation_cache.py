@@ -0,0 +1,346 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    CONVERSATION_WINDOW_SIZE, CONVERSATION_CACHE_MAX_LEADS, CONVERSATION_WINDOW_TTL_SECONDS,
+    HISTORY_FLUSH_INTERVAL_SECONDS, HISTORY_FLUSH_BATCH_SIZE, HISTORY_FLUSH_MAX_ATTEMPTS, HISTORY_MAX_PENDING,
+)
+from app.core.database import SessionLocal
+from app.models.conversation import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryEntry(NamedTuple):
+    lead_id: int
+    role: str
+    content: str
+    timestamp: datetime
+
+
+class _Window:
+    __slots__ = ("entries", "stored", "unstored", "expires_at")
+
+    def __init__(self, entries: deque, stored: int, unstored: int, expires_at: float):
+        self.entries = entries
+        self.stored = stored        # mensagens do lead já gravadas no banco
+        self.unstored = unstored    # registradas neste processo e ainda não gravadas
+        self.expires_at = expires_at
+
+
+class ConversationWindowCache:
+    """
+    Mantém as últimas N mensagens de cada lead em um ring buffer (deque).
+    Entre leads, o despejo é LRU para limitar o uso de memória.
+
+    Cada janela guarda também o total de mensagens do lead, mantido sem ir ao
+    banco: `append` soma as mensagens novas e o write-behind as passa para
+    "gravadas" (ou as desconta, se forem descartadas). O count(*) só roda quando
+    a janela é carregada. Com vários workers, outro processo pode ter atendido o
+    lead: a janela expira após `ttl` segundos e é relida do banco.
+    """
+
+    def __init__(self, window_size: int, max_leads: int, ttl: float = CONVERSATION_WINDOW_TTL_SECONDS):
+        self.window_size = window_size
+        self.max_leads = max_leads
+        self.ttl = ttl
+        self._windows: "OrderedDict[int, _Window]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    def _live(self, lead_id: int) -> Optional[_Window]:
+        window = self._windows.get(lead_id)
+        if window is not None and window.expires_at <= time.monotonic():
+            del self._windows[lead_id]
+            self.stats["expired"] += 1
+            return None
+        return window
+
+    def get(self, lead_id: int) -> Optional[tuple]:
+        """(mensagens da janela, total de mensagens do lead), ou None se ela precisa ser carregada."""
+        with self._lock:
+            window = self._live(lead_id)
+            if window is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._windows.move_to_end(lead_id)
+            return list(window.entries), window.stored + window.unstored
+
+    def load(self, lead_id: int, entries: list, stored: Optional[int] = None, unstored: int = 0):
+        with self._lock:
+            stored = len(entries) - unstored if stored is None else stored
+            self._windows[lead_id] = _Window(deque(entries, maxlen=self.window_size), stored, unstored,
+                                             time.monotonic() + self.ttl)
+            self._windows.move_to_end(lead_id)
+            while len(self._windows) > self.max_leads:
+                self._windows.popitem(last=False)
+
+    def discard(self, *lead_ids: int):
+        with self._lock:
+            for lead_id in lead_ids:
+                self._windows.pop(lead_id, None)
+
+    def append(self, entry: HistoryEntry):
+        # Só atualiza janelas já carregadas; leads frios são reidratados na leitura
+        with self._lock:
+            window = self._live(entry.lead_id)
+            if window is not None:
+                window.entries.append(entry)
+                window.unstored += 1
+                self._windows.move_to_end(entry.lead_id)
+
+    def mark_stored(self, entries: list, stored: bool = True):
+        """Chamado pelo write-behind: as mensagens foram gravadas (ou descartadas, com stored=False)."""
+        with self._lock:
+            for entry in entries:
+                window = self._windows.get(entry.lead_id)
+                if window is None or window.unstored <= 0:
+                    continue
+                window.unstored -= 1
+                if stored:
+                    window.stored += 1
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class HistoryWriteBehind:
+    """
+    Acumula as inserções de histórico e as grava em lote numa thread de fundo.
+    Uma mensagem só sai da fila depois do commit do lote, então nada que já
+    foi confirmado por flush() se perde; no desligamento a fila é esvaziada.
+    Um lote que falha `max_attempts` vezes seguidas é gravado linha a linha: as
+    linhas que o banco rejeita (FK, tamanho) vão para o log de descarte e não
+    travam as demais. A fila tem limite (`max_pending`) para não crescer sem fim.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_attempts: int = 3, max_pending: int = 50000):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.max_pending = max_pending
+        self._pending: list = []
+        self._failed_attempts = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"written": 0, "failed_batches": 0, "dead_lettered": 0, "dropped": 0}
+
+    def enqueue(self, entry: HistoryEntry) -> bool:
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                dropped = self.stats["dropped"]
+            else:
+                dropped = 0
+                self._pending.append(entry)
+            should_wake = len(self._pending) >= self.batch_size
+        if should_wake:
+            self._wake.set()
+        if dropped:
+            window_cache.mark_stored([entry], stored=False)
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.error("Fila do histórico cheia (%s mensagens): %s mensagem(ns) descartada(s) até agora.",
+                             self.max_pending, dropped, extra={"lead_id": entry.lead_id})
+            return False
+        return True
+
+    def pending_for(self, lead_id: int) -> list:
+        with self._lock:
+            return [entry for entry in self._pending if entry.lead_id == lead_id]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "pending": len(self._pending), "max_pending": self.max_pending,
+                    "failed_attempts": self._failed_attempts}
+
+    @staticmethod
+    def _row(entry: HistoryEntry) -> dict:
+        return {"lead_id": entry.lead_id, "role": entry.role, "content": entry.content, "timestamp": entry.timestamp}
+
+    def flush(self) -> int:
+        """Grava tudo o que está pendente, em lotes de batch_size. Retorna o número de mensagens persistidas."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                if not batch:
+                    return written
+                if self._failed_attempts >= self.max_attempts:
+                    processed, count = self._insert_rows(batch)
+                else:
+                    processed, count = self._insert_batch(batch)
+                written += count
+                # Apenas o flush remove itens, e novos itens só entram no fim da fila
+                with self._lock:
+                    del self._pending[:processed]
+                    self.stats["written"] += count
+
+                if processed < len(batch):
+                    return written
+
+    def _insert_batch(self, batch: list) -> tuple:
+        db = SessionLocal()
+        try:
+            db.execute(insert(ConversationHistory), [self._row(e) for e in batch])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._failed_attempts += 1
+            self.stats["failed_batches"] += 1
+            logger.error("Erro ao gravar lote de histórico (%s mensagens, tentativa %s), nova tentativa em breve: %s",
+                         len(batch), self._failed_attempts, e)
+            return 0, 0
+        finally:
+            db.close()
+        self._failed_attempts = 0
+        window_cache.mark_stored(batch)
+        return len(batch), len(batch)
+
+    def _insert_rows(self, batch: list) -> tuple:
+        """
+        Grava linha a linha. Linhas rejeitadas pelo banco são descartadas (com os
+        dados no log); outros erros (ex.: banco fora do ar) interrompem e o resto
+        fica na fila. Retorna (linhas resolvidas, linhas gravadas).
+        """
+        processed = written = 0
+        for entry in batch:
+            db = SessionLocal()
+            try:
+                db.execute(insert(ConversationHistory), [self._row(entry)])
+                db.commit()
+                window_cache.mark_stored([entry])
+                written += 1
+            except (IntegrityError, DataError) as e:
+                db.rollback()
+                self.stats["dead_lettered"] += 1
+                window_cache.mark_stored([entry], stored=False)
+                logger.error("Mensagem de histórico descartada (lead %s, %s): %s", entry.lead_id, entry.role, e,
+                             extra={"lead_id": entry.lead_id,
+                                    "dead_letter": {**self._row(entry), "timestamp": entry.timestamp.isoformat()}})
+            except Exception as e:
+                db.rollback()
+                logger.error("Erro ao gravar histórico linha a linha, nova tentativa em breve: %s", e)
+                break
+            finally:
+                db.close()
+            processed += 1
+        if processed == len(batch):
+            self._failed_attempts = 0
+        return processed, written
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="history-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        # Garante que o que restou na fila seja persistido antes de encerrar
+        self.flush()
+
+
+window_cache = ConversationWindowCache(CONVERSATION_WINDOW_SIZE, CONVERSATION_CACHE_MAX_LEADS)
+history_writer = HistoryWriteBehind(HISTORY_FLUSH_INTERVAL_SECONDS, HISTORY_FLUSH_BATCH_SIZE,
+                                    HISTORY_FLUSH_MAX_ATTEMPTS, HISTORY_MAX_PENDING)
+
+
+def record_message(lead_id: int, role: str, content: str, db=None) -> HistoryEntry:
+    """
+    Registra a mensagem na janela em memória e agenda sua gravação no banco.
+    Com `db`, a mensagem só vai para o write-behind quando a transação da sessão
+    for confirmada: o lead (que pode ter sido criado no próprio turno) já existe
+    e turnos desfeitos não deixam histórico órfão. Aceita Session ou AsyncSession.
+    """
+    entry = HistoryEntry(lead_id, role, content, datetime.now(timezone.utc))
+    window_cache.append(entry)
+    if db is None:
+        history_writer.enqueue(entry)
+    else:
+        # Abre a transação (sem pegar conexão) se o turno ainda não executou SQL: sem ela
+        # um rollback não dispara after_transaction_end e a mensagem sobraria na sessão
+        session = getattr(db, "sync_session", db)
+        if not session.in_transaction():
+            session.begin()
+        db.info.setdefault("pending_history", []).append(entry)
+    return entry
+
+
+def pending_for(lead_id: int, db=None) -> list:
+    """Mensagens do lead ainda não gravadas: na fila do write-behind e na transação de `db`."""
+    entries = history_writer.pending_for(lead_id)
+    if db is not None:
+        entries += [entry for entry in db.info.get("pending_history", ()) if entry.lead_id == lead_id]
+    return entries
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed_history(session):
+    for entry in session.info.pop("pending_history", ()):
+        history_writer.enqueue(entry)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted_history(session, transaction):
+    # Rollback ou sessão fechada sem commit (ex.: cliente do SSE desconectou); o
+    # after_commit já consumiu a lista quando a transação foi confirmada
+    if transaction.parent is not None:
+        return
+    entries = session.info.pop("pending_history", None)
+    if entries:
+        # A janela já tinha as mensagens do turno desfeito: recarrega do banco na próxima leitura
+        window_cache.discard(*{entry.lead_id for entry in entries})
+
+
+def _entry_key(entry) -> tuple:
+    ts = entry.timestamp
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return entry.role, entry.content, ts
+
+
+def count_stored(lead_id: int):
+    """Consulta do total de mensagens do lead já gravadas (só na carga da janela)."""
+    return select(func.count()).select_from(ConversationHistory).where(ConversationHistory.lead_id == lead_id)
+
+
+def rehydrate(lead_id: int, rows: list, pending: list, stored: int) -> tuple:
+    """
+    Monta a janela de um lead frio a partir das linhas do banco (em ordem
+    cronológica) e das mensagens ainda na fila. `pending` deve ser capturado
+    antes da consulta, por isso itens gravados no meio do caminho são deduplicados.
+    `stored` é o total de mensagens do lead no banco. Retorna (janela, total).
+    """
+    entries = [HistoryEntry(lead_id, row.role, row.content, row.timestamp) for row in rows]
+    seen = {_entry_key(entry) for entry in entries}
+    entries.extend(entry for entry in pending if _entry_key(entry) not in seen)
+    entries = entries[-window_cache.window_size:]
+    window_cache.load(lead_id, entries, stored, len(pending))
+    return entries, stored + len(pending)
@@ -1,18 +1,36 @@
+import asyncio
 import os
 import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import google.generativeai as genai
-
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.lead import Lead
 from app.models.conversation import ConversationHistory
 from app.schemas.lead import LeadUpdate
-from app.services import lead_service
+from app.services import lead_service, conversation_cache
+from app.core.config import CONVERSATION_WINDOW_SIZE, CONVERSATION_MODE
+from app.core.outbound import gemini_backend
+from app.core.metrics import observe_stage, record_stage
+from app.services.rule_extractor import rule_extractor, count as count_rule_stat
+from app.services.llm_session import LeadSession, session_cache, token_stats, usage_of
+from app.services.stream_parsing import ResponseTextStreamer
+
+logger = logging.getLogger(__name__)
 
 # --- Configuração do Google Gemini ---
+# O SDK é importado e configurado no primeiro turno (ou no aquecimento do startup):
+# o import leva ~1s e a falta da chave não impede a API de subir.
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("Chave de API do Google não encontrada no arquivo .env")
-genai.configure(api_key=GOOGLE_API_KEY)
+
+# Endpoint alternativo (proxy ou o Gemini falso do bench/). Só o transporte REST
+# aceita um host http qualquer; o SDK não tem cliente assíncrono REST, então nesse
+# modo as chamadas assíncronas rodam o cliente síncrono numa thread.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
 generation_config = {"temperature": 0.7, "top_p": 1, "top_k": 1, "max_output_tokens": 2048}
 safety_settings = [
@@ -22,85 +40,380 @@ safety_settings = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
 
-model = genai.GenerativeModel(model_name="gemini-1.5-flash",
-                              generation_config=generation_config,
-                              safety_settings=safety_settings)
+# Resposta do turno quando o Gemini falha (as regras ainda atualizam o lead)
+FALLBACK_RESPONSE = "Desculpe, estou com um problema técnico no momento."
+
+# Timeout por chamada repassado ao SDK do Gemini
+request_options = {"timeout": gemini_backend.timeout}
+
+# Persona e regras da conversa (usadas pelos dois modos)
+PERSONA = """Sua única e mais importante regra é: VOCÊ DEVE RESPONDER SEMPRE EM PORTUGUÊS DO BRASIL.
+
+Você é Prime, um SDR de elite da imobiliária de alto padrão Aurora Prime. Sua personalidade é sofisticada, empática e extremamente consultiva. Você nunca soa como um robô.
+
+REGRAS DA CONVERSA:
+1. PERSONA: Use uma linguagem fluida e variada. Evite repetir as mesmas frases. Demonstre empatia ("Compreendo perfeitamente...", "Ótima pergunta..."). Se o usuário estiver indeciso, ajude-o a refinar as opções em vez de apenas repetir a pergunta.
+2. UMA PERGUNTA DE CADA VEZ: Mantenha um diálogo natural, nunca faça uma lista de perguntas.
+3. ORDEM LÓGICA: Colete as informações na ordem: 1º location, 2º property_type, 3º bedrooms.
+4. USE A MEMÓRIA: Verifique as "INFORMAÇÕES JÁ COLETADAS". Se uma informação já existe, NÃO pergunte por ela novamente. Confirme-a de forma elegante e passe para a próxima pergunta. Exemplo: "Certo, um terreno em Santa Catarina, excelente! Para esse terreno, estamos pensando em uma construção futura com quantos quartos?"
+5. ENCERRAMENTO: Quando tiver as 3 informações, faça um resumo amigável e se despeça de forma profissional."""
+
+# No modo sessão a persona vai uma vez como system instruction, não dentro de cada prompt
+SESSION_INSTRUCTION = PERSONA + """
+
+FORMATO: cada mensagem do cliente chega junto com as "INFORMAÇÕES JÁ COLETADAS". Responda sempre com um JSON com duas chaves: "update_data" (com as novas informações) e "response_text" (sua resposta humanizada)."""
+
+_models = None
+_models_lock = threading.Lock()
+
+
+def get_gemini_models() -> tuple:
+    """(modelo do modo prompt, modelo do modo sessão), criados na primeira chamada."""
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                if not GOOGLE_API_KEY:
+                    raise ValueError("Chave de API do Google não encontrada no arquivo .env")
+                import google.generativeai as genai
+
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=GOOGLE_API_KEY, transport="rest",
+                                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                model = genai.GenerativeModel(model_name="gemini-1.5-flash",
+                                              generation_config=generation_config,
+                                              safety_settings=safety_settings)
+                session_model = genai.GenerativeModel(model_name="gemini-1.5-flash",
+                                                      generation_config={**generation_config,
+                                                                         "response_mime_type": "application/json"},
+                                                      safety_settings=safety_settings,
+                                                      system_instruction=SESSION_INSTRUCTION)
+                _models = (model, session_model)
+    return _models
 
 
 # ------------------------------------
 
 def add_message_to_history(db: Session, lead_id: int, role: str, content: str):
-    history_entry = ConversationHistory(lead_id=lead_id, role=role, content=content)
-    db.add(history_entry)
-    db.commit()
+    # A janela em memória é atualizada já; a gravação em lote (write-behind) sai após o commit do turno
+    conversation_cache.record_message(lead_id, role, content, db=db)
 
 
-def get_conversation_history(db: Session, lead_id: int) -> str:
-    history = db.query(ConversationHistory).filter(ConversationHistory.lead_id == lead_id).order_by(
-        ConversationHistory.timestamp.desc()).limit(10).all()
-    history.reverse()
-
+def _format_history(history) -> str:
     formatted_history = ""
     for entry in history:
         formatted_history += f"{entry.role.capitalize()}: {entry.content}\n"
     return formatted_history.strip()
 
 
-def process_user_message(db: Session, lead: Lead, user_message: str) -> str:
-    add_message_to_history(db, lead.id, 'user', user_message)
-    history = get_conversation_history(db, lead.id)
+def _history_entries(db: Session, lead_id: int) -> tuple:
+    """(janela de histórico, total de mensagens do lead); só vai ao banco com a janela fria."""
+    cached = conversation_cache.window_cache.get(lead_id)
+    if cached is not None:
+        return cached
+    # As pendentes são lidas antes da contagem e das linhas (a reidratação deduplica)
+    pending = conversation_cache.pending_for(lead_id, db)
+    stored = db.scalar(conversation_cache.count_stored(lead_id))
+    rows = db.query(ConversationHistory).filter(ConversationHistory.lead_id == lead_id).order_by(
+        ConversationHistory.timestamp.desc()).limit(CONVERSATION_WINDOW_SIZE).all()
+    rows.reverse()
+    return conversation_cache.rehydrate(lead_id, rows, pending, stored)
+
+
+def get_conversation_history(db: Session, lead_id: int) -> str:
+    return _format_history(_history_entries(db, lead_id)[0])
 
+
+def _rule_fields(user_message: str) -> dict:
+    """Campos que as regras determinísticas já resolvem na mensagem do usuário."""
+    fields = rule_extractor.extract(user_message).confident_fields()
+    count_rule_stat("messages")
+    count_rule_stat("fields_from_rules", len(fields))
+    count_rule_stat("gemini_fields_prefilled", len(fields))
+    return fields
+
+
+def _collected_data(lead: Lead, extra_data: dict = None) -> dict:
     current_data = {
         "location": lead.location, "property_type": lead.property_type, "bedrooms": lead.bedrooms,
     }
     current_data = {k: v for k, v in current_data.items() if v is not None}
+    # O que as regras extraíram da última mensagem entra como já coletado
+    current_data.update(extra_data or {})
+    return current_data
+
+
+def _build_prompt(lead: Lead, history: str, extra_data: dict = None) -> str:
+    """Modo "prompt": persona, dados e histórico renderizados num único texto a cada turno."""
+    return f"""{PERSONA}
+
+INFORMAÇÕES JÁ COLETADAS:
+{json.dumps(_collected_data(lead, extra_data), ensure_ascii=False)}
+
+HISTÓRICO DA CONVERSA:
+---
+{history}
+---
+
+Baseado em todas as regras, analise a última mensagem do "User" e gere um JSON com duas chaves: "update_data" (com as novas informações) e "response_text" (sua resposta humanizada).
+"""
+
+
+def _build_turn_message(lead: Lead, user_message: str, extra_data: dict = None) -> str:
+    """Modo "sessão": só os dados atuais e a mensagem nova; persona e histórico já estão na sessão."""
+    return (f"INFORMAÇÕES JÁ COLETADAS: {json.dumps(_collected_data(lead, extra_data), ensure_ascii=False)}\n"
+            f"Mensagem do cliente: {user_message}")
+
+
+def _record_usage(mode: str, lead_id: int, usage):
+    if usage is None:
+        return
+    token_stats.record(mode, usage)
+    logger.debug("Tokens do turno (lead %s, modo %s): entrada=%s saída=%s", lead_id, mode,
+                 usage["prompt_tokens"], usage["output_tokens"],
+                 extra={"lead_id": lead_id, "mode": mode, "prompt_tokens": usage["prompt_tokens"],
+                        "output_tokens": usage["output_tokens"]})
+
+
+def _parse_ai_response(response_text: str):
+    """Extrai o JSON da resposta do Gemini e retorna (update_data, response_text)."""
+    start_index = response_text.find('{')
+    end_index = response_text.rfind('}') + 1
+    json_str = response_text[start_index:end_index]
+    response_data = json.loads(json_str)
+
+    update_data = response_data.get("update_data", {})
+    ai_response_text = response_data.get("response_text", "Não entendi, pode repetir?")
+    return update_data, ai_response_text
+
+
+def _with_current_message(lead_id: int, history: list, user_message: str) -> list:
+    # A mensagem do turno só é gravada no fim (fase 3), mas já entra no prompt
+    return history + [conversation_cache.HistoryEntry(lead_id, "user", user_message, datetime.now(timezone.utc))]
+
 
-    # --- PROMPT v2 - FOCO EM HUMANIZAÇÃO E FLUIDEZ ---
-    prompt = f"""
-    Sua única e mais importante regra é: VOCÊ DEVE RESPONDER SEMPRE EM PORTUGUÊS DO BRASIL.
+def _turn_request(db: Session, lead: Lead, user_message: str, rule_fields: dict):
+    """Monta a chamada do turno conforme o modo: (modelo, conteúdo, sessão ou None)."""
+    model, session_model = get_gemini_models()
+    history, messages = _history_entries(db, lead.id)
+    if CONVERSATION_MODE == "session":
+        # A sessão só vale se cobre todas as mensagens do lead (turno desfeito ou janela relida)
+        session = session_cache.get(lead.id, messages)
+        if session is None:
+            session = LeadSession.from_history(lead.id, history, messages)
+            session_cache.put(session)
+        return session_model, session.contents(_build_turn_message(lead, user_message, rule_fields)), session
+    history = _with_current_message(lead.id, history, user_message)
+    return model, _build_prompt(lead, _format_history(history), rule_fields), None
 
-    Você é Prime, um SDR de elite da imobiliária de alto padrão Aurora Prime. Sua personalidade é sofisticada, empática e extremamente consultiva. Você nunca soa como um robô.
 
-    REGRAS DA CONVERSA:
-    1. PERSONA: Use uma linguagem fluida e variada. Evite repetir as mesmas frases. Demonstre empatia ("Compreendo perfeitamente...", "Ótima pergunta..."). Se o usuário estiver indeciso, ajude-o a refinar as opções em vez de apenas repetir a pergunta.
-    2. UMA PERGUNTA DE CADA VEZ: Mantenha um diálogo natural, nunca faça uma lista de perguntas.
-    3. ORDEM LÓGICA: Colete as informações na ordem: 1º location, 2º property_type, 3º bedrooms.
-    4. USE A MEMÓRIA: Verifique as "INFORMAÇÕES JÁ COLETADAS". Se uma informação já existe, NÃO pergunte por ela novamente. Confirme-a de forma elegante e passe para a próxima pergunta. Exemplo: "Certo, um terreno em Santa Catarina, excelente! Para esse terreno, estamos pensando em uma construção futura com quantos quartos?"
-    5. ENCERRAMENTO: Quando tiver as 3 informações, faça um resumo amigável e se despeça de forma profissional.
+def _complete_turn(lead_id: int, user_message: str, session, raw_text: str, usage):
+    """Interpreta a resposta do modelo, registra tokens e guarda o turno na sessão."""
+    update_data, ai_response_text = _parse_ai_response(raw_text)
+    _record_usage(CONVERSATION_MODE, lead_id, usage)
+    if session is not None:
+        session.record_turn(user_message, raw_text, usage)
+    return update_data, ai_response_text
 
-    INFORMAÇÕES JÁ COLETADAS:
-    {json.dumps(current_data, ensure_ascii=False)}
 
-    HISTÓRICO DA CONVERSA:
-    ---
-    {history}
-    ---
+def _merge_updates(lead: Lead, update_data: dict, rule_fields: dict) -> dict:
+    # Uma única atualização: o Gemini lê a frase inteira e prevalece; as regras só
+    # preenchem o que ele deixou vazio (ou tudo, quando a chamada falhou)
+    update_data = dict(update_data)
+    for key, value in rule_fields.items():
+        if update_data.get(key) in (None, ""):
+            update_data[key] = value
+    if update_data:
+        logger.info("Atualizando lead %s com os dados extraídos: %s", lead.id, update_data,
+                    extra={"lead_id": lead.id})
+    return update_data
 
-    Baseado em todas as regras, analise a última mensagem do "User" e gere um JSON com duas chaves: "update_data" (com as novas informações) e "response_text" (sua resposta humanizada).
+
+class PreparedTurn(NamedTuple):
+    """
+    Turno montado na leitura. O turno roda em três fases para não segurar uma
+    conexão do pool durante o LLM: (1) prepare_turn lê lead e histórico numa
+    transação curta, (2) generate_reply chama o Gemini sem sessão do banco e
+    (3) finish_turn grava o lead e o histórico numa nova transação.
     """
+    lead: object            # modelo ou snapshot do cache (só o id e os campos são lidos)
+    user_message: str
+    rule_fields: dict
+    request: Optional[tuple]  # (modelo, conteúdo, sessão); None se não foi possível montar
+
+
+def prepare_turn(db: Session, lead: Lead, user_message: str) -> PreparedTurn:
+    rule_fields = _rule_fields(user_message)
+    try:
+        request = _turn_request(db, lead, user_message, rule_fields)
+    except Exception as e:
+        logger.error("Erro ao montar o turno do lead %s: %s", lead.id, e, extra={"lead_id": lead.id})
+        request = None
+    return PreparedTurn(lead, user_message, rule_fields, request)
+
 
-    ai_response_text = "Desculpe, estou com um problema técnico no momento."
+def generate_reply(turn: PreparedTurn) -> tuple:
+    """Chama o Gemini (sem sessão do banco) e retorna (update_data, resposta)."""
+    if turn.request is None:
+        return {}, FALLBACK_RESPONSE
+    target_model, contents, session = turn.request
     try:
-        convo = model.start_chat(history=[])
-        response = convo.send_message(prompt)
+        # Chamada única, protegida pela camada de saída
+        with observe_stage("gemini_turn"):
+            response = gemini_backend.call(target_model.generate_content, contents, request_options=request_options)
+        return _complete_turn(turn.lead.id, turn.user_message, session, response.text, usage_of(response))
+    except Exception as e:
+        logger.error("Erro ao chamar a API do Gemini: %s", e, extra={"lead_id": turn.lead.id})
+        return {}, FALLBACK_RESPONSE
+
+
+def finish_turn(db: Session, turn: PreparedTurn, update_data: dict, ai_response_text: str) -> dict:
+    """Grava o lead e as duas mensagens do turno (flush); o commit fica com quem abriu a sessão."""
+    lead = turn.lead
+    add_message_to_history(db, lead.id, 'user', turn.user_message)
+    update_data = _merge_updates(lead, update_data, turn.rule_fields)
+    if update_data:
+        try:
+            lead_service.apply_turn_update(db=db, db_lead=lead, lead_update=LeadUpdate(**update_data))
+        except Exception as e:
+            logger.error("Erro ao atualizar o lead %s: %s", lead.id, e, extra={"lead_id": lead.id})
+
+    add_message_to_history(db, lead.id, 'assistant', ai_response_text)
+    return update_data
+
+
+def process_user_message(db: Session, lead: Lead, user_message: str) -> str:
+    """As três fases do turno numa única sessão (para quem já tem uma aberta, ex.: scripts e testes)."""
+    turn = prepare_turn(db, lead, user_message)
+    update_data, ai_response_text = generate_reply(turn)
+    finish_turn(db, turn, update_data, ai_response_text)
+    return ai_response_text
+
+
+# --- Versões assíncronas (turno inteiro sem bloquear o event loop) ---
+
+async def _history_entries_async(db: AsyncSession, lead_id: int) -> tuple:
+    cached = conversation_cache.window_cache.get(lead_id)
+    if cached is not None:
+        return cached
+    pending = conversation_cache.pending_for(lead_id, db)
+    stored = await db.scalar(conversation_cache.count_stored(lead_id))
+    result = await db.execute(
+        select(ConversationHistory).where(ConversationHistory.lead_id == lead_id).order_by(
+            ConversationHistory.timestamp.desc()).limit(CONVERSATION_WINDOW_SIZE))
+    rows = list(result.scalars().all())
+    rows.reverse()
+    return conversation_cache.rehydrate(lead_id, rows, pending, stored)
 
-        response_text = response.text
-        start_index = response_text.find('{')
-        end_index = response_text.rfind('}') + 1
-        json_str = response_text[start_index:end_index]
-        response_data = json.loads(json_str)
 
-        update_data = response_data.get("update_data", {})
-        ai_response_text = response_data.get("response_text", "Não entendi, pode repetir?")
+async def get_conversation_history_async(db: AsyncSession, lead_id: int) -> str:
+    return _format_history((await _history_entries_async(db, lead_id))[0])
 
-        if update_data:
-            print(f"Atualizando lead {lead.id} com os dados do Gemini: {update_data}")
-            lead_update_obj = LeadUpdate(**update_data)
-            lead_service.update_lead(db=db, db_lead=lead, lead_update=lead_update_obj)
 
+async def _turn_request_async(db: AsyncSession, lead: Lead, user_message: str, rule_fields: dict):
+    model, session_model = get_gemini_models()
+    history, messages = await _history_entries_async(db, lead.id)
+    if CONVERSATION_MODE == "session":
+        session = session_cache.get(lead.id, messages)
+        if session is None:
+            session = LeadSession.from_history(lead.id, history, messages)
+            session_cache.put(session)
+        return session_model, session.contents(_build_turn_message(lead, user_message, rule_fields)), session
+    history = _with_current_message(lead.id, history, user_message)
+    return model, _build_prompt(lead, _format_history(history), rule_fields), None
+
+
+async def _generate_async(target_model, contents, **kwargs):
+    if GEMINI_API_ENDPOINT:
+        return await asyncio.to_thread(target_model.generate_content, contents, **kwargs)
+    return await target_model.generate_content_async(contents, **kwargs)
+
+
+async def _iter_chunks(response):
+    """Trechos da resposta em streaming, venha ela do cliente assíncrono ou do REST síncrono."""
+    if hasattr(response, "__aiter__"):
+        async for chunk in response:
+            yield chunk
+        return
+    chunks = iter(response)
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        yield chunk
+
+
+async def prepare_turn_async(db: AsyncSession, lead: Lead, user_message: str) -> PreparedTurn:
+    """Versão assíncrona de prepare_turn."""
+    rule_fields = _rule_fields(user_message)
+    try:
+        request = await _turn_request_async(db, lead, user_message, rule_fields)
+    except Exception as e:
+        logger.error("Erro ao montar o turno do lead %s: %s", lead.id, e, extra={"lead_id": lead.id})
+        request = None
+    return PreparedTurn(lead, user_message, rule_fields, request)
+
+
+async def generate_reply_async(turn: PreparedTurn) -> tuple:
+    """Versão assíncrona de generate_reply."""
+    if turn.request is None:
+        return {}, FALLBACK_RESPONSE
+    target_model, contents, session = turn.request
+    try:
+        with observe_stage("gemini_turn"):
+            response = await gemini_backend.acall(_generate_async, target_model, contents,
+                                                  request_options=request_options)
+        return _complete_turn(turn.lead.id, turn.user_message, session, response.text, usage_of(response))
     except Exception as e:
-        print(f"ERRO ao chamar a API do Gemini: {e}")
+        logger.error("Erro ao chamar a API do Gemini: %s", e, extra={"lead_id": turn.lead.id})
+        return {}, FALLBACK_RESPONSE
+
+
+async def stream_reply_async(turn: PreparedTurn):
+    """
+    Versão em streaming de generate_reply. Gera ("delta", trecho) conforme o
+    response_text chega do Gemini e, ao final, ("reply", update_data, resposta).
+    """
+    update_data, ai_response_text = {}, FALLBACK_RESPONSE
+    if turn.request is not None:
+        target_model, contents, session = turn.request
+        try:
+            # A camada de saída protege a abertura do stream; os pedaços chegam depois
+            started_at = time.perf_counter()
+            response = await gemini_backend.acall(_generate_async, target_model, contents, stream=True,
+                                                  request_options=request_options)
+            streamer = ResponseTextStreamer()
+            raw_chunks = []
+            async for chunk in _iter_chunks(response):
+                raw_chunks.append(chunk.text)
+                delta = streamer.feed(chunk.text)
+                if delta:
+                    yield "delta", delta
+            record_stage("gemini_turn", time.perf_counter() - started_at)
+            update_data, ai_response_text = _complete_turn(turn.lead.id, turn.user_message, session,
+                                                           "".join(raw_chunks), usage_of(response))
+        except Exception as e:
+            logger.error("Erro ao chamar a API do Gemini (streaming): %s", e, extra={"lead_id": turn.lead.id})
+    yield "reply", update_data, ai_response_text
+
+
+async def finish_turn_async(db: AsyncSession, turn: PreparedTurn, update_data: dict, ai_response_text: str) -> dict:
+    """Versão assíncrona de finish_turn."""
+    lead = turn.lead
+    add_message_to_history(db, lead.id, 'user', turn.user_message)
+    update_data = _merge_updates(lead, update_data, turn.rule_fields)
+    if update_data:
+        try:
+            await lead_service.apply_turn_update_async(db=db, db_lead=lead, lead_update=LeadUpdate(**update_data))
+        except Exception as e:
+            logger.error("Erro ao atualizar o lead %s: %s", lead.id, e, extra={"lead_id": lead.id})
 
     add_message_to_history(db, lead.id, 'assistant', ai_response_text)
+    return update_data
+
 
+async def process_user_message_async(db: AsyncSession, lead: Lead, user_message: str) -> str:
+    """Versão assíncrona de process_user_message."""
+    turn = await prepare_turn_async(db, lead, user_message)
+    update_data, ai_response_text = await generate_reply_async(turn)
+    await finish_turn_async(db, turn, update_data, ai_response_text)
     return ai_response_text
@@ -1,7 +1,14 @@
-from sqlalchemy.orm import Session
+import logging
+import time
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta, timezone
 from app.models.lead import Lead
 from app.models.followup import FollowUp
+from app.core.config import FOLLOWUP_BATCH_SIZE, FOLLOWUP_MAX_BATCHES_PER_RUN
+from app.core.metrics import record_stage
+
+logger = logging.getLogger(__name__)
 
 # Cadência de follow-up em dias e as mensagens
 FOLLOW_UP_CADENCE = {
@@ -12,7 +19,7 @@ FOLLOW_UP_CADENCE = {
 }
 
 def schedule_initial_followups(db: Session, lead: Lead):
-    """Agenda a sequência inicial de follow-ups para um novo lead."""
+    """Agenda a sequência inicial de follow-ups para um novo lead (na transação de quem chamou)."""
     now = datetime.now(timezone.utc)
     for days, message in FOLLOW_UP_CADENCE.items():
         scheduled_time = now + timedelta(days=days)
@@ -23,25 +30,62 @@ def schedule_initial_followups(db: Session, lead: Lead):
             message_template=message
         )
         db.add(follow_up_task)
-    db.commit()
 
-def process_pending_followups(db: Session):
-    """Busca e 'envia' os follow-ups pendentes."""
+def schedule_initial_followups_bulk(db: Session, lead_ids) -> int:
+    """
+    Agenda a cadência inicial para vários leads num único INSERT em lote.
+    Não faz commit: roda na mesma transação de quem criou os leads.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"lead_id": lead_id, "scheduled_for": now + timedelta(days=days), "status": "pending",
+         "message_template": message}
+        for lead_id in lead_ids
+        for days, message in FOLLOW_UP_CADENCE.items()
+    ]
+    if rows:
+        db.execute(insert(FollowUp), rows)
+    return len(rows)
+
+def claim_due_followups(db: Session, batch_size: int = FOLLOWUP_BATCH_SIZE):
+    """
+    Trava um lote de follow-ups vencidos com FOR UPDATE SKIP LOCKED, já com o lead
+    carregado. Outros workers pulam as linhas travadas, então não há envio duplicado.
+    """
     now = datetime.now(timezone.utc)
-    pending_tasks = db.query(FollowUp).filter(
+    return db.query(FollowUp).options(joinedload(FollowUp.lead, innerjoin=True)).filter(
         FollowUp.status == "pending",
         FollowUp.scheduled_for <= now
-    ).all()
+    ).order_by(FollowUp.scheduled_for).limit(batch_size).with_for_update(skip_locked=True, of=FollowUp).all()
+
+def send_followup(task: FollowUp):
+    """'Envia' um follow-up (simulado)."""
+    logger.info("Enviando follow-up para %s: %s", task.lead.phone_number, task.message_template,
+                extra={"lead_id": task.lead_id, "followup_id": task.id})
+
+def process_pending_followups(db: Session, batch_size: int = FOLLOWUP_BATCH_SIZE,
+                              max_batches: int = FOLLOWUP_MAX_BATCHES_PER_RUN) -> int:
+    """Busca e 'envia' os follow-ups pendentes em lotes, com um commit por lote."""
+    total_sent = 0
+    for _ in range(max_batches):
+        started_at = time.perf_counter()
+        pending_tasks = claim_due_followups(db, batch_size)
+        if not pending_tasks:
+            break
+
+        for task in pending_tasks:
+            send_followup(task)
+            task.status = "sent"
+
+        # O commit libera as travas do lote
+        db.commit()
+        record_stage("followup_batch", time.perf_counter() - started_at)
+        total_sent += len(pending_tasks)
 
-    for task in pending_tasks:
-        print(f"--- ENVIANDO FOLLOW-UP ---")
-        print(f"Para: {task.lead.phone_number}")
-        print(f"Mensagem: {task.message_template}")
-        print(f"--------------------------")
-        task.status = "sent"
-        db.add(task)
+        if len(pending_tasks) < batch_size:
+            break
 
-    db.commit()
+    return total_sent
 
 def get_followups_by_lead_id(db: Session, lead_id: int):
     """Busca todos os follow-ups agendados para um lead específico."""
@@ -1,8 +1,12 @@
+import logging
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 from app.models.lead import Lead
 from app.models.broker import Broker
 from app.models.followup import FollowUp
+from app.services.lead_cache import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
 
 def perform_handoff(db: Session, lead: Lead):
     """
@@ -35,12 +39,14 @@ def perform_handoff(db: Session, lead: Lead):
     Atribuído em: {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M')}
     --- FIM DO RESUMO ---
     """
-    print(summary) # Simula o envio do resumo para o CRM/Corretor
+    logger.info(summary, extra={"lead_id": lead.id, "broker_id": broker.id}) # Simula o envio do resumo para o CRM/Corretor
 
-    # 3. Atualizar o lead
-    lead.broker_id = broker.id
+    # 3. Atualizar o lead (relacionamento e datas já preenchidos: a resposta não precisa de refresh)
+    now = datetime.now(timezone.utc)
+    lead.broker = broker
     lead.status = "handoff_completed"
-    lead.handoff_at = datetime.now(timezone.utc)
+    lead.handoff_at = now
+    lead.updated_at = now
     db.add(lead)
 
     # 4. Cancelar todos os follow-ups pendentes para este lead
@@ -49,6 +55,7 @@ def perform_handoff(db: Session, lead: Lead):
         FollowUp.status == "pending"
     ).update({"status": "cancelled"})
 
-    db.commit()
-    db.refresh(lead)
+    # O commit fica com a rota, junto com o restante da requisição
+    db.flush()
+    invalidate_on_commit(db, lead.phone_number)
     return lead
\ No newline at end of file
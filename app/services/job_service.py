@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+
+from app.core.config import AUDIO_JOB_WORKERS
+from app.core.database import SessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Executor dos pipelines em segundo plano (fora das threads das requisições)
+job_executor = ThreadPoolExecutor(max_workers=AUDIO_JOB_WORKERS, thread_name_prefix="job")
+
+
+def create_job(db: Session, kind: str) -> Job:
+    """Registra um novo job na fila."""
+    job = Job(id=uuid.uuid4().hex, kind=kind, status="queued", stage_timings={},
+              created_at=datetime.now(timezone.utc))
+    db.add(job)
+    # Commit imediato: o job precisa estar visível para o executor e para o polling
+    db.commit()
+    return job
+
+
+def get_job(db: Session, job_id: str):
+    """Busca um job pelo id."""
+    return db.query(Job).filter(Job.id == job_id).first()
+
+
+def submit_job(fn, job_id: str, *args, temp_files=(), **kwargs):
+    """
+    Agenda fn(job_id, *args, **kwargs) no executor de segundo plano. `temp_files`
+    são os arquivos que o job apaga ao terminar: se ele nunca chegar a rodar
+    (cancelado no desligamento, executor já encerrado), o job vira "failed" e os
+    arquivos são apagados aqui.
+    """
+    try:
+        future = job_executor.submit(fn, job_id, *args, **kwargs)
+    except RuntimeError:
+        _abandon_job(job_id, temp_files)
+        raise
+    future.add_done_callback(lambda f: f.cancelled() and _abandon_job(job_id, temp_files))
+    return future
+
+
+def _abandon_job(job_id: str, temp_files):
+    try:
+        JobTracker(job_id).fail("Job cancelado no desligamento da API; envie o áudio novamente.")
+    except Exception as e:
+        logger.error("Erro ao marcar o job %s como cancelado: %s", job_id, e, extra={"job_id": job_id})
+    for path in temp_files:
+        if os.path.exists(path):
+            os.remove(path)
+    logger.warning("Job %s cancelado antes de rodar.", job_id, extra={"job_id": job_id})
+
+
+class JobTracker:
+    """
+    Atualiza o job no banco conforme o pipeline avança: etapa atual,
+    duração de cada etapa, resultado ou erro. Cada atualização usa uma
+    sessão curta, para o polling enxergar o progresso imediatamente.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stage_timings = {}
+
+    def _update(self, **values):
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == self.job_id).update(values)
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self):
+        self._update(status="running")
+
+    @contextmanager
+    def stage(self, name: str):
+        self._update(stage=name)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_timings[name] = round((time.perf_counter() - started_at) * 1000, 1)
+            self._update(stage_timings=dict(self.stage_timings))
+
+    def partial(self, result: dict):
+        """Publica um resultado parcial enquanto o job ainda roda (ex.: transcrição por trechos)."""
+        self._update(result=result)
+
+    def complete(self, result: dict):
+        self._update(status="completed", stage=None, result=result)
+
+    def fail(self, error: str):
+        self._update(status="failed", error=error)
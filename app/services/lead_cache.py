@@ -0,0 +1,118 @@
+"""
+Cache de leitura dos leads por telefone. Guarda um snapshot (schema Lead,
+sem vínculo com sessão) e o ETag correspondente, com validade (TTL) e LRU.
+Escritas no lead invalidam a entrada; entre réplicas, o TTL limita o atraso.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import LEAD_CACHE_TTL_SECONDS, LEAD_CACHE_MAX_ENTRIES
+from app.schemas.lead import Lead as LeadSchema
+
+
+class CachedLead(NamedTuple):
+    lead: LeadSchema
+    etag: str
+    expires_at: float
+
+
+def make_etag(snapshot: LeadSchema) -> str:
+    return '"' + hashlib.sha1(snapshot.model_dump_json().encode("utf-8")).hexdigest() + '"'
+
+
+class LeadSnapshotCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, CachedLead]" = OrderedDict()
+        # Geração por telefone: uma leitura iniciada antes de uma escrita não repõe dado velho
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        # Momento da última escrita de cada telefone (para evitar a réplica logo após escrever)
+        self._written_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, phone_number: str) -> Optional[CachedLead]:
+        with self._lock:
+            entry = self._items.get(phone_number)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._items[phone_number]
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(phone_number)
+            self.stats["hits"] += 1
+            return entry
+
+    def generation(self, phone_number: str) -> tuple:
+        with self._lock:
+            return self._epoch, self._generations.get(phone_number, 0)
+
+    def put(self, phone_number: str, snapshot: LeadSchema, generation: tuple) -> CachedLead:
+        entry = CachedLead(snapshot, make_etag(snapshot), time.monotonic() + self.ttl)
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return entry
+        with self._lock:
+            if (self._epoch, self._generations.get(phone_number, 0)) != generation:
+                return entry
+            self._items[phone_number] = entry
+            self._items.move_to_end(phone_number)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return entry
+
+    def invalidate(self, *phone_numbers: str):
+        with self._lock:
+            now = time.monotonic()
+            for phone_number in phone_numbers:
+                self._items.pop(phone_number, None)
+                self._generations[phone_number] = self._generations.get(phone_number, 0) + 1
+                self._written_at[phone_number] = now
+                self.stats["invalidations"] += 1
+            # As gerações só precisam existir enquanto pode haver leitura em andamento
+            if len(self._generations) > self.max_entries * 4:
+                self._generations.clear()
+                self._written_at.clear()
+                self._items.clear()
+                self._epoch += 1
+
+    def written_recently(self, phone_number: str, window: float) -> bool:
+        with self._lock:
+            written_at = self._written_at.get(phone_number)
+        return written_at is not None and time.monotonic() - written_at < window
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._items), "max_entries": self.max_entries,
+                    "ttl_seconds": self.ttl}
+
+
+lead_cache = LeadSnapshotCache(LEAD_CACHE_TTL_SECONDS, LEAD_CACHE_MAX_ENTRIES)
+
+
+def invalidate_on_commit(db, phone_number: str):
+    """
+    Invalida o lead já (para leituras em andamento não reporem o dado) e de novo
+    quando a transação da sessão for confirmada. Aceita Session ou AsyncSession.
+    """
+    lead_cache.invalidate(phone_number)
+    db.info.setdefault("dirty_leads", set()).add(phone_number)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_leads(session):
+    phones = session.info.pop("dirty_leads", None)
+    if phones:
+        lead_cache.invalidate(*phones)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_leads(session):
+    session.info.pop("dirty_leads", None)
@@ -0,0 +1,177 @@
+"""
+Importação em massa de leads (listas de campanha) a partir de CSV ou NDJSON.
+
+O arquivo é lido linha a linha e gravado em lotes: cada lote é um único
+INSERT ... ON CONFLICT (phone_number) DO UPDATE com várias linhas, e os
+follow-ups dos leads novos entram na mesma transação. Linhas inválidas
+viram erros no relatório sem abortar o lote.
+"""
+import codecs
+import csv
+import json
+import time
+from typing import Iterator, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import LEAD_IMPORT_BATCH_SIZE, LEAD_IMPORT_MAX_REPORTED_ERRORS
+from app.models.lead import Lead
+from app.schemas.lead import LeadImportRow
+from app.services import followup_service
+from app.services.lead_cache import lead_cache
+
+# Campos que a importação preenche; valores vazios no arquivo não apagam o que já existe
+IMPORT_FIELDS = [name for name in LeadImportRow.model_fields if name != "phone_number"]
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return None
+
+
+def iter_import_rows(stream, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Gera (número da linha, dados, erro) sem carregar o arquivo inteiro na memória."""
+    lines = codecs.iterdecode(stream, "utf-8-sig")
+    if fmt == "csv":
+        # Linha 1 é o cabeçalho
+        for row_number, row in enumerate(csv.DictReader(lines), start=2):
+            yield row_number, {(key or "").strip(): (value.strip() or None) if isinstance(value, str) else value
+                               for key, value in row.items()}, None
+        return
+
+    for row_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Cada linha deve ser um objeto JSON."
+            continue
+        yield row_number, data, None
+
+
+def _insert_for(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Importação em massa não suportada para o banco '{dialect}'.")
+    return insert
+
+
+def _upsert(db: Session, rows: list) -> Tuple[int, int, int]:
+    """Grava as linhas num único INSERT ... ON CONFLICT; retorna (criados, atualizados, follow-ups)."""
+    phones = [row["phone_number"] for row in rows]
+    # Telefones que já existiam: os demais são leads novos e recebem a cadência de follow-up
+    existing = set(db.scalars(select(Lead.phone_number).where(Lead.phone_number.in_(phones))))
+
+    insert = _insert_for(db)
+    stmt = insert(Lead).values([{**row, "status": "new"} for row in rows])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Lead.phone_number],
+        set_={**{field: func.coalesce(getattr(stmt.excluded, field), getattr(Lead, field))
+                 for field in IMPORT_FIELDS},
+              "updated_at": func.now()},
+    ).returning(Lead.id, Lead.phone_number)
+    written = db.execute(stmt).all()
+
+    new_ids = [lead_id for lead_id, phone in written if phone not in existing]
+    followups = followup_service.schedule_initial_followups_bulk(db, new_ids)
+    return len(new_ids), len(written) - len(new_ids), followups
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = self.created = self.updated = self.failed = self.followups_scheduled = 0
+        self.errors = []
+
+    def add_error(self, row_number: int, phone_number: Optional[str], error: str):
+        self.failed += 1
+        if len(self.errors) < LEAD_IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "phone_number": phone_number, "error": error})
+
+    def add_written(self, created: int, updated: int, followups: int):
+        self.created += created
+        self.updated += updated
+        self.followups_scheduled += followups
+
+
+def _write_batch(db: Session, batch: dict, report: ImportReport):
+    """Grava um lote; se alguma linha for recusada pelo banco, isola as linhas uma a uma."""
+    if not batch:
+        return
+    try:
+        with db.begin_nested():
+            report.add_written(*_upsert(db, [data for _, data in batch.values()]))
+    except (IntegrityError, DataError):
+        for phone, (row_number, data) in batch.items():
+            try:
+                with db.begin_nested():
+                    report.add_written(*_upsert(db, [data]))
+            except (IntegrityError, DataError) as e:
+                report.add_error(row_number, phone, str(getattr(e, "orig", None) or e))
+    except SQLAlchemyError as e:
+        # Falha do lote inteiro (conexão, lock, timeout): reporta as linhas e segue para o próximo
+        db.rollback()
+        for phone, (row_number, _) in batch.items():
+            report.add_error(row_number, phone, f"Falha ao gravar o lote: {getattr(e, 'orig', None) or e}")
+        return
+    db.commit()
+    lead_cache.invalidate(*batch.keys())
+
+
+def import_leads(db: Session, stream, fmt: str, batch_size: int = LEAD_IMPORT_BATCH_SIZE) -> dict:
+    """Importa o arquivo em lotes e retorna o relatório (contagens e erros por linha)."""
+    started_at = time.perf_counter()
+    report = ImportReport()
+    # Telefone -> (linha, dados); repetições no mesmo lote ficam com a última linha,
+    # já que um ON CONFLICT não pode atualizar a mesma linha duas vezes
+    batch = {}
+
+    for row_number, data, error in iter_import_rows(stream, fmt):
+        report.processed += 1
+        if error:
+            report.add_error(row_number, None, error)
+            continue
+        try:
+            row = LeadImportRow(**data)
+        except ValidationError as e:
+            report.add_error(row_number, data.get("phone_number"), _validation_message(e))
+            continue
+        phone = row.phone_number.strip()
+        if not phone:
+            report.add_error(row_number, None, "phone_number vazio.")
+            continue
+
+        batch[phone] = (row_number, {**row.model_dump(), "phone_number": phone})
+        if len(batch) >= batch_size:
+            _write_batch(db, batch, report)
+            batch = {}
+
+    _write_batch(db, batch, report)
+
+    return {
+        "processed": report.processed, "created": report.created, "updated": report.updated,
+        "failed": report.failed, "followups_scheduled": report.followups_scheduled,
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1), "errors": report.errors,
+    }
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in item['loc'])}: {item['msg']}" for item in error.errors())
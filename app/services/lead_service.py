@@ -1,27 +1,224 @@
-from sqlalchemy.orm import Session
+import logging
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from sqlalchemy import select, func, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.lead import Lead
 from app.schemas.lead import LeadCreate
 from app.schemas.lead import LeadUpdate
+from app.schemas.lead import Lead as LeadSchema
+from app.services.lead_cache import lead_cache, CachedLead, invalidate_on_commit
+from app.core.config import DB_READ_AFTER_WRITE_SECONDS
+from app.core.database import SessionLocal, is_replica_session
+
+logger = logging.getLogger(__name__)
+
+# Tentativas do UPDATE condicional quando outro processo alterou o lead no meio do turno
+UPDATE_ATTEMPTS = 3
 
 def get_lead_by_phone(db: Session, phone_number: str):
     """Busca um lead pelo número de telefone."""
     return db.query(Lead).filter(Lead.phone_number == phone_number).first()
 
+def get_lead_snapshot(db: Session, phone_number: str) -> Optional[CachedLead]:
+    """
+    Leitura via cache: devolve o snapshot do lead (sem vínculo com a sessão) e o ETag.
+    Use nas rotas que só leem o lead; para alterar, busque com get_lead_by_phone.
+    """
+    cached = lead_cache.get(phone_number)
+    if cached is not None:
+        return cached
+    if is_replica_session(db) and lead_cache.written_recently(phone_number, DB_READ_AFTER_WRITE_SECONDS):
+        # Escrita recente: a réplica pode estar atrasada, então lê (e cacheia) do primário
+        with SessionLocal() as primary_db:
+            return _load_snapshot(primary_db, phone_number)
+    return _load_snapshot(db, phone_number)
+
+def _load_snapshot(db: Session, phone_number: str) -> Optional[CachedLead]:
+    generation = lead_cache.generation(phone_number)
+    db_lead = db.scalars(select(Lead).where(Lead.phone_number == phone_number)
+                         .options(selectinload(Lead.broker))).first()
+    if db_lead is None:
+        return None
+    return lead_cache.put(phone_number, LeadSchema.model_validate(db_lead), generation)
+
+def _new_lead(lead: LeadCreate) -> Lead:
+    # Valores preenchidos aqui já ficam conhecidos após o flush, sem refresh
+    return Lead(phone_number=lead.phone_number, status="new", created_at=datetime.now(timezone.utc))
+
 def create_lead(db: Session, lead: LeadCreate):
-    """Cria um novo lead no banco de dados."""
-    db_lead = Lead(phone_number=lead.phone_number)
+    """Cria um novo lead (flush); o commit fica com quem abriu a sessão."""
+    db_lead = _new_lead(lead)
     db.add(db_lead)
-    db.commit()
-    db.refresh(db_lead)
+    db.flush()
+    invalidate_on_commit(db, db_lead.phone_number)
     return db_lead
 
 def update_lead(db: Session, db_lead: Lead, lead_update: LeadUpdate):
-    """Atualiza um lead com novos dados de qualificação."""
+    """Atualiza um lead com novos dados de qualificação (flush, sem commit)."""
     update_data = lead_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_lead, key, value)
+    db_lead.updated_at = datetime.now(timezone.utc)
+
+    db.add(db_lead)
+    db.flush()
+    invalidate_on_commit(db, db_lead.phone_number)
+    return db_lead
+
+def apply_turn_update(db: Session, db_lead, lead_update: LeadUpdate):
+    """
+    Grava os dados extraídos num turno de conversa. Aceita o modelo ou o snapshot
+    do cache: o UPDATE vai direto pelo id, sem recarregar a linha.
+
+    O turno não trava o lead no banco (o LLM demora e a conexão ficaria presa): o UPDATE
+    só vale se o `updated_at` ainda for o que o turno leu. Se outro processo alterou o
+    lead no meio do caminho, relê a linha e reaplica só os campos que ele não mexeu.
+    """
+    values = lead_update.model_dump(exclude_unset=True)
+    seen = _lead_state(db_lead, values)
+    for _ in range(UPDATE_ATTEMPTS):
+        if not values:
+            break
+        values["updated_at"] = datetime.now(timezone.utc)
+        if db.execute(_update_if_unchanged(db_lead.id, seen["updated_at"], values)).rowcount:
+            _sync_model(db_lead, values)
+            break
+        current = db.scalars(_reload(db_lead.id)).first()
+        if current is None:
+            break
+        values, seen = _rebase_update(db_lead.id, values, seen, current)
+    invalidate_on_commit(db, db_lead.phone_number)
+    return db_lead
+
+# --- Listagem e exportação ---
+
+# Colunas da exportação (planas, sem o corretor aninhado)
+EXPORT_COLUMNS = [
+    "id", "phone_number", "location", "property_type", "bedrooms", "parking_spots", "min_area_sqm",
+    "investment_range", "move_in_deadline", "payment_method", "status", "intent_level", "broker_id",
+    "handoff_at", "created_at", "updated_at",
+]
+
+def filter_leads_query(status: Optional[str] = None, location: Optional[str] = None,
+                       broker_id: Optional[int] = None, updated_since: Optional[datetime] = None,
+                       updated_before: Optional[datetime] = None):
+    """Monta o SELECT de leads com os filtros informados, ordenado por id (chave do cursor)."""
+    query = select(Lead).order_by(Lead.id)
+    if status:
+        query = query.where(Lead.status == status)
+    if location:
+        query = query.where(func.lower(Lead.location) == location.lower())
+    if broker_id is not None:
+        query = query.where(Lead.broker_id == broker_id)
+    # Leads nunca atualizados contam pela data de criação
+    last_change = func.coalesce(Lead.updated_at, Lead.created_at)
+    if updated_since:
+        query = query.where(last_change >= updated_since)
+    if updated_before:
+        query = query.where(last_change < updated_before)
+    return query
+
+def list_leads(db: Session, after_id: Optional[int], limit: int, **filters):
+    """
+    Uma página de leads por keyset: `id > after_id`, sem OFFSET, então o custo
+    não cresce com a página. Retorna (leads, id do cursor para a próxima página).
+    """
+    query = filter_leads_query(**filters).options(selectinload(Lead.broker))
+    if after_id is not None:
+        query = query.where(Lead.id > after_id)
+    # Busca um a mais para saber se existe próxima página
+    leads = list(db.scalars(query.limit(limit + 1)))
+    if len(leads) > limit:
+        return leads[:limit], leads[limit - 1].id
+    return leads, None
+
+def iter_leads_for_export(db: Session, fetch_size: int, **filters) -> Iterator[dict]:
+    """
+    Percorre os leads com cursor no servidor (yield_per): só `fetch_size` linhas
+    ficam em memória por vez, seja qual for o total exportado.
+    """
+    columns = [getattr(Lead, name) for name in EXPORT_COLUMNS]
+    query = filter_leads_query(**filters).with_only_columns(*columns).execution_options(yield_per=fetch_size)
+    for row in db.execute(query):
+        yield dict(row._mapping)
 
+# --- Versões assíncronas (usadas pelo turno de conversa) ---
+
+async def get_lead_by_phone_async(db: AsyncSession, phone_number: str):
+    """Busca um lead pelo número de telefone sem bloquear o event loop."""
+    result = await db.execute(select(Lead).where(Lead.phone_number == phone_number))
+    return result.scalars().first()
+
+async def get_lead_snapshot_async(db: AsyncSession, phone_number: str) -> Optional[CachedLead]:
+    """Versão assíncrona de get_lead_snapshot (o corretor é carregado junto, sem lazy load)."""
+    cached = lead_cache.get(phone_number)
+    if cached is not None:
+        return cached
+    generation = lead_cache.generation(phone_number)
+    result = await db.execute(select(Lead).where(Lead.phone_number == phone_number)
+                              .options(selectinload(Lead.broker)))
+    db_lead = result.scalars().first()
+    if db_lead is None:
+        return None
+    return lead_cache.put(phone_number, LeadSchema.model_validate(db_lead), generation)
+
+async def create_lead_async(db: AsyncSession, lead: LeadCreate):
+    """Cria um novo lead (flush, versão assíncrona); o commit fica com quem abriu a sessão."""
+    db_lead = _new_lead(lead)
     db.add(db_lead)
-    db.commit()
-    db.refresh(db_lead)
-    return db_lead
\ No newline at end of file
+    await db.flush()
+    invalidate_on_commit(db, db_lead.phone_number)
+    return db_lead
+
+async def apply_turn_update_async(db: AsyncSession, db_lead, lead_update: LeadUpdate):
+    """Versão assíncrona de apply_turn_update."""
+    values = lead_update.model_dump(exclude_unset=True)
+    seen = _lead_state(db_lead, values)
+    for _ in range(UPDATE_ATTEMPTS):
+        if not values:
+            break
+        values["updated_at"] = datetime.now(timezone.utc)
+        result = await db.execute(_update_if_unchanged(db_lead.id, seen["updated_at"], values))
+        if result.rowcount:
+            _sync_model(db_lead, values)
+            break
+        current = (await db.execute(_reload(db_lead.id))).scalars().first()
+        if current is None:
+            break
+        values, seen = _rebase_update(db_lead.id, values, seen, current)
+    invalidate_on_commit(db, db_lead.phone_number)
+    return db_lead
+
+
+def _lead_state(lead, values: dict) -> dict:
+    # Cópia dos valores lidos: com o modelo da própria sessão, a releitura sobrescreve os atributos
+    return {**{key: getattr(lead, key) for key in values}, "updated_at": lead.updated_at}
+
+
+def _update_if_unchanged(lead_id: int, seen_updated_at, values: dict):
+    return (update(Lead)
+            .where(Lead.id == lead_id, Lead.updated_at.is_not_distinct_from(seen_updated_at))
+            .values(**values).execution_options(synchronize_session=False))
+
+
+def _sync_model(db_lead, values: dict):
+    # Com o modelo (e não o snapshot), reflete o UPDATE nele sem marcá-lo como alterado
+    if isinstance(db_lead, Lead):
+        for key, value in values.items():
+            set_committed_value(db_lead, key, value)
+
+
+def _reload(lead_id: int):
+    return select(Lead).where(Lead.id == lead_id).execution_options(populate_existing=True)
+
+
+def _rebase_update(lead_id: int, values: dict, seen: dict, current: Lead) -> tuple:
+    """Descarta os campos que o outro escritor alterou (a escrita dele é mais recente que a leitura do turno)."""
+    kept = {key: value for key, value in values.items()
+            if key != "updated_at" and getattr(current, key) == seen[key]}
+    logger.warning("Lead %s alterado durante o turno; reaplicando %s de %s campo(s).", lead_id, len(kept),
+                   len(values) - 1, extra={"lead_id": lead_id})
+    return kept, _lead_state(current, kept)
@@ -0,0 +1,154 @@
+"""
+Sessões do Gemini por lead: o histórico vai como turnos estruturados
+(user/model) em vez de texto dentro do prompt, e cada sessão fica em um
+cache LRU com expiração. Também guarda a contagem de tokens por turno.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from app.core.config import (
+    CONVERSATION_WINDOW_SIZE, CONVERSATION_SESSION_MAX_LEADS, CONVERSATION_SESSION_TTL_SECONDS,
+)
+
+
+def _content(role: str, text: str) -> dict:
+    return {"role": role, "parts": [text]}
+
+
+class LeadSession:
+    """Turnos já trocados com o modelo para um lead (janela limitada)."""
+
+    def __init__(self, lead_id: int, window_size: int):
+        self.lead_id = lead_id
+        # Tamanho par para a janela sempre começar num turno do usuário
+        self.turns: deque = deque(maxlen=max(2, window_size - window_size % 2))
+        self.last_used = time.monotonic()
+        # Mensagens do histórico do lead que a sessão cobre (conferidas com o banco a cada turno)
+        self.messages = 0
+        self.tokens = {"turns": 0, "prompt_tokens": 0, "output_tokens": 0, "last_prompt_tokens": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_history(cls, lead_id: int, history, messages: int = 0,
+                     window_size: int = CONVERSATION_WINDOW_SIZE) -> "LeadSession":
+        """Reconstrói a sessão a partir da janela de histórico (HistoryEntry) de um lead com `messages` mensagens."""
+        session = cls(lead_id, window_size)
+        session.messages = messages
+        for entry in history:
+            if entry.role == "user":
+                session.turns.append(_content("user", entry.content))
+            elif session.turns:
+                # Respostas antigas voltam no mesmo formato JSON que o modelo devolve
+                session.turns.append(_content("model", json.dumps({"response_text": entry.content},
+                                                                  ensure_ascii=False)))
+        return session
+
+    def contents(self, turn_message: str) -> list:
+        """Histórico da sessão seguido da mensagem deste turno."""
+        with self._lock:
+            return list(self.turns) + [_content("user", turn_message)]
+
+    def record_turn(self, user_message: str, model_reply: str, usage=None):
+        with self._lock:
+            self.turns.append(_content("user", user_message))
+            self.turns.append(_content("model", model_reply))
+            self.messages += 2
+            self.last_used = time.monotonic()
+            if usage is not None:
+                self.tokens["turns"] += 1
+                self.tokens["prompt_tokens"] += usage["prompt_tokens"]
+                self.tokens["output_tokens"] += usage["output_tokens"]
+                self.tokens["last_prompt_tokens"] = usage["prompt_tokens"]
+
+
+class LeadSessionCache:
+    """
+    LRU de sessões por lead; sessões paradas há mais de `ttl` segundos expiram.
+    Uma sessão que não cobre o total de mensagens do lead (outro worker atendeu
+    um turno, ou um turno falhou ou foi desfeito) é descartada e reconstruída.
+    """
+
+    def __init__(self, max_leads: int, ttl: float):
+        self.max_leads = max_leads
+        self.ttl = ttl
+        self._sessions: "OrderedDict[int, LeadSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stale": 0, "evicted": 0}
+
+    def get(self, lead_id: int, messages: Optional[int] = None) -> Optional[LeadSession]:
+        with self._lock:
+            session = self._sessions.get(lead_id)
+            if session is None:
+                self.stats["misses"] += 1
+                return None
+            if time.monotonic() - session.last_used > self.ttl:
+                del self._sessions[lead_id]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            if messages is not None and session.messages != messages:
+                del self._sessions[lead_id]
+                self.stats["stale"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._sessions.move_to_end(lead_id)
+            self.stats["hits"] += 1
+            return session
+
+    def put(self, session: LeadSession):
+        with self._lock:
+            self._sessions[session.lead_id] = session
+            self._sessions.move_to_end(session.lead_id)
+            while len(self._sessions) > self.max_leads:
+                self._sessions.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def discard(self, lead_id: int):
+        with self._lock:
+            self._sessions.pop(lead_id, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "sessions": len(self._sessions), "max_leads": self.max_leads, "ttl_seconds": self.ttl}
+
+
+class TokenUsageStats:
+    """Tokens de entrada/saída por turno, separados por modo, para comparar prompt x sessão."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode: str, usage: dict):
+        with self._lock:
+            data = self._modes.setdefault(mode, {"turns": 0, "prompt_tokens": 0, "output_tokens": 0,
+                                                 "max_prompt_tokens": 0})
+            data["turns"] += 1
+            data["prompt_tokens"] += usage["prompt_tokens"]
+            data["output_tokens"] += usage["output_tokens"]
+            data["max_prompt_tokens"] = max(data["max_prompt_tokens"], usage["prompt_tokens"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for mode, data in self._modes.items():
+                turns = data["turns"] or 1
+                result[mode] = {**data, "avg_prompt_tokens": round(data["prompt_tokens"] / turns, 1),
+                                "avg_output_tokens": round(data["output_tokens"] / turns, 1)}
+            return result
+
+
+def usage_of(response) -> Optional[dict]:
+    """Contagem de tokens do turno a partir do usage_metadata da resposta do Gemini."""
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return None
+    return {"prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(metadata, "candidates_token_count", 0) or 0}
+
+
+session_cache = LeadSessionCache(CONVERSATION_SESSION_MAX_LEADS, CONVERSATION_SESSION_TTL_SECONDS)
+token_stats = TokenUsageStats()
@@ -1,73 +1,246 @@
 import os
-import io
-import shutil
+import logging
 import tempfile
-import requests  # Usaremos requests para a chamada direta
+import threading
+import time
+from collections import deque
+from typing import Iterator
 from fastapi import UploadFile
-from app.core.minio_client import minio_client, BUCKET_NAME
-from faster_whisper import WhisperModel
+from app.core.minio_client import get_minio_client, BUCKET_NAME
+from app.services.tts_cache import tts_cache, cache_key
+from app.core.outbound import elevenlabs_backend
+from app.core.metrics import observe_stage, record_stage
+from app.core.config import (
+    TTS_STREAM_CHUNK_SIZE, TTS_STREAM_MAX_CACHEABLE_BYTES, AUDIO_INGEST_PART_SIZE,
+    WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE,
+    STT_BACKEND, STT_STUB_TEXT, STT_STUB_LATENCY_MS,
+)
+from app.services.transcription_service import transcription_pool
+
+logger = logging.getLogger(__name__)
 
 # --- Configuração do ElevenLabs ---
+# Sem a chave a API sobe normalmente; só a síntese falha (e o /readyz aponta)
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-if not ELEVENLABS_API_KEY:
-    raise ValueError("Chave de API da ElevenLabs não encontrada no arquivo .env")
+
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+
+# Voz "Bella", modelo e ajustes usados na síntese (também compõem a chave do cache)
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.75
+}
+
+
+class TTFBStats:
+    """
+    Amostras recentes do tempo até o primeiro byte de áudio, por modo.
+    No modo "buffered" o primeiro byte só sai com a síntese completa.
+    """
+
+    def __init__(self, max_samples: int = 500):
+        self._samples = {"buffered": deque(maxlen=max_samples), "streaming": deque(maxlen=max_samples)}
+        self._lock = threading.Lock()
+
+    def record(self, mode: str, seconds: float):
+        with self._lock:
+            self._samples[mode].append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            result = {}
+            for mode, samples in self._samples.items():
+                ordered = sorted(samples)
+                if not ordered:
+                    result[mode] = {"count": 0}
+                    continue
+                result[mode] = {
+                    "count": len(ordered),
+                    "avg_ms": round(1000 * sum(ordered) / len(ordered), 1),
+                    "p50_ms": round(1000 * ordered[len(ordered) // 2], 1),
+                    "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                }
+            return result
+
+
+tts_ttfb_stats = TTFBStats()
 
 # --- Configuração do Whisper (STT Local) ---
-STT_MODEL_SIZE = "base"
+STT_MODEL_SIZE = WHISPER_MODEL_SIZE
 whisper_model = None
+_whisper_lock = threading.Lock()
 
 
 def _get_whisper_model():
     global whisper_model
-    if whisper_model is None:
-        print(f"Carregando modelo Whisper '{STT_MODEL_SIZE}' pela primeira vez...")
-        whisper_model = WhisperModel(STT_MODEL_SIZE, device="cpu", compute_type="int8")
-        print("Modelo Whisper carregado com sucesso.")
+    with _whisper_lock:
+        if whisper_model is None:
+            # Import tardio: o faster-whisper (ctranslate2) pesa no boot de quem não transcreve
+            from faster_whisper import WhisperModel
+
+            logger.info("Carregando modelo Whisper '%s' pela primeira vez...", STT_MODEL_SIZE)
+            whisper_model = WhisperModel(STT_MODEL_SIZE, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE)
+            logger.info("Modelo Whisper carregado com sucesso.")
     return whisper_model
 
 
 # --- Funções do Serviço ---
 
 def upload_audio_to_storage(file: UploadFile, phone_number: str) -> str:
-    # (código existente, sem alterações)
+    # Envia o arquivo em partes (multipart), sem carregá-lo inteiro na memória
     try:
         file.file.seek(0)
-        file_content = file.file.read()
-        file_size = len(file_content)
         object_name = f"{phone_number}/{file.filename}"
-        file_stream = io.BytesIO(file_content)
-        minio_client.put_object(
-            BUCKET_NAME, object_name, data=file_stream,
-            length=file_size, content_type=file.content_type
-        )
+        with observe_stage("minio_upload"):
+            get_minio_client().put_object(
+                BUCKET_NAME, object_name, data=file.file, length=-1,
+                part_size=AUDIO_INGEST_PART_SIZE, content_type=file.content_type
+            )
+        return object_name
+    except Exception as e:
+        logger.error("Erro ao fazer upload para o MinIO: %s", e)
+        raise
+
+
+class _TeeReader:
+    """Leitor que repassa cada bloco lido do upload também para um segundo destino."""
+
+    def __init__(self, source, sink):
+        self._source = source
+        self._sink = sink
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._source.read(size)
+        if chunk:
+            self._sink.write(chunk)
+            self.bytes_read += len(chunk)
+        return chunk
+
+    def drain(self):
+        # Consome o que o MinIO eventualmente não pediu, para a cópia local ficar completa
+        while self.read(AUDIO_INGEST_PART_SIZE):
+            pass
+
+
+def ingest_audio_upload(file: UploadFile, phone_number: str) -> tuple:
+    """
+    Lê o upload uma única vez: cada bloco vai ao mesmo tempo para o multipart
+    upload do MinIO e para o arquivo temporário que o Whisper vai transcrever.
+    O pico de memória é uma parte do multipart, independente do tamanho do áudio.
+    Retorna (object_name, caminho_do_arquivo_temporário).
+    """
+    file.file.seek(0)
+    object_name = f"{phone_number}/{file.filename}"
+    suffix = os.path.splitext(file.filename)[1]
+    temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with temp_audio:
+            reader = _TeeReader(file.file, temp_audio)
+            with observe_stage("minio_upload"):
+                get_minio_client().put_object(
+                    BUCKET_NAME, object_name, data=reader, length=-1,
+                    part_size=AUDIO_INGEST_PART_SIZE, content_type=file.content_type
+                )
+            reader.drain()
+    except Exception as e:
+        logger.error("Erro ao fazer upload para o MinIO: %s", e)
+        os.remove(temp_audio.name)
+        raise
+    return object_name, temp_audio.name
+
+
+def spool_audio_upload(file: UploadFile) -> str:
+    """Copia o upload (numa única leitura) para um arquivo temporário e retorna o caminho."""
+    file.file.seek(0)
+    suffix = os.path.splitext(file.filename)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_audio:
+        while True:
+            chunk = file.file.read(AUDIO_INGEST_PART_SIZE)
+            if not chunk:
+                break
+            temp_audio.write(chunk)
+    return temp_audio.name
+
+
+def upload_audio_file_to_storage(file_path: str, object_name: str, content_type: str) -> str:
+    """Envia um arquivo local ao MinIO em partes (usado pelos jobs em segundo plano)."""
+    try:
+        with observe_stage("minio_upload"):
+            get_minio_client().fput_object(
+                BUCKET_NAME, object_name, file_path,
+                content_type=content_type or "application/octet-stream", part_size=AUDIO_INGEST_PART_SIZE
+            )
         return object_name
     except Exception as e:
-        print(f"Erro ao fazer upload para o MinIO: {e}")
+        logger.error("Erro ao fazer upload para o MinIO: %s", e)
         raise
 
 
-def transcribe_audio_local(audio_file_path: str) -> str:
-    # (código existente, sem alterações)
+def transcribe_audio_local(audio_file_path: str, beam_size: int = 5, block: bool = False,
+                           chunked: bool = False, on_partial=None) -> str:
+    with observe_stage("whisper_transcription"):
+        return _transcribe(audio_file_path, beam_size, block, chunked, on_partial)
+
+
+def _transcribe(audio_file_path: str, beam_size: int, block: bool, chunked: bool, on_partial) -> str:
+    if STT_BACKEND == "stub":
+        # Sem modelo: só simula o tempo de transcrição (benchmarks)
+        time.sleep(STT_STUB_LATENCY_MS / 1000)
+        return STT_STUB_TEXT
+    # Com o pool habilitado, a transcrição roda num processo worker (modelo já carregado).
+    # O modo em trechos paralelos (áudios longos) depende do pool.
+    if transcription_pool.enabled:
+        if chunked:
+            return transcription_pool.transcribe_chunked(
+                audio_file_path, beam_size=beam_size, block=block, on_partial=on_partial
+            )
+        return transcription_pool.transcribe(audio_file_path, beam_size=beam_size, block=block)
+
     try:
         model = _get_whisper_model()
-        segments, info = model.transcribe(audio_file_path, language="pt", beam_size=5)
+        segments, info = model.transcribe(audio_file_path, language="pt", beam_size=beam_size)
         transcribed_text = "".join(segment.text for segment in segments)
         return transcribed_text.strip()
     except Exception as e:
-        print(f"Erro ao transcrever áudio localmente: {e}")
+        logger.error("Erro ao transcrever áudio localmente: %s", e)
         raise
 
 
-def generate_speech_from_text(text: str) -> bytes:
+def warmup_transcription(warmup: bool = True) -> bool:
     """
-    Usa a API da ElevenLabs para converter texto em áudio de alta qualidade via chamada HTTP direta.
+    Inicia o pool de transcrição (ou carrega o modelo local) antes do primeiro áudio.
+    Bloqueia até o modelo estar carregado; retorna False com o aquecimento desligado
+    (o modelo carrega no primeiro áudio).
     """
-    # --- TROQUE O ID AQUI ---
-    # ID da voz "Bella"
-    VOICE_ID = "21m00Tcm4TlvDq8ikWAM"
+    if STT_BACKEND == "stub":
+        return True
+    if transcription_pool.enabled:
+        transcription_pool.start(warmup=warmup, block=True)
+        if warmup and not transcription_pool.warmed:
+            raise RuntimeError("Nenhum worker de transcrição carregou o modelo Whisper.")
+        return warmup
+    if warmup:
+        _get_whisper_model()
+    return warmup
+
+
+def check_elevenlabs():
+    """A síntese depende só da chave; lança ValueError se ela não estiver configurada."""
+    if not ELEVENLABS_API_KEY:
+        raise ValueError("Chave de API da ElevenLabs não encontrada no arquivo .env")
+
+
+def _tts_request(text: str, stream: bool = False):
+    """Monta a chamada HTTP para a ElevenLabs (endpoint normal ou de streaming)."""
+    check_elevenlabs()
 
     # URL do endpoint de Text-to-Speech da ElevenLabs
-    tts_url = f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}"
+    tts_url = f"{ELEVENLABS_BASE_URL}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
+    if stream:
+        tts_url += "/stream"
 
     headers = {
         "Accept": "audio/mpeg",
@@ -77,24 +250,125 @@ def generate_speech_from_text(text: str) -> bytes:
 
     data = {
         "text": text,
-        "model_id": "eleven_multilingual_v2",
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.75
-        }
+        "model_id": ELEVENLABS_MODEL_ID,
+        "voice_settings": ELEVENLABS_VOICE_SETTINGS
     }
+    return tts_url, headers, data
 
-    try:
-        print(f"Gerando áudio (ElevenLabs API) para o texto: '{text}'")
 
-        response = requests.post(tts_url, json=data, headers=headers)
+def _synthesize_speech(text: str) -> bytes:
+    """
+    Usa a API da ElevenLabs para converter texto em áudio de alta qualidade via chamada HTTP direta.
+    """
+    tts_url, headers, data = _tts_request(text)
+
+    try:
+        logger.debug("Gerando áudio (ElevenLabs API) para o texto: '%s'", text)
+        started_at = time.perf_counter()
 
-        # Lança um erro se a resposta não for bem-sucedida (como 401 Unauthorized)
-        response.raise_for_status()
+        # Sessão com keep-alive, timeout, retry e circuit breaker; erros HTTP (ex.: 401) já são lançados
+        with observe_stage("elevenlabs_tts"):
+            response = elevenlabs_backend.request("POST", tts_url, json=data, headers=headers)
 
         # Retorna os bytes brutos do arquivo de áudio (.mp3)
-        return response.content
+        audio_bytes = response.content
+        tts_ttfb_stats.record("buffered", time.perf_counter() - started_at)
+        return audio_bytes
 
     except Exception as e:
-        print(f"ERRO ao gerar áudio com a API da ElevenLabs: {e}")
+        logger.error("Erro ao gerar áudio com a API da ElevenLabs: %s", e)
         raise
+
+
+def _speech_cache_key(text: str) -> str:
+    return cache_key(text, ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_VOICE_SETTINGS)
+
+
+def generate_speech_from_text(text: str) -> bytes:
+    """
+    Retorna o áudio do texto, consultando antes o cache (memória e MinIO).
+    Só chama a ElevenLabs quando o áudio ainda não foi gerado.
+    """
+    key = _speech_cache_key(text)
+    cached_audio = tts_cache.get(key)
+    if cached_audio is not None:
+        return cached_audio
+
+    audio_bytes = _synthesize_speech(text)
+    tts_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def prewarm_speech_cache(texts) -> int:
+    """Gera (ou carrega do MinIO) o áudio de textos fixos para que já estejam em memória."""
+    warmed = 0
+    for text in texts:
+        try:
+            generate_speech_from_text(text)
+            warmed += 1
+        except Exception as e:
+            logger.warning("Não foi possível pré-aquecer o áudio de '%s': %s", text, e)
+    logger.info("Cache de TTS pré-aquecido com %s áudio(s).", warmed)
+    return warmed
+
+
+def _iter_cached_audio(audio_bytes: bytes) -> Iterator[bytes]:
+    for offset in range(0, len(audio_bytes), TTS_STREAM_CHUNK_SIZE):
+        yield audio_bytes[offset:offset + TTS_STREAM_CHUNK_SIZE]
+
+
+def _relay_speech_stream(body, key: str, started_at: float) -> Iterator[bytes]:
+    """
+    Repassa os blocos da ElevenLabs ao cliente, guardando uma cópia limitada para o cache.
+    Fechar o corpo devolve a vaga do bulkhead da ElevenLabs.
+    """
+    buffer = bytearray()
+    cacheable = True
+    first_chunk = True
+    completed = False
+    try:
+        for chunk in body:
+            if not chunk:
+                continue
+            if first_chunk:
+                tts_ttfb_stats.record("streaming", time.perf_counter() - started_at)
+                first_chunk = False
+            if cacheable:
+                buffer.extend(chunk)
+                # Áudios muito longos não vão para o cache, mantendo a memória por requisição limitada
+                if len(buffer) > TTS_STREAM_MAX_CACHEABLE_BYTES:
+                    cacheable = False
+                    buffer = bytearray()
+            yield chunk
+        completed = True
+    finally:
+        body.close()
+        # No streaming, a etapa de TTS vai da abertura da chamada até o último bloco
+        record_stage("elevenlabs_tts", time.perf_counter() - started_at, "ok" if completed else "aborted")
+
+    if completed and cacheable and buffer:
+        tts_cache.put(key, bytes(buffer))
+
+
+def open_speech_stream(text: str) -> Iterator[bytes]:
+    """
+    Retorna um iterador de blocos de áudio para StreamingResponse.
+    A chamada à ElevenLabs é aberta aqui (antes da resposta começar), então
+    erros do provedor ainda podem virar um HTTP 500 normal na rota.
+    """
+    key = _speech_cache_key(text)
+    cached_audio = tts_cache.get(key)
+    if cached_audio is not None:
+        return _iter_cached_audio(cached_audio)
+
+    tts_url, headers, data = _tts_request(text, stream=True)
+    try:
+        logger.debug("Gerando áudio em streaming (ElevenLabs API) para o texto: '%s'", text)
+        started_at = time.perf_counter()
+        body = elevenlabs_backend.stream("POST", tts_url, chunk_size=TTS_STREAM_CHUNK_SIZE,
+                                         json=data, headers=headers)
+    except Exception as e:
+        logger.error("Erro ao gerar áudio com a API da ElevenLabs: %s", e)
+        raise
+
+    return _relay_speech_stream(body, key, started_at)
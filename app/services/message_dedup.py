@@ -0,0 +1,222 @@
+"""
+Idempotência do webhook: a Evolution API reentrega a mensagem quando o turno
+demora, e cada reentrega viraria outra linha no histórico, outra chamada ao
+Gemini e outra resposta.
+
+- Janela em memória (LRU + TTL) por message_id: reentregas que chegam durante
+  o turno esperam o mesmo resultado; as que chegam depois recebem a resposta
+  guardada na hora.
+- A constraint única em processed_messages garante o mesmo entre réplicas e
+  depois de um restart. Um registro "processing" abandonado (processo caiu no
+  meio do turno) pode ser retomado após MESSAGE_CLAIM_TIMEOUT_SECONDS.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, NamedTuple, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    MESSAGE_DEDUP_MAX_ENTRIES, MESSAGE_DEDUP_TTL_SECONDS,
+    MESSAGE_CLAIM_TIMEOUT_SECONDS, PROCESSED_MESSAGE_RETENTION_DAYS,
+)
+from app.core.database import SessionLocal, AsyncSessionLocal
+from app.models.processed_message import ProcessedMessage
+
+logger = logging.getLogger(__name__)
+
+
+class DedupResult(NamedTuple):
+    response: Optional[str]
+    duplicate: bool
+    status: str   # done, processing (outra réplica ainda está no turno)
+
+
+# --- Registro no banco (funções síncronas; no modo assíncrono rodam via run_sync) ---
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def claim_message(db: Session, message_id: str, phone_number: str) -> Tuple[bool, Optional[ProcessedMessage]]:
+    """
+    Tenta registrar a mensagem como "processing". Retorna (True, None) se este
+    processo ficou com ela; senão (False, registro existente).
+    """
+    now = _now()
+    db.add(ProcessedMessage(message_id=message_id, phone_number=phone_number,
+                            status="processing", claimed_at=now))
+    try:
+        db.commit()
+        return True, None
+    except IntegrityError:
+        db.rollback()
+
+    existing = db.execute(select(ProcessedMessage).where(ProcessedMessage.message_id == message_id)).scalar_one()
+    if existing.status == "processing":
+        # Retoma um registro abandonado; o UPDATE condicional evita que duas réplicas o retomem juntas
+        stale_before = now - timedelta(seconds=MESSAGE_CLAIM_TIMEOUT_SECONDS)
+        result = db.execute(
+            update(ProcessedMessage)
+            .where(ProcessedMessage.id == existing.id, ProcessedMessage.status == "processing",
+                   ProcessedMessage.claimed_at < stale_before)
+            .values(claimed_at=now)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return True, None
+    return False, existing
+
+
+def complete_message(db: Session, message_id: str, response: str):
+    db.execute(update(ProcessedMessage).where(ProcessedMessage.message_id == message_id)
+               .values(status="done", response=response, completed_at=_now()))
+    db.commit()
+
+
+def release_message(db: Session, message_id: str):
+    """Turno falhou: apaga o registro para a próxima reentrega poder processar."""
+    db.execute(delete(ProcessedMessage).where(ProcessedMessage.message_id == message_id,
+                                              ProcessedMessage.status == "processing"))
+    db.commit()
+
+
+def purge_processed_messages(db: Session) -> int:
+    """Remove registros mais antigos que a retenção (a Evolution não reentrega depois disso)."""
+    cutoff = _now() - timedelta(days=PROCESSED_MESSAGE_RETENTION_DAYS)
+    result = db.execute(delete(ProcessedMessage).where(ProcessedMessage.claimed_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+async def _run_db(fn, *args):
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(fn, *args)
+
+    def run_sync():
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+    return await run_in_threadpool(run_sync)
+
+
+# --- Janela em memória ---
+
+class _Entry:
+    def __init__(self, future: asyncio.Future, expires_at: float):
+        self.future = future
+        self.expires_at = expires_at
+
+
+class MessageDeduplicator:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tasks = set()
+        self.stats = {"processed": 0, "memory_hits": 0, "db_hits": 0, "in_flight_joins": 0, "failures": 0}
+
+    def _get(self, message_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(message_id)
+        if entry is None:
+            return None
+        if entry.future.done() and entry.expires_at < time.monotonic():
+            del self._entries[message_id]
+            return None
+        self._entries.move_to_end(message_id)
+        return entry
+
+    def _put(self, message_id: str, future: asyncio.Future) -> _Entry:
+        entry = _Entry(future, time.monotonic() + self.ttl)
+        self._entries[message_id] = entry
+        # Só descarta entradas concluídas; as em andamento saem quando o turno termina
+        while len(self._entries) > self.max_entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            if not oldest.future.done():
+                break
+            del self._entries[oldest_id]
+        return entry
+
+    async def run_once(self, message_id: str, phone_number: str,
+                       run_turn: Callable[[], Awaitable[str]]) -> DedupResult:
+        """Executa o turno uma única vez por message_id; reentregas recebem o mesmo resultado."""
+        entry = self._get(message_id)
+        if entry is not None:
+            if entry.future.done():
+                self.stats["memory_hits"] += 1
+            else:
+                self.stats["in_flight_joins"] += 1
+            return (await asyncio.shield(entry.future))._replace(duplicate=True)
+
+        entry = self._put(message_id, asyncio.get_running_loop().create_future())
+        try:
+            claimed, existing = await _run_db(claim_message, message_id, phone_number)
+        except BaseException as e:
+            self._fail(message_id, entry, e)
+            raise
+        if not claimed:
+            self.stats["db_hits"] += 1
+            result = DedupResult(existing.response, True, existing.status)
+            if existing.status != "done":
+                # Ainda em andamento em outra réplica: não guarda, a próxima reentrega consulta de novo
+                self._entries.pop(message_id, None)
+            entry.future.set_result(result)
+            return result
+
+        # O turno roda numa task própria: se a requisição for cancelada (cliente
+        # desconectou), o turno protegido no coordenador ainda confirma, e é a
+        # task que fecha o registro; a próxima reentrega recebe a resposta guardada
+        task = asyncio.ensure_future(self._process(message_id, entry, run_turn))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return await asyncio.shield(task)
+
+    async def _process(self, message_id: str, entry: _Entry,
+                       run_turn: Callable[[], Awaitable[str]]) -> DedupResult:
+        try:
+            response = await run_turn()
+        except BaseException as e:
+            # Só o turno que falhou libera o registro para a próxima reentrega processar
+            self._fail(message_id, entry, e)
+            await asyncio.shield(_run_db(release_message, message_id))
+            raise
+        try:
+            await _run_db(complete_message, message_id, response)
+        except Exception as e:
+            # O turno já foi confirmado: liberar o registro faria a reentrega repetir o turno
+            logger.error("Erro ao concluir a mensagem %s: %s", message_id, e)
+        self.stats["processed"] += 1
+        result = DedupResult(response, False, "done")
+        entry.future.set_result(result)
+        return result
+
+    def _fail(self, message_id: str, entry: _Entry, e: BaseException):
+        self.stats["failures"] += 1
+        if self._entries.get(message_id) is entry:
+            del self._entries[message_id]
+        if not entry.future.done():
+            if isinstance(e, Exception):
+                entry.future.set_exception(e)
+                entry.future.exception()  # marca como lida quando ninguém mais está esperando
+            else:
+                entry.future.cancel()
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled():
+            task.exception()  # quem esperava pode ter sido cancelado; a falha já foi contada
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self._entries)}
+
+
+message_dedup = MessageDeduplicator(MESSAGE_DEDUP_MAX_ENTRIES, MESSAGE_DEDUP_TTL_SECONDS)
@@ -1,47 +1,202 @@
+import os
 import ollama
 import json
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from app.schemas.lead import LeadUpdate
+from app.core.config import NLU_CACHE_MAX_ENTRIES, NLU_BATCH_CONCURRENCY
+from app.core.outbound import CircuitOpenError, ollama_backend
+from app.core.metrics import observe_stage
+from app.services.rule_extractor import rule_extractor, normalize, count as count_rule_stat
+
+logger = logging.getLogger(__name__)
 
 # O endereço do Ollama rodando no computador host.
 # Usamos 'host.docker.internal' para o contêiner Docker acessar o localhost
-OLLAMA_HOST = "host.docker.internal"
-OLLAMA_PORT = 11434
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "host.docker.internal")
+OLLAMA_PORT = int(os.getenv("OLLAMA_PORT", "11434"))
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+
+# O cliente mantém um pool httpx com keep-alive; o timeout evita chamadas penduradas
+client = ollama.Client(host=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}", timeout=ollama_backend.timeout)
+
+# Chaves que o LLM de extração sabe preencher (e suas descrições no prompt)
+EXTRACTION_KEYS = {
+    "location": "string",
+    "property_type": "string, ex: 'casa', 'apartamento', 'cobertura'",
+    "bedrooms": "integer",
+    "parking_spots": "integer",
+    "investment_range": "string",
+}
+
+
+def extraction_key(text: str, current_data: Optional[dict] = None) -> str:
+    """Hash do texto normalizado (sem acentos/caixa/espaços extras) com os dados atuais do lead."""
+    normalized = " ".join(normalize(text).split())
+    payload = json.dumps([normalized, current_data or {}], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """LRU em memória com os campos extraídos por chave de extração."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return data
+
+    def put(self, key: str, data: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._items), "max_entries": self.max_entries}
+
+
+extraction_cache = ExtractionCache(NLU_CACHE_MAX_ENTRIES)
+
+
+def extract_lead_info_from_text(text: str, current_data: Optional[dict] = None) -> LeadUpdate:
+    """
+    Extrai as preferências do cliente de um texto no formato do LeadUpdate.
+    Resultados ficam em cache pelo texto normalizado e pelos dados atuais do lead.
+    """
+    key = extraction_key(text, current_data)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return LeadUpdate(**cached)
+
+    data, error = _extract(text, current_data)
+    if error is None:
+        extraction_cache.put(key, data)
+    return LeadUpdate(**data)
 
-client = ollama.Client(host=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}")
 
-def extract_lead_info_from_text(text: str) -> LeadUpdate:
+def extract_lead_info_batch(items: List[Tuple[str, Optional[dict]]],
+                            concurrency: int = NLU_BATCH_CONCURRENCY) -> Tuple[List[LeadUpdate], dict]:
     """
-    Usa o Mistral via Ollama para extrair informações de um texto
-    e retorná-las no formato do nosso schema LeadUpdate.
+    Extrai vários textos de uma vez. Entradas repetidas são analisadas uma única
+    vez e as distintas vão ao Ollama em paralelo, limitadas por `concurrency`.
+    Retorna os resultados na ordem de entrada e um resumo (únicos, acertos de cache,
+    falhas). Itens cujo Ollama falhou trazem só os campos das regras e aparecem em
+    `errors` (índice -> motivo). Com o circuito do Ollama aberto, lança CircuitOpenError
+    antes de processar: o lote inteiro sairia só com as regras.
     """
+    keys = [extraction_key(text, current_data) for text, current_data in items]
+    results = {}
+    pending = {}
+    for key, (text, current_data) in zip(keys, items):
+        if key in results or key in pending:
+            continue
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = (text, current_data)
+
+    if pending and ollama_backend.breaker.retry_after() > 0:
+        raise CircuitOpenError(f"Circuito aberto para '{ollama_backend.name}', lote recusado.")
+
+    errors = {}
+    # Deixa ao menos uma vaga do bulkhead do Ollama para o tráfego ao vivo
+    workers = max(1, min(concurrency, ollama_backend.max_concurrency - 1, len(pending) or 1))
+    if pending:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nlu-batch") as executor:
+            futures = {key: executor.submit(_extract, text, current_data)
+                       for key, (text, current_data) in pending.items()}
+            for key, future in futures.items():
+                data, error = future.result()
+                if error is None:
+                    extraction_cache.put(key, data)
+                else:
+                    errors[key] = error
+                results[key] = data
+
+    summary = {"total": len(items), "unique": len(results), "cache_hits": len(results) - len(pending),
+               "failed": len(errors)}
+    if errors:
+        summary["errors"] = {index: errors[key] for index, key in enumerate(keys) if key in errors}
+    return [LeadUpdate(**results[key]) for key in keys], summary
+
+
+def _extract(text: str, current_data: Optional[dict]) -> Tuple[dict, Optional[str]]:
+    """
+    Regras determinísticas primeiro; o Mistral (via Ollama) só é chamado para as
+    chaves que as regras não resolveram com confiança. Retorna (campos, erro): o
+    erro é None ou a descrição da falha do Ollama, e nesse caso só vêm os campos
+    das regras.
+    """
+    rules = rule_extractor.extract(text)
+    rule_fields = rules.confident_fields()
+    count_rule_stat("messages")
+    count_rule_stat("fields_from_rules", len(rule_fields))
+
+    missing_keys = [key for key in EXTRACTION_KEYS if key not in rule_fields]
+    if rules.covers_message() or not missing_keys:
+        count_rule_stat("llm_calls_saved")
+        return rule_fields, None
+
+    count_rule_stat("llm_calls")
+    try:
+        llm_data = _extract_with_llm(text, missing_keys, current_data)
+    except Exception as e:
+        logger.error("Erro ao analisar texto com Ollama: %s", e)
+        # Falhas não entram no cache: a próxima vez tenta o LLM de novo
+        return rule_fields, f"{type(e).__name__}: {e}"
+    # Campos confiáveis das regras prevalecem sobre o que o LLM devolver
+    return {**llm_data, **rule_fields}, None
+
+
+def _extract_with_llm(text: str, keys, current_data: Optional[dict] = None) -> dict:
+    """Usa o Mistral via Ollama para extrair apenas as chaves pedidas."""
+    key_lines = "\n".join(f"    - {key} ({EXTRACTION_KEYS[key]})" for key in keys)
+    known = json.dumps(current_data or {}, ensure_ascii=False, default=str)
     prompt = f"""
     Analise o texto a seguir e extraia as informações sobre as preferências de um cliente imobiliário.
     O texto é: "{text}"
 
+    Informações que já temos do cliente: {known}
+    Só inclua uma dessas chaves se o texto trouxer um valor novo ou diferente.
+
     Retorne um JSON contendo apenas as chaves que você conseguir identificar no texto. As chaves possíveis são:
-    - location (string)
-    - property_type (string, ex: 'casa', 'apartamento', 'cobertura')
-    - bedrooms (integer)
-    - parking_spots (integer)
-    - investment_range (string)
+{key_lines}
 
     Se você não encontrar uma informação, não inclua a chave no JSON.
     Exemplo de retorno: {{"location": "Balneário Camboriú", "bedrooms": 4}}
     """
 
-    try:
-        response = client.chat(
-            model='mistral',
+    with observe_stage("ollama_extraction"):
+        response = ollama_backend.call(
+            client.chat,
+            model=OLLAMA_MODEL,
             messages=[{'role': 'user', 'content': prompt}],
             format='json'
         )
 
-        response_json_str = response['message']['content']
-        data = json.loads(response_json_str)
+    response_json_str = response['message']['content']
+    data = json.loads(response_json_str)
+    data = {key: value for key, value in data.items() if key in keys}
 
-        lead_update_data = LeadUpdate(**data)
-        return lead_update_data
-
-    except Exception as e:
-        print(f"Erro ao analisar texto com Ollama: {e}")
-        return LeadUpdate()
\ No newline at end of file
+    # Valida os tipos pelo schema antes de guardar
+    return LeadUpdate(**data).model_dump(exclude_unset=True)
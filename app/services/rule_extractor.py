@@ -0,0 +1,206 @@
+"""
+Extrator determinístico (regex + gazetteer) para mensagens simples como
+"3 quartos em Itapema". Preenche campos do LeadUpdate com uma confiança
+por campo; o LLM só é chamado para o que as regras não resolveram.
+"""
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import NLU_RULES_MIN_CONFIDENCE, NLU_RULES_MAX_RESIDUAL_WORDS
+from app.models.broker import Broker
+from app.schemas.lead import LeadUpdate
+
+# Regiões atendidas (as dos corretores são somadas no startup) e vizinhas frequentes
+DEFAULT_REGIONS = [
+    "Balneário Camboriú", "Florianópolis", "Itapema", "Camboriú", "Itajaí", "Porto Belo",
+    "Bombinhas", "Navegantes", "Penha", "Governador Celso Ramos", "São José", "Palhoça",
+    "Joinville", "Blumenau", "Jurerê Internacional",
+]
+REGION_ALIASES = {"Floripa": "Florianópolis", "BC": "Balneário Camboriú", "Balneário": "Balneário Camboriú"}
+
+# Sinônimo normalizado -> (tipo canônico, confiança)
+PROPERTY_TYPES = {
+    "apartamento": ("apartamento", 0.95), "apartamentos": ("apartamento", 0.95),
+    "apto": ("apartamento", 0.9), "ape": ("apartamento", 0.85),
+    "casa": ("casa", 0.9), "casas": ("casa", 0.9), "sobrado": ("casa", 0.85),
+    "cobertura": ("cobertura", 0.95), "coberturas": ("cobertura", 0.95),
+    "terreno": ("terreno", 0.95), "terrenos": ("terreno", 0.95), "lote": ("terreno", 0.85),
+    "studio": ("studio", 0.9), "estudio": ("studio", 0.85), "kitnet": ("studio", 0.85), "loft": ("loft", 0.9),
+    "sala comercial": ("sala comercial", 0.95),
+}
+
+NUMBER_WORDS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+    "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10,
+}
+# "Nenhuma vaga" é uma resposta (zero), mas de sentido negativo: vale 0 com
+# confiança abaixo do limiar, então a mensagem continua indo para o LLM
+ZERO_WORDS = {"nenhum", "nenhuma", "zero"}
+# Limites de palavra dos dois lados: "algum quarto" não é "um quarto" e "103 quartos" não é "3"
+_NUMBER = r"\b(\d{1,2}|" + "|".join(list(NUMBER_WORDS) + sorted(ZERO_WORDS)) + r")\b"
+
+_BEDROOMS_RE = re.compile(_NUMBER + r"\s*(?:quartos?|dormitorios?|dorms?|suites?)\b")
+_PARKING_RE = re.compile(_NUMBER + r"\s*vagas?(?:\s+de\s+garagem)?\b")
+# "metros" sozinho costuma ser distância ("a 200 metros da praia"), não área
+_AREA_RE = re.compile(r"(\d{2,4})\s*(?:m2|m²|metros\s+quadrados)\b")
+_MONEY = r"(?:r\$\s*)?\d+(?:[.,]\d+)?\s*(?:mil|milhoes|milhao|mi|k)\b"
+_INVESTMENT_RE = re.compile(
+    r"(?:(?:entre|de)\s+" + _MONEY + r"\s+(?:a|e|ate)\s+" + _MONEY + r"|(?:ate|no maximo|uns|por volta de)\s+" + _MONEY
+    + r"|" + _MONEY + r")"
+)
+_NEGATION_RE = re.compile(r"\b(?:nao|nem|sem)\s+(?:\w+\s+)?$")
+
+# Palavras que não carregam informação de qualificação (ignoradas no resíduo)
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas", "um", "uma",
+    "e", "ou", "com", "para", "pra", "por", "que", "eu", "meu", "minha", "quero", "queria", "gostaria",
+    "procuro", "procurando", "busco", "buscando", "preciso", "tipo", "sim", "ok", "oi", "ola", "bom",
+    "boa", "dia", "tarde", "noite", "obrigado", "obrigada", "entao", "mais", "ou", "menos", "algo",
+    "ate", "entre", "reais", "imovel", "regiao", "cidade", "perto", "centro",
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos, para comparar com o gazetteer e as regex."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@dataclass
+class RuleExtraction:
+    update: LeadUpdate
+    confidence: Dict[str, float] = field(default_factory=dict)
+    residual_words: List[str] = field(default_factory=list)
+    has_negation: bool = False
+
+    def confident_fields(self, threshold: float = NLU_RULES_MIN_CONFIDENCE) -> Dict[str, object]:
+        data = self.update.model_dump(exclude_unset=True)
+        return {k: v for k, v in data.items() if self.confidence.get(k, 0) >= threshold}
+
+    def covers_message(self) -> bool:
+        """Verdadeiro quando as regras explicam a mensagem e o LLM não teria mais o que extrair."""
+        # Negações ("não quero casa") mudam o sentido da frase e números que as regras
+        # não explicaram ("103 quartos") indicam algo não entendido: ficam sempre com o LLM
+        return (
+            bool(self.confident_fields())
+            and not self.has_negation
+            and not any(ch.isdigit() for word in self.residual_words for ch in word)
+            and len(self.residual_words) <= NLU_RULES_MAX_RESIDUAL_WORDS
+        )
+
+
+class RuleExtractor:
+    def __init__(self, regions):
+        self._lock = threading.Lock()
+        self._regions: Dict[str, str] = {}
+        self._region_re = None
+        self.add_regions(regions, REGION_ALIASES)
+        property_terms = sorted(PROPERTY_TYPES, key=len, reverse=True)
+        self._property_re = re.compile(r"\b(" + "|".join(re.escape(t) for t in property_terms) + r")\b")
+
+    def add_regions(self, regions, aliases=None):
+        with self._lock:
+            for region in regions:
+                if region:
+                    self._regions[normalize(region)] = region
+            for alias, region in (aliases or {}).items():
+                self._regions[normalize(alias)] = region
+            # Nomes mais longos primeiro: "balneario camboriu" antes de "camboriu"
+            terms = sorted(self._regions, key=len, reverse=True)
+            self._region_re = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b")
+
+    @staticmethod
+    def _to_int(token: str) -> Tuple[int, float]:
+        if token.isdigit():
+            return int(token), 0.95
+        if token in ZERO_WORDS:
+            return 0, 0.5
+        return NUMBER_WORDS[token], 0.9
+
+    @staticmethod
+    def _negated(text: str, start: int) -> bool:
+        return bool(_NEGATION_RE.search(text[max(0, start - 20):start]))
+
+    def extract(self, text: str) -> RuleExtraction:
+        norm = normalize(text)
+        data, confidence, spans = {}, {}, []
+
+        def first(pattern):
+            # Primeira ocorrência que não esteja negada ("não quero casa")
+            for match in pattern.finditer(norm):
+                if not self._negated(norm, match.start()):
+                    return match
+            return None
+
+        def take(key, value, conf, match):
+            data[key] = value
+            confidence[key] = conf
+            spans.append(match.span())
+
+        matches = [m for m in self._region_re.finditer(norm) if not self._negated(norm, m.start())]
+        if matches:
+            # Duas regiões na mesma frase ("moro em Florianópolis mas quero em Itapema"):
+            # qual delas é o interesse fica para o LLM
+            ambiguous = len({self._regions[m.group(1)] for m in matches}) > 1
+            take("location", self._regions[matches[0].group(1)], 0.4 if ambiguous else 0.9, matches[0])
+
+        match = first(self._property_re)
+        if match:
+            canonical, conf = PROPERTY_TYPES[match.group(1)]
+            take("property_type", canonical, conf, match)
+
+        match = first(_BEDROOMS_RE)
+        if match:
+            value, conf = self._to_int(match.group(1))
+            take("bedrooms", value, conf, match)
+
+        match = first(_PARKING_RE)
+        if match:
+            value, conf = self._to_int(match.group(1))
+            take("parking_spots", value, conf, match)
+
+        match = first(_AREA_RE)
+        if match:
+            take("min_area_sqm", int(match.group(1)), 0.85, match)
+
+        match = first(_INVESTMENT_RE)
+        if match:
+            # Mantém o trecho do texto original (com acentos) como faixa de investimento
+            take("investment_range", text[match.start():match.end()].strip(), 0.85, match)
+
+        residual = norm
+        for start, end in sorted(spans, reverse=True):
+            residual = residual[:start] + " " + residual[end:]
+        residual_words = [w for w in re.findall(r"[a-z0-9]+", residual) if w not in STOPWORDS and len(w) > 1]
+
+        has_negation = bool(re.search(r"\b(?:nao|nem|sem|nenhum|nenhuma)\b", norm))
+        return RuleExtraction(LeadUpdate(**data), confidence, residual_words, has_negation)
+
+
+rule_extractor = RuleExtractor(DEFAULT_REGIONS)
+
+# Contadores para medir quanto o extrator economiza de chamadas ao LLM
+_stats_lock = threading.Lock()
+rule_stats = {
+    "messages": 0,                # mensagens analisadas pelas regras
+    "fields_from_rules": 0,       # campos preenchidos pelas regras
+    "llm_calls": 0,               # chamadas ao LLM de extração que ainda foram necessárias
+    "llm_calls_saved": 0,         # chamadas ao LLM de extração dispensadas
+    "gemini_fields_prefilled": 0, # campos entregues prontos ao Gemini na conversa
+}
+
+
+def count(key: str, amount: int = 1):
+    with _stats_lock:
+        rule_stats[key] += amount
+
+
+def load_regions_from_db(db: Session):
+    """Acrescenta ao gazetteer as regiões de especialidade dos corretores cadastrados."""
+    regions = [region for (region,) in db.query(Broker.specialty_region).all()]
+    rule_extractor.add_regions(regions)
@@ -0,0 +1,87 @@
+"""
+Leitura incremental da resposta do Gemini em streaming: extrai o texto de
+"response_text" de um JSON que chega em pedaços e o separa em frases
+completas (para o TTS poder começar antes do fim da resposta).
+"""
+import re
+from typing import List, Optional
+
+_KEY_RE = re.compile(r'"response_text"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_SENTENCE_END_RE = re.compile(r'[.!?…]+["\')»]*\s+')
+
+
+class ResponseTextStreamer:
+    """Devolve, a cada pedaço recebido, o trecho novo do valor de "response_text"."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = _KEY_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, out = self._buffer, self._pos, []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Sequência de escape: se ainda estiver incompleta, espera o próximo pedaço
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != "u":
+                out.append(_ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # Par substituto (ex: emoji) ocupa dois escapes \uXXXX
+                if i + 12 > len(buf):
+                    break
+                low = int(buf[i + 8:i + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                i += 6
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+
+class SentenceBuffer:
+    """Acumula texto e libera cada frase assim que ela termina."""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._pending += text
+        sentences = []
+        while True:
+            match = _SENTENCE_END_RE.search(self._pending)
+            if not match:
+                break
+            sentence = self._pending[:match.end()].strip()
+            self._pending = self._pending[match.end():]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest, self._pending = self._pending.strip(), ""
+        return rest or None
@@ -0,0 +1,309 @@
+"""
+Pool de processos dedicado à transcrição com faster-whisper.
+
+Cada worker carrega o modelo uma única vez (no initializer) e o pool é
+aquecido no startup, então a primeira nota de voz após o deploy não paga o
+carregamento. A fila é limitada: quando cheia, a API responde 429.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.core.config import (
+    WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, WHISPER_WORKERS,
+    WHISPER_CPU_THREADS, WHISPER_MAX_QUEUE, WHISPER_JOB_TIMEOUT_SECONDS,
+    WHISPER_CHUNKED_MIN_SECONDS, WHISPER_CHUNK_SECONDS, WHISPER_MIN_SILENCE_MS, WHISPER_DECODING,
+)
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+# Modelo carregado dentro de cada processo worker
+_worker_model = None
+# Último áudio decodificado no worker (trechos do mesmo arquivo reaproveitam a decodificação)
+_decoded_audio = (None, None)
+
+
+def _init_worker(model_size: str, device: str, compute_type: str, cpu_threads: int):
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _warmup_job() -> int:
+    return os.getpid()
+
+
+def _transcribe_job(audio_file_path: str, beam_size: int):
+    started_at = time.perf_counter()
+    segments, info = _worker_model.transcribe(audio_file_path, language="pt", beam_size=beam_size)
+    transcribed_text = "".join(segment.text for segment in segments)
+    return transcribed_text.strip(), time.perf_counter() - started_at
+
+
+def beam_size_for(decoding: str = None) -> int:
+    """Greedy (beam_size=1) troca um pouco de precisão por velocidade."""
+    return 1 if (decoding or WHISPER_DECODING) == "greedy" else 5
+
+
+def _load_audio(audio_file_path: str):
+    global _decoded_audio
+    if _decoded_audio[0] != audio_file_path:
+        from faster_whisper.audio import decode_audio
+        _decoded_audio = (audio_file_path, decode_audio(audio_file_path, sampling_rate=SAMPLING_RATE))
+    return _decoded_audio[1]
+
+
+def _split_job(audio_file_path: str, min_seconds: float, chunk_seconds: float, min_silence_ms: int):
+    """
+    Decide os trechos de um áudio longo. Usa o VAD do faster-whisper e só corta
+    entre falas (nos silêncios); uma fala maior que o trecho máximo é cortada no limite.
+    Retorna uma lista de (início, fim) em segundos.
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    audio = _load_audio(audio_file_path)
+    duration = len(audio) / SAMPLING_RATE
+    if duration <= min_seconds:
+        return [(0.0, duration)]
+
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=min_silence_ms))
+    chunks = []
+    chunk_start = chunk_end = None
+    for segment in speech:
+        start, end = segment["start"] / SAMPLING_RATE, segment["end"] / SAMPLING_RATE
+        if chunk_start is not None and end - chunk_start > chunk_seconds:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        # Fala contínua longa demais: corta no limite do trecho
+        while end - chunk_start > chunk_seconds:
+            chunks.append((chunk_start, chunk_start + chunk_seconds))
+            chunk_start += chunk_seconds
+        chunk_end = end
+    if chunk_start is not None:
+        chunks.append((chunk_start, chunk_end))
+    return chunks
+
+
+def _transcribe_chunk_job(audio_file_path: str, start: float, end: float, beam_size: int) -> str:
+    audio = _load_audio(audio_file_path)
+    chunk = audio[int(start * SAMPLING_RATE):int(end * SAMPLING_RATE)]
+    segments, info = _worker_model.transcribe(chunk, language="pt", beam_size=beam_size, vad_filter=False)
+    return "".join(segment.text for segment in segments).strip()
+
+
+class TranscriptionQueueFull(Exception):
+    """A fila de transcrição atingiu o limite configurado."""
+
+
+class TranscriptionUnavailable(TranscriptionQueueFull):
+    """O pool de transcrição ainda não foi iniciado (boot) ou já foi encerrado."""
+
+
+class TranscriptionPool:
+    def __init__(self, workers: int, max_queue: int, job_timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.warmed = False
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0, "wait_total_ms": 0.0, "run_total_ms": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self, warmup: bool = True, block: bool = False):
+        """Cria o pool; com `block` o aquecimento roda na thread de quem chamou."""
+        if not self.enabled:
+            return
+        if self._executor is not None:
+            # Já iniciado: só repete o aquecimento se o anterior falhou
+            if warmup and block and not self.warmed:
+                self._warmup()
+            return
+        # "spawn" evita herdar threads/locks do processo da API
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS),
+        )
+        if warmup and block:
+            self._warmup()
+        elif warmup:
+            threading.Thread(target=self._warmup, name="whisper-warmup", daemon=True).start()
+
+    def _warmup(self):
+        # Um job por worker força a criação de todos os processos (e o carregamento do modelo)
+        started_at = time.perf_counter()
+        futures = [self._executor.submit(_warmup_job) for _ in range(self.workers)]
+        done, _ = wait(futures)
+        pids = {f.result() for f in done if f.exception() is None}
+        self.warmed = bool(pids)
+        if not pids:
+            logger.error("Nenhum worker de transcrição carregou o modelo '%s'.", WHISPER_MODEL_SIZE)
+            return
+        logger.info("Pool de transcrição aquecido: %s worker(s) com o modelo '%s' em %.1fs.",
+                    len(pids), WHISPER_MODEL_SIZE, time.perf_counter() - started_at)
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._in_flight >= self.max_queue
+
+    def _release_slot(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self._slot_free.notify()
+
+    def _take_slot(self, block: bool, timeout: float = None) -> bool:
+        with self._lock:
+            if block:
+                self._slot_free.wait_for(lambda: self._in_flight < self.max_queue,
+                                         timeout=self.job_timeout if timeout is None else timeout)
+            if self._in_flight >= self.max_queue:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _acquire_slot(self, block: bool, timeout: float = None):
+        if not self._take_slot(block, timeout):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise TranscriptionQueueFull("Fila de transcrição cheia, tente novamente em instantes.")
+
+    def _submit(self, fn, *args):
+        """Submete um job com a vaga já reservada; ela só volta quando o worker termina ou o job é cancelado."""
+        executor = self._executor
+        if executor is None:
+            self._release_slot(None)
+            raise TranscriptionUnavailable("Pool de transcrição indisponível, tente novamente em instantes.")
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release_slot(None)
+            raise
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def transcribe(self, audio_file_path: str, beam_size: int = 5, block: bool = False) -> str:
+        """
+        Transcreve num worker. Com a fila cheia, lança TranscriptionQueueFull;
+        com `block=True` (jobs em segundo plano) espera uma vaga até o timeout.
+        """
+        self._acquire_slot(block)
+        submitted_at = time.perf_counter()
+        future = self._submit(_transcribe_job, audio_file_path, beam_size)
+
+        try:
+            transcribed_text, run_seconds = future.result(timeout=self.job_timeout)
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+
+        total_seconds = time.perf_counter() - submitted_at
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["run_total_ms"] += run_seconds * 1000
+            self._stats["wait_total_ms"] += max(0.0, total_seconds - run_seconds) * 1000
+        return transcribed_text
+
+    def transcribe_chunked(self, audio_file_path: str, beam_size: int = 5, block: bool = False,
+                           on_partial=None) -> str:
+        """
+        Modo para áudios longos: divide nos silêncios e transcreve os trechos em
+        paralelo nos workers, juntando o texto na ordem original. `on_partial`
+        recebe (trechos_prontos, total, texto_parcial) sempre que o prefixo
+        contínuo de trechos prontos avança, para publicar transcrições parciais.
+
+        Cada job submetido (a divisão e cada trecho) ocupa uma vaga da fila: os
+        trechos entram conforme há vagas livres, sem passar do WHISPER_MAX_QUEUE.
+        """
+        self._acquire_slot(block)
+        submitted_at = time.perf_counter()
+        running = {}
+        try:
+            split = self._submit(_split_job, audio_file_path, WHISPER_CHUNKED_MIN_SECONDS, WHISPER_CHUNK_SECONDS,
+                                 WHISPER_MIN_SILENCE_MS)
+            running[split] = None
+            chunks = split.result(timeout=self.job_timeout)
+            running.clear()
+
+            texts = [None] * len(chunks)
+            queued = list(enumerate(chunks))
+            ready_prefix = 0
+            deadline = time.monotonic() + self.job_timeout
+            while queued or running:
+                while queued:
+                    # Sem trecho em andamento espera uma vaga; com trechos rodando, só ocupa as que estão livres
+                    if not running:
+                        # Prazo esgotado (ou vencido à espera da vaga) é timeout, não fila cheia
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._take_slot(True, timeout=remaining):
+                            raise TimeoutError(f"Transcrição em trechos excedeu {self.job_timeout}s.")
+                    elif not self._take_slot(False):
+                        break
+                    index, (start, end) = queued.pop(0)
+                    running[self._submit(_transcribe_chunk_job, audio_file_path, start, end, beam_size)] = index
+
+                done, _ = wait(running, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"Transcrição em trechos excedeu {self.job_timeout}s.")
+                for future in done:
+                    texts[running.pop(future)] = future.result()
+                previous_prefix = ready_prefix
+                while ready_prefix < len(texts) and texts[ready_prefix] is not None:
+                    ready_prefix += 1
+                if on_partial and ready_prefix > previous_prefix:
+                    on_partial(ready_prefix, len(texts), " ".join(t for t in texts[:ready_prefix] if t))
+        except Exception:
+            # Trechos que ainda não começaram saem da fila (e devolvem a vaga); os que já rodam terminam sozinhos
+            for future in running:
+                future.cancel()
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["run_total_ms"] += (time.perf_counter() - submitted_at) * 1000
+        return " ".join(t for t in texts if t).strip()
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            in_flight = self._in_flight
+        completed = data["completed"]
+        return {
+            "enabled": self.enabled,
+            "warmed": self.warmed,
+            "workers": self.workers,
+            "model_size": WHISPER_MODEL_SIZE,
+            "compute_type": WHISPER_COMPUTE_TYPE,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queue_depth": max(0, in_flight - self.workers),
+            "completed": completed,
+            "failed": data["failed"],
+            "rejected": data["rejected"],
+            "avg_wait_ms": round(data["wait_total_ms"] / completed, 1) if completed else 0.0,
+            "avg_run_ms": round(data["run_total_ms"] / completed, 1) if completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+transcription_pool = TranscriptionPool(WHISPER_WORKERS, WHISPER_MAX_QUEUE, WHISPER_JOB_TIMEOUT_SECONDS)
@@ -0,0 +1,112 @@
+import hashlib
+import io
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.core.config import TTS_CACHE_MAX_BYTES, TTS_CACHE_BUCKET
+from app.core.minio_client import get_minio_client
+from app.core.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+    """Chave de conteúdo: o mesmo texto com a mesma voz/modelo/ajustes gera o mesmo áudio."""
+    payload = json.dumps([text, voice_id, model_id, voice_settings], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioLRUCache:
+    """LRU em memória limitado pelo total de bytes armazenados."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is not None:
+                self._items.move_to_end(key)
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._items[key] = audio
+            self.current_bytes += len(audio)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+class TTSCache:
+    """
+    Cache de dois níveis para o áudio gerado: memória local primeiro e,
+    em seguida, o bucket do MinIO compartilhado entre réplicas.
+    """
+
+    def __init__(self, max_bytes: int, bucket_name: str):
+        self.memory = AudioLRUCache(max_bytes)
+        self.bucket_name = bucket_name
+        self.stats = {"memory_hits": 0, "storage_hits": 0, "misses": 0}
+        # Uploads para o MinIO saem do caminho da requisição
+        self._uploader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts-cache-upload")
+
+    def _object_name(self, key: str) -> str:
+        return f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[bytes]:
+        audio = self.memory.get(key)
+        if audio is not None:
+            self.stats["memory_hits"] += 1
+            return audio
+
+        response = None
+        try:
+            response = get_minio_client().get_object(self.bucket_name, self._object_name(key))
+            audio = response.read()
+        except Exception as e:
+            # NoSuchKey é o caso comum (áudio ainda não gerado); outras falhas só viram miss
+            if getattr(e, "code", None) != "NoSuchKey":
+                logger.warning("Erro ao ler áudio do cache no MinIO: %s", e)
+            audio = None
+        finally:
+            if response is not None:
+                response.close()
+                response.release_conn()
+
+        if audio is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["storage_hits"] += 1
+        self.memory.put(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        self.memory.put(key, audio)
+        self._uploader.submit(self._upload, key, audio)
+
+    def _upload(self, key: str, audio: bytes):
+        try:
+            with observe_stage("minio_upload"):
+                get_minio_client().put_object(
+                    self.bucket_name, self._object_name(key), data=io.BytesIO(audio),
+                    length=len(audio), content_type="audio/mpeg"
+                )
+        except Exception as e:
+            logger.warning("Erro ao gravar áudio no cache do MinIO: %s", e)
+
+
+tts_cache = TTSCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_BUCKET)
@@ -0,0 +1,145 @@
+"""
+Coordenação dos turnos de conversa por lead (no event loop de cada processo).
+
+- Debounce: mensagens do mesmo lead que chegam em sequência entram num lote
+  e geram uma única chamada ao LLM com o texto combinado.
+- Serialização: um lead nunca tem dois turnos ao mesmo tempo; leads
+  diferentes continuam em paralelo. Mensagens que chegam enquanto o turno
+  anterior roda entram no lote seguinte.
+
+Entre réplicas não há lock no banco (ele prenderia uma conexão durante a chamada
+ao LLM): o UPDATE do lead é condicionado ao updated_at lido no turno
+(lead_service.apply_turn_update_async) e não sobrescreve uma escrita concorrente.
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from app.core.config import TURN_DEBOUNCE_SECONDS, TURN_MAX_WAIT_SECONDS
+
+
+class TurnOutcome(NamedTuple):
+    result: object
+    batch_size: int   # mensagens atendidas por este turno
+    is_last: bool     # a mensagem desta chamada foi a última do lote (é ela quem responde)
+
+
+class _Batch:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.messages: List[str] = []
+        self.future = loop.create_future()
+        self.started_at = loop.time()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.firing = False
+
+
+class _LeadState:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.batch: Optional[_Batch] = None
+        self.users = 0
+
+
+def join_messages(messages: List[str]) -> str:
+    return "\n".join(message.strip() for message in messages if message.strip())
+
+
+class LeadTurnCoordinator:
+    def __init__(self, debounce_seconds: float, max_wait_seconds: float):
+        self.debounce_seconds = max(0.0, debounce_seconds)
+        self.max_wait_seconds = max(self.debounce_seconds, max_wait_seconds)
+        self._states: Dict[str, _LeadState] = {}
+        self._tasks = set()
+        self._stats_lock = threading.Lock()
+        self.stats = {"messages": 0, "turns": 0, "coalesced_messages": 0, "failed_turns": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _enter(self, lead_key: str) -> _LeadState:
+        state = self._states.setdefault(lead_key, _LeadState())
+        state.users += 1
+        return state
+
+    def _leave(self, lead_key: str, state: _LeadState):
+        state.users -= 1
+        if state.users == 0 and state.batch is None and not state.lock.locked():
+            self._states.pop(lead_key, None)
+
+    async def submit(self, lead_key: str, message: str,
+                     run_turn: Callable[[str], Awaitable[object]]) -> TurnOutcome:
+        """
+        Coloca a mensagem no lote do lead e espera o turno que a atende.
+        `run_turn` recebe o texto combinado do lote e devolve o resultado do turno.
+        """
+        loop = asyncio.get_running_loop()
+        state = self._enter(lead_key)
+        self._count("messages")
+        try:
+            batch = state.batch
+            if batch is None:
+                batch = state.batch = _Batch(loop)
+            batch.messages.append(message)
+            position = len(batch.messages)
+            if not batch.firing:
+                self._schedule(loop, state, batch, run_turn)
+            # shield: se um cliente desconectar, o turno continua para os demais do lote
+            result = await asyncio.shield(batch.future)
+            return TurnOutcome(result, len(batch.messages), position == len(batch.messages))
+        finally:
+            self._leave(lead_key, state)
+
+    @asynccontextmanager
+    async def serialized(self, lead_key: str):
+        """Só serializa (sem debounce): usado pelo streaming, que responde a uma mensagem por vez."""
+        state = self._enter(lead_key)
+        try:
+            async with state.lock:
+                yield
+        finally:
+            self._leave(lead_key, state)
+
+    def _schedule(self, loop, state: _LeadState, batch: _Batch, run_turn):
+        if batch.timer is not None:
+            batch.timer.cancel()
+        remaining = batch.started_at + self.max_wait_seconds - loop.time()
+        delay = max(0.0, min(self.debounce_seconds, remaining))
+        batch.timer = loop.call_later(delay, self._start, state, batch, run_turn)
+
+    def _start(self, state: _LeadState, batch: _Batch, run_turn):
+        batch.firing = True
+        task = asyncio.ensure_future(self._fire(state, batch, run_turn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fire(self, state: _LeadState, batch: _Batch, run_turn):
+        # o lote continua aberto enquanto espera o turno anterior do lead terminar
+        async with state.lock:
+            if state.batch is batch:
+                state.batch = None
+            self._count("turns")
+            self._count("coalesced_messages", len(batch.messages) - 1)
+            try:
+                result = await run_turn(join_messages(batch.messages))
+            except BaseException as e:
+                self._count("failed_turns")
+                if not batch.future.done():
+                    batch.future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                batch.future.set_result(result)
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["llm_calls_saved"] = stats["coalesced_messages"]
+        stats["active_leads"] = len(self._states)
+        stats["debounce_seconds"] = self.debounce_seconds
+        stats["max_wait_seconds"] = self.max_wait_seconds
+        return stats
+
+
+turn_coordinator = LeadTurnCoordinator(TURN_DEBOUNCE_SECONDS, TURN_MAX_WAIT_SECONDS)
@@ -0,0 +1,36 @@
+"""
+Processo dedicado ao agendador (follow-ups), para a API escalar sozinha.
+
+Uso: `python -m app.worker`, com SCHEDULER_MODE=off nas réplicas da API.
+Vários workers podem rodar ao mesmo tempo: só o líder eleito executa os jobs.
+"""
+import asyncio
+import logging
+import signal
+
+from app.core.logging_setup import setup_logging
+
+setup_logging()
+
+from app.models import lead, followup, broker, conversation, job
+from app.scheduler import start_scheduler, stop_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    start_scheduler()
+    logger.info("Worker do agendador iniciado.")
+    await stop_event.wait()
+
+    await stop_scheduler()
+    logger.info("Worker do agendador encerrado.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
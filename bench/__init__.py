@@ -0,0 +1 @@
+"""Benchmark offline da API com provedores externos falsos (ver bench/README.md)."""
@@ -0,0 +1,290 @@
+"""
+Servidores falsos para Gemini, ElevenLabs, Ollama e MinIO, com latência e taxa
+de erro configuráveis. Falam o suficiente de cada protocolo para os clientes
+usados pela API (SDK do Gemini via REST, requests, ollama-python e minio-py).
+
+Uso isolado: `python -m bench.fakes --gemini-latency-ms 800 --gemini-error-rate 0.02`
+(normalmente quem sobe estes servidores é o bench.run).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Dict
+from xml.sax.saxutils import escape
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SERVICES = ("gemini", "elevenlabs", "ollama", "minio")
+
+# Latência padrão de cada serviço (ms), próxima do observado em produção
+DEFAULT_LATENCY_MS = {"gemini": 900, "elevenlabs": 600, "ollama": 700, "minio": 15}
+DEFAULT_PORTS = {"gemini": 18081, "elevenlabs": 18082, "ollama": 18083, "minio": 18084}
+
+
+@dataclass
+class FaultProfile:
+    latency_ms: float
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    async def delay(self, fraction: float = 1.0):
+        seconds = max(0.0, random.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms)
+        await asyncio.sleep(seconds * fraction / 1000)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+# --- Gemini (API REST v1beta: generateContent e streamGenerateContent) ---
+
+GEMINI_REPLIES = [
+    ({"location": "Balneário Camboriú"}, "Ótimo, Balneário Camboriú é uma excelente escolha! Quantos quartos você procura?"),
+    ({"bedrooms": 3}, "Perfeito, três quartos. E quantas vagas de garagem seriam ideais?"),
+    ({"parking_spots": 2}, "Anotado! Qual faixa de investimento você tem em mente?"),
+    ({}, "Entendi. Pode me contar um pouco mais sobre o que é essencial no seu novo imóvel?"),
+]
+
+
+def gemini_app(profile: FaultProfile) -> FastAPI:
+    app = FastAPI()
+
+    def reply_for(body: dict) -> dict:
+        prompt = json.dumps(body.get("contents", ""), ensure_ascii=False)
+        update_data, text = GEMINI_REPLIES[int(hashlib.md5(prompt.encode()).hexdigest(), 16) % len(GEMINI_REPLIES)]
+        raw = json.dumps({"update_data": update_data, "response_text": text}, ensure_ascii=False)
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(raw) // 4}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        return {"raw": raw, "usage": usage}
+
+    def chunk(text: str, usage: dict = None, finished: bool = False) -> dict:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finished:
+            candidate["finishReason"] = "STOP"
+        data = {"candidates": [candidate]}
+        if usage:
+            data["usageMetadata"] = usage
+        return data
+
+    def error():
+        return JSONResponse(status_code=profile.error_status, content={"error": {
+            "code": profile.error_status, "message": "Falha simulada", "status": "UNAVAILABLE"}})
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        body = await request.json()
+        if profile.should_fail():
+            await profile.delay(0.2)
+            return error()
+        reply = reply_for(body)
+
+        if model_action.endswith(":generateContent"):
+            await profile.delay()
+            return chunk(reply["raw"], reply["usage"], finished=True)
+
+        # streamGenerateContent: o transporte REST lê um array JSON enviado aos poucos
+        raw = reply["raw"]
+        pieces = [raw[i:i + 24] for i in range(0, len(raw), 24)]
+
+        async def stream():
+            # Primeiro trecho depois de ~40% da latência; o resto espalhado até o fim
+            await profile.delay(0.4)
+            yield "["
+            for index, piece in enumerate(pieces):
+                if index:
+                    await profile.delay(0.6 / len(pieces))
+                    yield ","
+                last = index == len(pieces) - 1
+                yield json.dumps(chunk(piece, reply["usage"] if last else None, finished=last), ensure_ascii=False)
+            yield "]"
+
+        return StreamingResponse(stream(), media_type="application/json")
+
+    return app
+
+
+# --- ElevenLabs (text-to-speech, normal e streaming) ---
+
+def elevenlabs_app(profile: FaultProfile) -> FastAPI:
+    app = FastAPI()
+
+    def fake_audio(text: str) -> bytes:
+        # ~100 bytes de "mp3" por caractere, determinístico por texto
+        size = max(1024, len(text) * 100)
+        seed = hashlib.sha256(text.encode()).digest()
+        return (seed * (size // len(seed) + 1))[:size]
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def synthesize(voice_id: str, request: Request):
+        body = await request.json()
+        await profile.delay()
+        if profile.should_fail():
+            return JSONResponse(status_code=profile.error_status, content={"detail": "Falha simulada"})
+        return Response(content=fake_audio(body.get("text", "")), media_type="audio/mpeg")
+
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def synthesize_stream(voice_id: str, request: Request):
+        body = await request.json()
+        if profile.should_fail():
+            await profile.delay(0.3)
+            return JSONResponse(status_code=profile.error_status, content={"detail": "Falha simulada"})
+        audio = fake_audio(body.get("text", ""))
+        chunks = [audio[i:i + 4096] for i in range(0, len(audio), 4096)]
+
+        async def stream():
+            await profile.delay(0.3)
+            for piece in chunks:
+                yield piece
+                await profile.delay(0.7 / len(chunks))
+
+        return StreamingResponse(stream(), media_type="audio/mpeg")
+
+    return app
+
+
+# --- Ollama (/api/chat com format=json) ---
+
+def ollama_app(profile: FaultProfile) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        await profile.delay()
+        if profile.should_fail():
+            return JSONResponse(status_code=profile.error_status, content={"error": "Falha simulada"})
+        content = json.dumps({"location": "Balneário Camboriú", "bedrooms": 3}, ensure_ascii=False)
+        return {
+            "model": body.get("model", "mistral"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+        }
+
+    return app
+
+
+# --- MinIO (subconjunto da API S3 usado pelo minio-py) ---
+
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def minio_app(profile: FaultProfile) -> FastAPI:
+    app = FastAPI()
+    buckets: Dict[str, Dict[str, bytes]] = {}
+    uploads: Dict[str, Dict[int, bytes]] = {}
+
+    def xml(body: str, status: int = 200) -> Response:
+        return Response(content=f'<?xml version="1.0" encoding="UTF-8"?>{body}', status_code=status,
+                        media_type="application/xml")
+
+    def s3_error(code: str, status: int, resource: str) -> Response:
+        return xml(f"<Error><Code>{code}</Code><Message>{code}</Message><Resource>{escape(resource)}</Resource>"
+                   f"<RequestId>bench</RequestId></Error>", status)
+
+    def etag(data: bytes) -> str:
+        return '"' + hashlib.md5(data).hexdigest() + '"'
+
+    @app.api_route("/{bucket}", methods=["GET", "HEAD", "PUT"])
+    async def bucket_ops(bucket: str, request: Request):
+        if request.method == "GET" and "location" in request.query_params:
+            return xml(f'<LocationConstraint xmlns="{S3_NS}">us-east-1</LocationConstraint>')
+        if request.method == "PUT":
+            buckets.setdefault(bucket, {})
+            return Response(status_code=200)
+        if request.method == "HEAD":
+            return Response(status_code=200 if bucket in buckets else 404)
+        return s3_error("NotImplemented", 501, bucket)
+
+    @app.api_route("/{bucket}/{key:path}", methods=["GET", "HEAD", "PUT", "POST", "DELETE"])
+    async def object_ops(bucket: str, key: str, request: Request):
+        params = request.query_params
+        resource = f"/{bucket}/{key}"
+        if request.method in ("PUT", "POST"):
+            if profile.should_fail():
+                await profile.delay()
+                return s3_error("SlowDown", profile.error_status, resource)
+        await profile.delay()
+        objects = buckets.setdefault(bucket, {})
+
+        if request.method == "POST" and "uploads" in params:
+            upload_id = uuid.uuid4().hex
+            uploads[upload_id] = {}
+            return xml(f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                       f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+        if request.method == "PUT" and "uploadId" in params:
+            data = await request.body()
+            uploads[params["uploadId"]][int(params["partNumber"])] = data
+            return Response(status_code=200, headers={"ETag": etag(data)})
+        if request.method == "POST" and "uploadId" in params:
+            parts = uploads.pop(params["uploadId"], {})
+            data = b"".join(parts[number] for number in sorted(parts))
+            objects[key] = data
+            return xml(f'<CompleteMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                       f"<Key>{escape(key)}</Key><ETag>{etag(data)}</ETag></CompleteMultipartUploadResult>")
+        if request.method == "DELETE":
+            uploads.pop(params.get("uploadId"), None)
+            objects.pop(key, None)
+            return Response(status_code=204)
+        if request.method == "PUT":
+            data = await request.body()
+            objects[key] = data
+            return Response(status_code=200, headers={"ETag": etag(data)})
+
+        data = objects.get(key)
+        if data is None:
+            return s3_error("NoSuchKey", 404, resource)
+        headers = {"ETag": etag(data), "Content-Length": str(len(data)),
+                   "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers)
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+    return app
+
+
+APP_FACTORIES = {"gemini": gemini_app, "elevenlabs": elevenlabs_app, "ollama": ollama_app, "minio": minio_app}
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    for service in SERVICES:
+        parser.add_argument(f"--{service}-latency-ms", type=float, default=DEFAULT_LATENCY_MS[service])
+        parser.add_argument(f"--{service}-jitter-ms", type=float, default=0.0)
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{service}-port", type=int, default=DEFAULT_PORTS[service])
+
+
+def profiles_from_args(args) -> Dict[str, FaultProfile]:
+    return {
+        service: FaultProfile(
+            latency_ms=getattr(args, f"{service}_latency_ms"),
+            jitter_ms=getattr(args, f"{service}_jitter_ms"),
+            error_rate=getattr(args, f"{service}_error_rate"),
+        )
+        for service in SERVICES
+    }
+
+
+async def serve(args):
+    servers = []
+    for service, profile in profiles_from_args(args).items():
+        config = uvicorn.Config(APP_FACTORIES[service](profile), host="127.0.0.1",
+                                port=getattr(args, f"{service}_port"), log_level="warning", access_log=False)
+        servers.append(uvicorn.Server(config))
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidores falsos dos provedores externos.")
+    add_fault_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Estatísticas de uma rodada (vazão, p50/p95/p99) e comparação com um baseline."""
+import json
+import math
+from typing import Dict, List, Optional
+
+from prometheus_client.parser import text_string_to_metric_families
+
+# Métricas comparadas com o baseline e se "maior é melhor"
+COMPARED = {"rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "error_rate": False}
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Percentil pelo método nearest-rank (lista já ordenada)."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+    }
+
+
+def stage_totals(metrics_text: str) -> Dict[str, list]:
+    """Soma e contagem do histograma de etapas do /metrics, por etapa."""
+    totals: Dict[str, list] = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "aurora_stage_duration_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0.0])[0] += sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0.0])[1] += sample.value
+    return totals
+
+
+def stage_breakdown(before: Dict[str, list], after: Dict[str, list]) -> Dict[str, dict]:
+    """Média por etapa (lado do servidor) apenas das chamadas feitas durante a rodada."""
+    result = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, [0.0, 0.0])
+        calls = count - prev_count
+        if calls > 0:
+            result[stage] = {"calls": int(calls), "avg_ms": round((total - prev_total) / calls * 1000, 1)}
+    return result
+
+
+def print_results(results: Dict[str, Dict[str, dict]]):
+    header = f"{'cenário':<14}{'conc.':>6}{'req':>8}{'erros':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for scenario, levels in results.items():
+        for level, data in levels.items():
+            print(f"{scenario:<14}{level:>6}{data['requests']:>8}{data['errors']:>7}{data['rps']:>9}"
+                  f"{data['p50_ms']:>9}{data['p95_ms']:>9}{data['p99_ms']:>9}")
+            for stage, stage_data in data.get("stages", {}).items():
+                print(f"{'':<20}  {stage}: {stage_data['calls']} chamadas, média {stage_data['avg_ms']} ms")
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compara cenário a cenário (mesma concorrência) e imprime as variações.
+    Retorna as regressões acima da tolerância (fração, ex.: 0.1 = 10%).
+    """
+    regressions = []
+    print(f"\nComparação com o baseline ({baseline.get('meta', {}).get('started_at', '?')}):")
+    for scenario, levels in current["results"].items():
+        for level, data in levels.items():
+            reference: Optional[dict] = baseline.get("results", {}).get(scenario, {}).get(level)
+            if reference is None:
+                continue
+            parts = []
+            for metric, higher_is_better in COMPARED.items():
+                old, new = reference.get(metric, 0), data.get(metric, 0)
+                if metric == "error_rate":
+                    worse = new - old > tolerance / 10
+                    parts.append(f"{metric} {old}→{new}")
+                else:
+                    if not old:
+                        continue
+                    change = (new - old) / old
+                    worse = change < -tolerance if higher_is_better else change > tolerance
+                    parts.append(f"{metric} {change:+.1%}")
+                if worse:
+                    regressions.append(f"{scenario} c={level}: {metric} {old} → {new}")
+            print(f"  {scenario} c={level}: " + ", ".join(parts))
+    return regressions
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(path: str, data: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,269 @@
+"""
+Benchmark de carga offline: sobe os provedores falsos (bench.fakes), a API com
+SQLite descartável (ou o Postgres de --database-url) e dispara cada cenário em
+laço fechado nos níveis de concorrência pedidos. Reporta vazão e p50/p95/p99,
+a média por etapa do pipeline (lida do /metrics) e compara com um baseline.
+
+    python -m bench.run --scenarios conversation,tts --concurrency 1,8,32 --duration 20
+    python -m bench.run --save-baseline bench/results/baseline.json
+    python -m bench.run --baseline bench/results/baseline.json --tolerance 0.1
+
+Sai com código 1 quando alguma métrica piora além da tolerância.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+from bench import fakes, report
+from bench.scenarios import Audio, Conversation, FollowUps, TTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HTTP_SCENARIOS = ("conversation", "audio", "tts")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de carga com provedores externos falsos.")
+    parser.add_argument("--scenarios", default="conversation,audio,tts,followups",
+                        help="Lista separada por vírgula: conversation, audio, tts, followups")
+    parser.add_argument("--concurrency", default="1,8,32", help="Níveis de concorrência (usuários virtuais)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Segundos de carga por cenário e nível")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Segundos de aquecimento (não medidos)")
+    parser.add_argument("--database-url", default=None,
+                        help="Banco da rodada (ex.: um Postgres descartável); padrão: SQLite temporário")
+    parser.add_argument("--app-port", type=int, default=18000)
+    parser.add_argument("--app-workers", type=int, default=1, help="Workers do uvicorn da API")
+    parser.add_argument("--app-url", default=None, help="Usa uma API já em execução em vez de subir uma")
+    parser.add_argument("--stt-latency-ms", type=float, default=300, help="Latência do STT stub")
+    parser.add_argument("--audio-seconds", type=float, default=1.0, help="Duração do áudio enviado")
+    parser.add_argument("--tts-cached-ratio", type=float, default=0.0,
+                        help="Fração de textos repetidos no cenário de TTS (acertos no cache)")
+    parser.add_argument("--tts-stream", action="store_true", help="Usa /tts/generate?stream=true")
+    parser.add_argument("--followups", type=int, default=2000, help="Follow-ups agendados por nível")
+    parser.add_argument("--followup-batch-size", type=int, default=100)
+    parser.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR",
+                        help="Variável extra para a API (ex.: --env TURN_DEBOUNCE_SECONDS=1)")
+    parser.add_argument("--output", default=None, help="Arquivo JSON do resultado (padrão: bench/results/)")
+    parser.add_argument("--baseline", default=None, help="JSON de uma rodada anterior para comparação")
+    parser.add_argument("--save-baseline", default=None, help="Também grava o resultado neste caminho")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Piora aceita antes de falhar (fração)")
+    fakes.add_fault_arguments(parser)
+    return parser.parse_args()
+
+
+def app_environment(args, database_url: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "GOOGLE_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{args.gemini_port}",
+        "ELEVENLABS_API_KEY": "bench",
+        "ELEVENLABS_BASE_URL": f"http://127.0.0.1:{args.elevenlabs_port}",
+        "OLLAMA_HOST": "127.0.0.1",
+        "OLLAMA_PORT": str(args.ollama_port),
+        "MINIO_HOST": f"127.0.0.1:{args.minio_port}",
+        "MINIO_ACCESS_KEY": "bench",
+        "MINIO_SECRET_KEY": "bench-secret",
+        "STT_BACKEND": "stub",
+        "STT_STUB_LATENCY_MS": str(args.stt_latency_ms),
+        "WHISPER_WORKERS": "0",
+        # O bench dispara os follow-ups por conta própria e mede cada requisição isolada
+        "SCHEDULER_MODE": "off",
+        "TTS_PREWARM_ENABLED": "false",
+        "TURN_DEBOUNCE_SECONDS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def start_process(command: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=ROOT, env=env)
+
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError(f"Serviço não respondeu em {timeout:.0f}s: {url}")
+
+
+async def read_stage_totals(client: httpx.AsyncClient) -> dict:
+    try:
+        return report.stage_totals((await client.get("/metrics")).text)
+    except httpx.HTTPError:
+        return {}
+
+
+async def run_http_level(client: httpx.AsyncClient, scenario, users: int, duration: float, warmup: float) -> dict:
+    """Laço fechado: `users` usuários virtuais repetem a requisição até o fim da janela."""
+    await scenario.setup(client, users)
+    latencies, errors = [], [0]
+    measuring = [False]
+    stop_at = [time.monotonic() + warmup + duration]
+
+    async def virtual_user(user: int):
+        while time.monotonic() < stop_at[0]:
+            started_at = time.perf_counter()
+            try:
+                response = await scenario.request(client, user)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started_at
+            if not measuring[0]:
+                continue
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    tasks = [asyncio.create_task(virtual_user(user)) for user in range(users)]
+    await asyncio.sleep(warmup)
+    before = await read_stage_totals(client)
+    measuring[0] = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - measured_from
+    result = report.summarize(latencies, errors[0], elapsed)
+    result["stages"] = report.stage_breakdown(before, await read_stage_totals(client))
+    return result
+
+
+def run_followup_level(args, run_id: str, workers: int, database_url: str) -> dict:
+    os.environ["DATABASE_URL"] = database_url
+    scenario = FollowUps(f"{run_id}-{workers}", args.followups, args.followup_batch_size)
+    scenario.seed()
+    if database_url.startswith("sqlite") and workers > 1:
+        # SQLite ignora FOR UPDATE SKIP LOCKED: drenagens paralelas enviariam em dobro
+        print("  followups: SQLite não suporta drenagem concorrente, usando 1 worker.")
+        workers = 1
+    latencies, errors, sent, elapsed = scenario.run(workers)
+    result = report.summarize(latencies, errors, elapsed)
+    result["followups_sent"] = sent
+    result["followups_per_second"] = round(sent / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+async def run(args) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='aurora-bench-'), 'bench.db')}"
+
+    processes = []
+    fake_command = [sys.executable, "-m", "bench.fakes"]
+    for service in fakes.SERVICES:
+        for option in ("latency_ms", "jitter_ms", "error_rate", "port"):
+            fake_command += [f"--{service}-{option.replace('_', '-')}", str(getattr(args, f"{service}_{option}"))]
+    processes.append(start_process(fake_command, dict(os.environ)))
+
+    app_url = args.app_url or f"http://127.0.0.1:{args.app_port}"
+    if not args.app_url:
+        # Tabelas e carga inicial num passo próprio, como o serviço db-init do Compose
+        subprocess.run([sys.executable, "-m", "app.init_db"], cwd=ROOT, env=app_environment(args, database_url),
+                       check=True)
+        processes.append(start_process(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(args.app_port), "--workers", str(args.app_workers), "--log-level", "warning",
+             "--no-access-log"],
+            app_environment(args, database_url),
+        ))
+
+    results = {}
+    try:
+        await wait_until_up(f"http://127.0.0.1:{args.gemini_port}/docs")
+        await wait_until_up(f"{app_url}/readyz")
+        limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+        async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+            for name in scenarios:
+                results[name] = {}
+                for users in levels:
+                    print(f"Rodando {name} com concorrência {users}...")
+                    if name == "followups":
+                        results[name][str(users)] = await asyncio.to_thread(
+                            run_followup_level, args, run_id, users, database_url)
+                        continue
+                    scenario = {
+                        "conversation": lambda: Conversation(run_id),
+                        "audio": lambda: Audio(f"{run_id}-{users}", args.audio_seconds),
+                        "tts": lambda: TTS(run_id, args.tts_cached_ratio, args.tts_stream),
+                    }[name]()
+                    results[name][str(users)] = await run_http_level(client, scenario, users,
+                                                                     args.duration, args.warmup)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "database": "sqlite" if database_url.startswith("sqlite") else database_url.split(":", 1)[0],
+            "duration": args.duration,
+            "app_workers": args.app_workers,
+            "faults": {service: vars(profile) for service, profile in fakes.profiles_from_args(args).items()},
+            "stt_latency_ms": args.stt_latency_ms,
+            "env": args.env,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def main():
+    args = parse_args()
+    for name in args.scenarios.split(","):
+        if name.strip() and name.strip() not in HTTP_SCENARIOS + ("followups",):
+            sys.exit(f"Cenário desconhecido: {name}")
+
+    data = asyncio.run(run(args))
+    print()
+    report.print_results(data["results"])
+
+    output = args.output or os.path.join(ROOT, "bench", "results",
+                                         f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    report.save(output, data)
+    print(f"\nResultado gravado em {output}")
+    if args.save_baseline:
+        report.save(args.save_baseline, data)
+
+    if args.baseline:
+        regressions = report.compare(data, report.load(args.baseline), args.tolerance)
+        if regressions:
+            print("\nRegressões acima da tolerância:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Cenários de carga. Cada cenário recebe o cliente HTTP e o índice do usuário
+virtual e faz UMA requisição; o laço fechado (cada usuário espera a resposta
+antes da próxima) fica em bench.run.
+"""
+import io
+import itertools
+import threading
+import time
+import wave
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+# Roteiro de mensagens de um lead típico (cada usuário virtual percorre em ciclo)
+CONVERSATION_SCRIPT = [
+    "Oi, tudo bem? Vi o anúncio de vocês",
+    "Procuro um apartamento em Balneário Camboriú",
+    "3 quartos e 2 vagas de garagem",
+    "Meu orçamento é de 2 a 3 milhões",
+    "Pretendo me mudar em até 6 meses",
+]
+
+TTS_TEXTS = [
+    "Olá! Aqui é da Aurora Prime, tudo bem?",
+    "Separei algumas opções que combinam com o que você procura.",
+    "Posso te enviar as plantas dos apartamentos?",
+    "Um de nossos corretores vai entrar em contato em breve.",
+]
+
+
+def phone_for(run_id: str, scenario: str, user: int) -> str:
+    return f"bench-{run_id}-{scenario}-{user}"
+
+
+def silent_wav(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+class Conversation:
+    name = "conversation"
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.turns = {}
+
+    async def setup(self, client: httpx.AsyncClient, users: int):
+        pass
+
+    async def request(self, client: httpx.AsyncClient, user: int) -> httpx.Response:
+        turn = self.turns.get(user, 0)
+        self.turns[user] = turn + 1
+        return await client.post("/conversation/webhook", json={
+            "phone_number": phone_for(self.run_id, self.name, user),
+            "message": CONVERSATION_SCRIPT[turn % len(CONVERSATION_SCRIPT)],
+        })
+
+
+class Audio:
+    name = "audio"
+
+    def __init__(self, run_id: str, seconds: float = 1.0):
+        self.run_id = run_id
+        self.audio = silent_wav(seconds)
+        self.counter = itertools.count()
+
+    async def setup(self, client: httpx.AsyncClient, users: int):
+        # O upload exige um lead existente
+        for user in range(users):
+            response = await client.post("/leads/", json={"phone_number": phone_for(self.run_id, self.name, user)})
+            response.raise_for_status()
+
+    async def request(self, client: httpx.AsyncClient, user: int) -> httpx.Response:
+        files = {"audio_file": (f"nota-{next(self.counter)}.wav", self.audio, "audio/wav")}
+        return await client.post(f"/leads/{phone_for(self.run_id, self.name, user)}/audio", files=files)
+
+
+class TTS:
+    name = "tts"
+
+    def __init__(self, run_id: str, cached_ratio: float = 0.0, stream: bool = False):
+        # cached_ratio: fração das requisições com textos repetidos (acertos no cache de TTS)
+        self.run_id = run_id
+        self.cached_ratio = cached_ratio
+        self.stream = stream
+        self.counter = itertools.count()
+
+    async def setup(self, client: httpx.AsyncClient, users: int):
+        pass
+
+    async def request(self, client: httpx.AsyncClient, user: int) -> httpx.Response:
+        n = next(self.counter)
+        if self.cached_ratio and (n % 100) < self.cached_ratio * 100:
+            text = TTS_TEXTS[n % len(TTS_TEXTS)]
+        else:
+            text = f"{TTS_TEXTS[n % len(TTS_TEXTS)]} Referência {self.run_id}-{n}."
+        return await client.post("/tts/generate", params={"stream": self.stream}, json={"text": text})
+
+
+class FollowUps:
+    """
+    Job de follow-ups, executado no processo do bench contra o mesmo banco da API:
+    agenda N follow-ups vencidos e mede cada lote de process_pending_followups.
+    """
+    name = "followups"
+
+    def __init__(self, run_id: str, total: int, batch_size: int):
+        self.run_id = run_id
+        self.total = total
+        self.batch_size = batch_size
+
+    def seed(self):
+        from sqlalchemy import insert
+        from app.core.database import SessionLocal
+        from app.models import lead, followup, broker, conversation, job  # registra todos os mapeamentos
+        from app.models.followup import FollowUp
+        from app.models.lead import Lead
+
+        db = SessionLocal()
+        try:
+            leads = [{"phone_number": phone_for(self.run_id, self.name, i), "status": "new",
+                      "created_at": datetime.now(timezone.utc)} for i in range(self.total)]
+            db.execute(insert(Lead), leads)
+            db.flush()
+            lead_ids = [row.id for row in db.query(Lead.id).filter(
+                Lead.phone_number.like(f"bench-{self.run_id}-{self.name}-%"))]
+            due = datetime.now(timezone.utc) - timedelta(minutes=1)
+            db.execute(insert(FollowUp), [
+                {"lead_id": lead_id, "scheduled_for": due, "status": "pending",
+                 "message_template": "Olá! Ainda procurando seu imóvel?"}
+                for lead_id in lead_ids
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+    def run(self, workers: int) -> tuple:
+        """Drena os follow-ups com `workers` threads; retorna (latências por lote, erros, enviados, duração)."""
+        from app.core.database import SessionLocal
+        from app.services.followup_service import process_pending_followups
+
+        latencies, sent, errors = [], [0], [0]
+        lock = threading.Lock()
+
+        def drain():
+            db = SessionLocal()
+            try:
+                while True:
+                    started_at = time.perf_counter()
+                    try:
+                        count = process_pending_followups(db, batch_size=self.batch_size, max_batches=1)
+                    except Exception:
+                        db.rollback()
+                        with lock:
+                            errors[0] += 1
+                        return
+                    if not count:
+                        return
+                    with lock:
+                        latencies.append(time.perf_counter() - started_at)
+                        sent[0] += count
+            finally:
+                db.close()
+
+        started_at = time.perf_counter()
+        threads = [threading.Thread(target=drain) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0], sent[0], time.perf_counter() - started_at
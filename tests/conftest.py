@@ -0,0 +1,128 @@
+"""
+Configuração comum dos testes: SQLite descartável (com chaves estrangeiras
+ligadas, como no Postgres), provedores externos desligados e os caches em
+memória zerados entre um teste e outro.
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="aurora-tests-")
+
+# Precisa vir antes de qualquer import de `app`: a configuração é lida no import
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}",
+    "GOOGLE_API_KEY": "test",
+    "ELEVENLABS_API_KEY": "test",
+    "MINIO_HOST": "127.0.0.1:9",
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test-secret",
+    "STT_BACKEND": "stub",
+    "STT_STUB_LATENCY_MS": "0",
+    "WHISPER_WORKERS": "0",
+    "SCHEDULER_MODE": "off",
+    "TTS_PREWARM_ENABLED": "false",
+    "TURN_DEBOUNCE_SECONDS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+import pytest
+from sqlalchemy import event
+
+from app.core import database
+from app.models import lead, followup, broker, conversation, job, processed_message  # registra os mapeamentos
+from app.services import conversation_cache, conversation_service
+from app.services.lead_cache import lead_cache
+from app.services.llm_session import session_cache
+from app.services.message_dedup import message_dedup
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+event.listen(database.engine, "connect", _enable_foreign_keys)
+if database.async_engine is not None:
+    event.listen(database.async_engine.sync_engine, "connect", _enable_foreign_keys)
+
+database.Base.metadata.create_all(bind=database.engine)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    with database.engine.begin() as connection:
+        for table in reversed(database.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    conversation_cache.window_cache._windows.clear()
+    with conversation_cache.history_writer._lock:
+        conversation_cache.history_writer._pending.clear()
+    conversation_cache.history_writer._failed_attempts = 0
+    lead_cache.invalidate(*list(lead_cache._items))
+    session_cache._sessions.clear()
+    message_dedup._entries.clear()
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeGeminiModel:
+    """Modelo do Gemini que responde sempre o mesmo JSON e guarda o que recebeu."""
+
+    def __init__(self, update_data: dict = None, response_text: str = "Olá! Em qual região você procura?"):
+        self.reply = json.dumps({"update_data": update_data or {}, "response_text": response_text})
+        self.calls = []
+
+    def generate_content(self, contents, **kwargs):
+        self.calls.append(contents)
+        return FakeGeminiResponse(self.reply)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return self.generate_content(contents, **kwargs)
+
+
+class FakeGeminiStream:
+    def __init__(self, response: FakeGeminiResponse):
+        self.response = response
+        self.usage_metadata = None
+
+    async def __aiter__(self):
+        yield self.response
+
+
+class BlockingGeminiModel(FakeGeminiModel):
+    """Gemini que segura a primeira resposta até o teste liberar (também em streaming)."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        if not self.started.is_set():
+            self.started.set()
+            await self.release.wait()
+        response = self.generate_content(contents, **kwargs)
+        return FakeGeminiStream(response) if stream else response
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    model = FakeGeminiModel()
+    monkeypatch.setattr(conversation_service, "get_gemini_models", lambda: (model, model))
+    return model
@@ -0,0 +1,74 @@
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from app.services import media_service
+
+AUDIO = bytes(range(256)) * 40  # ~10 KB
+
+
+class FakeMinio:
+    def __init__(self, read_limit=None, fail=False):
+        self.read_limit = read_limit
+        self.fail = fail
+        self.uploaded = b""
+        self.read_sizes = []
+
+    def put_object(self, bucket, name, data, length, part_size, content_type=None):
+        # Lê em partes, como o multipart do cliente do MinIO
+        while self.read_limit is None or len(self.uploaded) < self.read_limit:
+            chunk = data.read(part_size)
+            if not chunk:
+                break
+            self.read_sizes.append(len(chunk))
+            self.uploaded += chunk
+            if self.fail:
+                raise ConnectionError("MinIO fora do ar")
+
+
+@pytest.fixture
+def upload():
+    return UploadFile(file=io.BytesIO(AUDIO), filename="nota.ogg")
+
+
+def _ingest(monkeypatch, minio, upload):
+    monkeypatch.setattr(media_service, "get_minio_client", lambda: minio)
+    monkeypatch.setattr(media_service, "AUDIO_INGEST_PART_SIZE", 1024)
+    return media_service.ingest_audio_upload(upload, "5547999997001")
+
+
+def test_single_read_feeds_storage_and_temp_file(monkeypatch, upload):
+    minio = FakeMinio()
+
+    object_name, temp_path = _ingest(monkeypatch, minio, upload)
+    try:
+        assert object_name == "5547999997001/nota.ogg"
+        assert minio.uploaded == AUDIO
+        assert max(minio.read_sizes) <= 1024
+        with open(temp_path, "rb") as f:
+            assert f.read() == AUDIO
+        assert temp_path.endswith(".ogg")
+    finally:
+        os.remove(temp_path)
+
+
+def test_temp_file_is_complete_even_if_storage_stops_early(monkeypatch, upload):
+    minio = FakeMinio(read_limit=2048)
+
+    _, temp_path = _ingest(monkeypatch, minio, upload)
+    try:
+        with open(temp_path, "rb") as f:
+            assert f.read() == AUDIO
+    finally:
+        os.remove(temp_path)
+
+
+def test_failed_upload_removes_temp_file(monkeypatch, upload, tmp_path):
+    monkeypatch.setattr(media_service.tempfile, "tempdir", str(tmp_path))
+
+    with pytest.raises(ConnectionError):
+        _ingest(monkeypatch, FakeMinio(fail=True), upload)
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,48 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import lead_routes
+from app.schemas.lead import LeadCreate
+from app.services import audio_service, lead_service, media_service
+from app.services.transcription_service import TranscriptionQueueFull, TranscriptionUnavailable
+
+PHONE = "5547999994001"
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    lead_service.create_lead(db, LeadCreate(phone_number=PHONE))
+    db.commit()
+
+    def ingest(audio_file, phone_number):
+        path = tmp_path / "audio.ogg"
+        path.write_bytes(audio_file.file.read())
+        return f"{phone_number}/audio.ogg", str(path)
+
+    monkeypatch.setattr(media_service, "ingest_audio_upload", ingest)
+    app = FastAPI()
+    app.include_router(lead_routes.router)
+    return TestClient(app)
+
+
+def _upload(client):
+    return client.post(f"/leads/{PHONE}/audio", files={"audio_file": ("nota.ogg", b"OggS", "audio/ogg")})
+
+
+@pytest.mark.parametrize("error, status", [
+    (TranscriptionUnavailable("Pool de transcrição indisponível"), 503),
+    (TranscriptionQueueFull("Fila cheia"), 429),
+    (TimeoutError(), 504),
+])
+def test_transcription_errors_map_to_status(client, monkeypatch, error, status):
+    def analyze(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(audio_service, "analyze_audio", analyze)
+
+    response = _upload(client)
+
+    assert response.status_code == status
+    if status != 504:
+        assert response.headers["Retry-After"] == "5"
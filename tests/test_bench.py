@@ -0,0 +1,62 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from bench import fakes, report
+
+METRICS_TEXT = """# TYPE aurora_stage_duration_seconds histogram
+aurora_stage_duration_seconds_sum{stage="gemini_turn",outcome="ok"} 3.0
+aurora_stage_duration_seconds_count{stage="gemini_turn",outcome="ok"} 4.0
+aurora_stage_duration_seconds_sum{stage="gemini_turn",outcome="error"} 1.0
+aurora_stage_duration_seconds_count{stage="gemini_turn",outcome="error"} 1.0
+"""
+
+
+def test_summary_uses_nearest_rank_percentiles():
+    latencies = [i / 1000 for i in range(1, 101)]
+
+    summary = report.summarize(latencies, errors=25, elapsed=2.0)
+
+    assert (summary["requests"], summary["error_rate"], summary["rps"]) == (125, 0.2, 50.0)
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["max_ms"]) == (50.0, 95.0, 99.0, 100.0)
+    assert report.summarize([], errors=0, elapsed=0)["p99_ms"] == 0.0
+
+
+def test_stage_breakdown_counts_only_the_run():
+    before = {"gemini_turn": [2.0, 3.0]}
+
+    breakdown = report.stage_breakdown(before, report.stage_totals(METRICS_TEXT))
+
+    assert breakdown == {"gemini_turn": {"calls": 2, "avg_ms": 1000.0}}
+
+
+def test_compare_flags_regressions_beyond_tolerance(capsys):
+    baseline = {"results": {"tts": {"8": {"rps": 100, "p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "error_rate": 0}}}}
+    current = {"results": {"tts": {
+        "8": {"rps": 95, "p50_ms": 10.5, "p95_ms": 25, "p99_ms": 30, "error_rate": 0.02},
+        "32": {"rps": 10, "p50_ms": 900, "p95_ms": 900, "p99_ms": 900, "error_rate": 0.5},
+    }}}
+
+    regressions = report.compare(current, baseline, tolerance=0.1)
+
+    # rps -5% e p50 +5% ficam dentro da tolerância; o nível 32 não tem referência
+    assert regressions == ["tts c=8: p95_ms 20 → 25", "tts c=8: error_rate 0 → 0.02"]
+    assert "tts c=8" in capsys.readouterr().out
+
+
+def test_fake_gemini_streams_a_parseable_reply():
+    client = TestClient(fakes.gemini_app(fakes.FaultProfile(latency_ms=0)))
+
+    response = client.post("/v1beta/models/gemini-pro:streamGenerateContent", json={"contents": "Oi"})
+
+    chunks = json.loads(response.text)
+    raw = "".join(chunk["candidates"][0]["content"]["parts"][0]["text"] for chunk in chunks)
+    assert set(json.loads(raw)) == {"update_data", "response_text"}
+    assert chunks[-1]["candidates"][0]["finishReason"] == "STOP"
+    assert "usageMetadata" in chunks[-1]
+
+
+def test_fault_profile_injects_errors():
+    client = TestClient(fakes.ollama_app(fakes.FaultProfile(latency_ms=0, error_rate=1.0, error_status=500)))
+
+    assert client.post("/api/chat", json={"model": "mistral"}).status_code == 500
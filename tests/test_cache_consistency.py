@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+
+from app.core import database
+
+from app.models.conversation import ConversationHistory
+from app.schemas.lead import LeadCreate
+from app.services import conversation_cache, conversation_service, lead_service
+from app.services.llm_session import session_cache
+
+writer = conversation_cache.history_writer
+window_cache = conversation_cache.window_cache
+
+
+def _turn(db, lead, message: str):
+    conversation_service.process_user_message(db, lead, message)
+    db.commit()
+
+
+def _other_worker_turn(db, lead_id: int, message: str, reply: str):
+    # Outro processo atendeu o lead: as linhas chegam ao banco sem passar por este processo
+    db.add_all([ConversationHistory(lead_id=lead_id, role="user", content=message,
+                                    timestamp=datetime.now(timezone.utc)),
+                ConversationHistory(lead_id=lead_id, role="assistant", content=reply,
+                                    timestamp=datetime.now(timezone.utc))])
+    db.commit()
+
+
+def _expire_window(lead_id: int):
+    # Simula o fim do TTL da janela
+    window_cache._windows[lead_id].expires_at = 0
+
+
+@pytest.fixture
+def history_queries():
+    """SQL de histórico (contagem e linhas) executado durante o teste."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "conversation_history" in statement and statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(database.engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("mode", ["prompt", "session"])
+def test_warm_turns_do_not_query_the_history(db, fake_gemini, monkeypatch, history_queries, mode):
+    monkeypatch.setattr(conversation_service, "CONVERSATION_MODE", mode)
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999993001"))
+    db.commit()
+
+    _turn(db, lead, "Oi")
+    cold_queries = len(history_queries)
+    writer.flush()
+    _turn(db, lead, "Procuro em Itapema")
+    _turn(db, lead, "Apartamento")
+
+    # Só a carga da janela (contagem + linhas) vai ao banco
+    assert cold_queries == 2
+    assert len(history_queries) == 2
+    assert window_cache.get(lead.id)[1] == 6
+    assert session_cache.stats["stale"] == 0
+
+
+def test_flush_moves_messages_to_stored(db, fake_gemini):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999993005"))
+    db.commit()
+    _turn(db, lead, "Oi")
+    window = window_cache._windows[lead.id]
+    assert (window.stored, window.unstored) == (0, 2)
+
+    writer.flush()
+
+    assert (window.stored, window.unstored) == (2, 0)
+
+
+def test_window_is_reloaded_after_another_worker_turn(db, fake_gemini, monkeypatch):
+    monkeypatch.setattr(conversation_service, "CONVERSATION_MODE", "prompt")
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999993002"))
+    db.commit()
+    _turn(db, lead, "Oi")
+    writer.flush()
+
+    _other_worker_turn(db, lead.id, "Quero 3 quartos", "Anotado, 3 quartos!")
+    _turn(db, lead, "Dentro do TTL vale a janela local")
+    assert "User: Quero 3 quartos" not in fake_gemini.calls[-1]
+
+    _expire_window(lead.id)
+    _turn(db, lead, "E com vista para o mar")
+
+    assert window_cache.stats["expired"] == 1
+    prompt = fake_gemini.calls[-1]
+    assert "User: Quero 3 quartos" in prompt
+    assert prompt.index("User: Quero 3 quartos") < prompt.index("User: E com vista")
+
+
+def test_session_is_rebuilt_after_another_worker_turn(db, fake_gemini, monkeypatch):
+    monkeypatch.setattr(conversation_service, "CONVERSATION_MODE", "session")
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999993003"))
+    db.commit()
+    _turn(db, lead, "Oi")
+    _turn(db, lead, "Procuro em Itapema")
+    assert session_cache.stats["stale"] == 0
+    writer.flush()
+
+    _other_worker_turn(db, lead.id, "Quero 3 quartos", "Anotado, 3 quartos!")
+    _expire_window(lead.id)
+    _turn(db, lead, "E com vista para o mar")
+
+    assert session_cache.stats["stale"] == 1
+    contents = fake_gemini.calls[-1]
+    users = [turn["parts"][0] for turn in contents if turn["role"] == "user"]
+    assert users[:3] == ["Oi", "Procuro em Itapema", "Quero 3 quartos"]
+    assert json.loads(contents[-2]["parts"][0]) == {"response_text": "Anotado, 3 quartos!"}
+
+
+def test_session_is_rebuilt_after_rolled_back_turn(db, fake_gemini, monkeypatch):
+    monkeypatch.setattr(conversation_service, "CONVERSATION_MODE", "session")
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999993004"))
+    db.commit()
+    _turn(db, lead, "Oi")
+
+    conversation_service.process_user_message(db, lead, "Mensagem desfeita")
+    db.rollback()
+    _turn(db, lead, "Procuro em Itapema")
+
+    users = [turn["parts"][0] for turn in fake_gemini.calls[-1] if turn["role"] == "user"]
+    assert "Mensagem desfeita" not in users
@@ -0,0 +1,73 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.api import webhook_routes
+from app.models.conversation import ConversationHistory
+from app.models.lead import Lead
+from app.schemas.lead import LeadCreate
+from app.services import conversation_cache, conversation_service, lead_service
+
+writer = conversation_cache.history_writer
+
+
+def _history_rows(db) -> list:
+    return [(row.role, row.content) for row in
+            db.scalars(select(ConversationHistory).order_by(ConversationHistory.id))]
+
+
+def test_first_turn_of_new_lead_is_persisted(db, fake_gemini):
+    result = webhook_routes._handle_conversation_sync(
+        webhook_routes.WebhookPayload(phone_number="5547999990001", message="Oi, tudo bem?"))
+
+    assert result["response"] == "Olá! Em qual região você procura?"
+    # O histórico só entra na fila depois do commit do turno, com o lead já gravado
+    assert writer.pending_count() == 2
+    assert writer.flush() == 2
+    assert writer.pending_count() == 0
+    assert _history_rows(db) == [("user", "Oi, tudo bem?"), ("assistant", "Olá! Em qual região você procura?")]
+
+
+def test_first_turn_of_new_lead_async(db, fake_gemini):
+    response = asyncio.run(webhook_routes._run_turn("5547999990002", "Procuro um apartamento"))
+
+    assert response == "Olá! Em qual região você procura?"
+    assert writer.flush() == 2
+    assert db.scalar(select(func.count()).select_from(Lead)) == 1
+    assert len(_history_rows(db)) == 2
+
+
+def test_rolled_back_turn_leaves_no_history(db, fake_gemini):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999990003"))
+    conversation_service.process_user_message(db, lead, "Oi")
+    assert writer.pending_count() == 0
+
+    db.rollback()
+
+    # Nada chega ao write-behind (o lead nunca existiu) e a janela do turno desfeito é descartada
+    assert writer.pending_count() == 0
+    assert conversation_cache.window_cache.get(lead.id) is None
+    assert writer.flush() == 0
+
+
+def test_turn_closed_without_commit_leaves_no_history(db, fake_gemini):
+    # Ex.: o cliente do SSE desconecta antes do "done" e a sessão é fechada sem commit
+    async def abandoned_turn():
+        async with webhook_routes.AsyncSessionLocal() as session:
+            lead = await webhook_routes._get_or_create_lead_async(session, "5547999990004")
+            await conversation_service.process_user_message_async(session, lead, "Oi")
+
+    asyncio.run(abandoned_turn())
+
+    assert writer.pending_count() == 0
+    assert db.scalar(select(func.count()).select_from(Lead)) == 0
+
+
+def test_cold_window_includes_uncommitted_message(db, fake_gemini, monkeypatch):
+    monkeypatch.setattr(conversation_service, "CONVERSATION_MODE", "prompt")
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999990005"))
+    conversation_service.process_user_message(db, lead, "Quero um apartamento em Itapema")
+
+    # A mensagem do turno ainda não foi confirmada, mas já faz parte do prompt
+    assert "User: Quero um apartamento em Itapema" in fake_gemini.calls[-1]
+    db.commit()
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.api import webhook_routes
+from app.models.lead import Lead
+from app.services import conversation_cache, conversation_service
+from app.services.stream_parsing import ResponseTextStreamer, SentenceBuffer
+from tests.conftest import FakeGeminiResponse
+
+REPLY = json.dumps({"update_data": {"property_type": "apartamento"},
+                    "response_text": "Ótimo! Qual região você prefere? Posso sugerir \"Itapema\"."},
+                   ensure_ascii=True)
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.usage_metadata = None
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield FakeGeminiResponse(chunk)
+
+
+class FakeStreamingModel:
+    """Gemini que devolve o JSON da resposta em pedaços de 7 caracteres."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        if self.fail:
+            raise ConnectionError("Gemini fora do ar")
+        assert stream
+        return FakeStream([REPLY[i:i + 7] for i in range(0, len(REPLY), 7)])
+
+
+def _events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(webhook_routes.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _use_model(monkeypatch, model):
+    monkeypatch.setattr(conversation_service, "get_gemini_models", lambda: (model, model))
+
+
+def test_stream_emits_deltas_sentences_and_done(client, db, monkeypatch):
+    _use_model(monkeypatch, FakeStreamingModel())
+
+    response = client.post("/conversation/stream", json={"phone_number": "5547999996001", "message": "Oi"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    deltas = "".join(data["text"] for name, data in events if name == "delta")
+    sentences = [data for name, data in events if name == "sentence"]
+    assert deltas == "Ótimo! Qual região você prefere? Posso sugerir \"Itapema\"."
+    assert sentences == [{"index": 0, "text": "Ótimo!"},
+                         {"index": 1, "text": "Qual região você prefere?"},
+                         {"index": 2, "text": "Posso sugerir \"Itapema\"."}]
+    assert events[-1] == ("done", {"response": deltas, "update_data": {"property_type": "apartamento"}})
+
+    # O turno foi confirmado antes do "done"
+    lead = db.scalar(select(Lead).where(Lead.phone_number == "5547999996001"))
+    assert lead.property_type == "apartamento"
+    assert conversation_cache.history_writer.flush() == 2
+
+
+def test_stream_failure_sends_fallback_as_single_sentence(client, monkeypatch):
+    _use_model(monkeypatch, FakeStreamingModel(fail=True))
+
+    events = _events(client.post("/conversation/stream",
+                                 json={"phone_number": "5547999996002", "message": "Oi"}).text)
+
+    fallback = "Desculpe, estou com um problema técnico no momento."
+    assert events == [("sentence", {"index": 0, "text": fallback}),
+                      ("done", {"response": fallback, "update_data": {}})]
+
+
+def test_streamer_handles_escapes_split_across_chunks():
+    streamer = ResponseTextStreamer()
+    payload = '{"update_data": {}, "response_text": "Casa \\u00e9 \\"top\\" \\ud83c\\udfe0 ok", "x": 1}'
+
+    text = "".join(streamer.feed(payload[i:i + 3]) for i in range(0, len(payload), 3))
+
+    assert text == 'Casa é "top" \U0001f3e0 ok'
+    assert streamer.done
+
+
+def test_sentence_buffer_keeps_incomplete_sentence():
+    buffer = SentenceBuffer()
+
+    assert buffer.feed("Olá! Tudo bem") == ["Olá!"]
+    assert buffer.feed("? Vamos") == ["Tudo bem?"]
+    assert buffer.flush() == "Vamos"
+    assert buffer.flush() is None
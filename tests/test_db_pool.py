@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import sessionmaker
+
+from app.core import database
+from app.schemas.lead import LeadCreate, LeadUpdate
+from app.services import lead_service
+from app.services.lead_cache import lead_cache
+
+
+def _timed_engine(tmp_path, stats):
+    pool_class = type("TestPool", (database.TimedQueuePool,), {"wait_stats": stats})
+    return create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=pool_class, pool_size=1,
+                         max_overflow=0, pool_timeout=0.05)
+
+
+def test_pool_records_checkouts_and_timeouts(tmp_path):
+    stats = database.PoolWaitStats()
+    engine = _timed_engine(tmp_path, stats)
+
+    with engine.connect() as held:
+        held.execute(text("SELECT 1"))
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+
+    snapshot = stats.snapshot()
+    assert snapshot["checkouts"] == 1
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_max_ms"] >= 50
+    engine.dispose()
+
+
+def test_postgres_engine_options_come_from_config(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 2000)
+    monkeypatch.setattr(database, "pool_wait_stats", {})
+
+    sync = database._engine_options("postgresql://u:p@db/aurora", "primary")
+    async_ = database._engine_options("postgresql+asyncpg://u:p@db/aurora", "async", is_async=True)
+
+    assert issubclass(sync["poolclass"], database.TimedQueuePool)
+    assert issubclass(async_["poolclass"], database.TimedAsyncQueuePool)
+    assert sync["pool_size"] == database.DB_POOL_SIZE
+    assert sync["connect_args"] == {"options": "-c statement_timeout=2000"}
+    assert async_["connect_args"] == {"server_settings": {"statement_timeout": "2000"}}
+    assert set(database.pool_wait_stats) == {"primary", "async"}
+    assert database._engine_options("sqlite:///x.db", "primary") == {}
+
+
+def test_read_after_write_skips_lagging_replica(db, tmp_path):
+    # Réplica "atrasada": um banco vazio marcado como réplica
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    database.Base.metadata.create_all(bind=replica_engine)
+    ReplicaSession = sessionmaker(bind=replica_engine, info={"replica": True})
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999998201"))
+    lead_service.update_lead(db, lead, LeadUpdate(location="Itapema"))
+    db.commit()
+
+    with ReplicaSession() as replica:
+        assert database.is_replica_session(replica)
+        cached = lead_service.get_lead_snapshot(replica, "5547999998201")
+
+    assert cached is not None and cached.lead.location == "Itapema"
+    replica_engine.dispose()
+
+
+def test_reads_go_to_replica_once_the_write_is_old(db, tmp_path, monkeypatch):
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    database.Base.metadata.create_all(bind=replica_engine)
+    ReplicaSession = sessionmaker(bind=replica_engine, info={"replica": True})
+    lead_service.create_lead(db, LeadCreate(phone_number="5547999998202"))
+    db.commit()
+    lead_cache.invalidate("5547999998202")
+    monkeypatch.setattr(lead_service, "DB_READ_AFTER_WRITE_SECONDS", 0)
+
+    with ReplicaSession() as replica:
+        assert lead_service.get_lead_snapshot(replica, "5547999998202") is None
+    replica_engine.dispose()
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models.followup import FollowUp
+from app.schemas.lead import LeadCreate
+from app.services import followup_service, lead_service
+
+
+def _due_tasks(db, count: int, phone="5547999996001"):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number=phone))
+    past = datetime.now(timezone.utc) - timedelta(minutes=5)
+    db.add_all([FollowUp(lead_id=lead.id, scheduled_for=past, status="pending", message_template=f"m{i}")
+                for i in range(count)])
+    db.commit()
+    return lead
+
+
+def _statuses(db, lead_id):
+    db.expire_all()
+    return sorted(task.status for task in followup_service.get_followups_by_lead_id(db, lead_id))
+
+
+def test_future_followups_are_not_sent(db):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999996000"))
+    followup_service.schedule_initial_followups(db, lead)
+    db.commit()
+
+    assert followup_service.process_pending_followups(db) == 0
+    assert _statuses(db, lead.id) == ["pending"] * len(followup_service.FOLLOW_UP_CADENCE)
+
+
+def test_due_followups_are_sent_in_batches(db):
+    lead = _due_tasks(db, 5)
+
+    sent = followup_service.process_pending_followups(db, batch_size=2, max_batches=10)
+
+    assert sent == 5
+    assert _statuses(db, lead.id) == ["sent"] * 5
+
+
+def test_max_batches_bounds_one_run(db):
+    lead = _due_tasks(db, 5)
+
+    assert followup_service.process_pending_followups(db, batch_size=2, max_batches=2) == 4
+    assert followup_service.process_pending_followups(db, batch_size=2, max_batches=2) == 1
+    assert _statuses(db, lead.id).count("sent") == 5
+
+
+def test_bulk_scheduling_matches_the_cadence(db):
+    leads = [lead_service.create_lead(db, LeadCreate(phone_number=f"554799999610{i}")) for i in range(3)]
+    db.query(FollowUp).delete()
+
+    rows = followup_service.schedule_initial_followups_bulk(db, [lead.id for lead in leads])
+    db.commit()
+
+    assert rows == 3 * len(followup_service.FOLLOW_UP_CADENCE)
+    assert db.query(FollowUp).count() == rows
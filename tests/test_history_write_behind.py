@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from app.models.conversation import ConversationHistory
+from app.schemas.lead import LeadCreate
+from app.services import conversation_cache, lead_service
+from app.services.conversation_cache import HistoryEntry, HistoryWriteBehind
+
+
+def _entry(lead_id: int, content: str) -> HistoryEntry:
+    return HistoryEntry(lead_id, "user", content, datetime.now(timezone.utc))
+
+
+@pytest.fixture
+def lead_id(db):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999991000"))
+    db.commit()
+    return lead.id
+
+
+def test_flush_writes_in_batches(db, lead_id):
+    writer = HistoryWriteBehind(flush_interval=60, batch_size=2)
+    for i in range(5):
+        writer.enqueue(_entry(lead_id, f"mensagem {i}"))
+
+    assert writer.flush() == 5
+    assert writer.pending_count() == 0
+    assert [row.content for row in db.scalars(select(ConversationHistory).order_by(ConversationHistory.id))] == \
+        [f"mensagem {i}" for i in range(5)]
+
+
+def test_poison_row_is_dead_lettered_after_max_attempts(db, lead_id):
+    writer = HistoryWriteBehind(flush_interval=60, batch_size=10, max_attempts=2)
+    writer.enqueue(_entry(lead_id, "antes"))
+    writer.enqueue(_entry(999999, "lead inexistente"))  # viola a chave estrangeira
+    writer.enqueue(_entry(lead_id, "depois"))
+
+    # O lote inteiro falha enquanto não atinge o limite de tentativas
+    assert writer.flush() == 0
+    assert writer.pending_count() == 3
+    # Depois disso grava linha a linha e descarta só a linha rejeitada
+    assert writer.flush() == 0
+    assert writer.flush() == 2
+    assert writer.pending_count() == 0
+    assert writer.snapshot()["dead_lettered"] == 1
+    assert [row.content for row in db.scalars(select(ConversationHistory).order_by(ConversationHistory.id))] == \
+        ["antes", "depois"]
+
+    # Lotes seguintes voltam ao insert em lote
+    writer.enqueue(_entry(lead_id, "novo"))
+    assert writer.flush() == 1
+    assert writer.snapshot()["failed_attempts"] == 0
+
+
+def test_transient_errors_keep_rows_queued(monkeypatch, lead_id):
+    writer = HistoryWriteBehind(flush_interval=60, batch_size=10, max_attempts=1)
+    writer.enqueue(_entry(lead_id, "a"))
+    writer.enqueue(_entry(lead_id, "b"))
+
+    class DatabaseDown:
+        def execute(self, *args, **kwargs):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(conversation_cache, "SessionLocal", DatabaseDown)
+    for _ in range(3):
+        assert writer.flush() == 0
+    # Banco fora do ar não é motivo para descartar: tudo continua na fila
+    assert writer.pending_count() == 2
+    assert writer.snapshot()["dead_lettered"] == 0
+
+    monkeypatch.undo()
+    assert writer.flush() == 2
+
+
+def test_queue_is_capped():
+    writer = HistoryWriteBehind(flush_interval=60, batch_size=10, max_pending=2)
+    assert writer.enqueue(_entry(1, "a"))
+    assert writer.enqueue(_entry(1, "b"))
+    assert not writer.enqueue(_entry(1, "c"))
+    assert writer.pending_count() == 2
+    assert writer.snapshot()["dropped"] == 1
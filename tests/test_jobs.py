@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import database
+from app.schemas.lead import LeadCreate, LeadUpdate
+from app.services import audio_service, job_service, lead_service, media_service, nlu_service
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(job_service, "job_executor", executor)
+    yield executor
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _status(db, job_id):
+    db.expire_all()
+    return job_service.get_job(db, job_id).status
+
+
+def test_cancelled_job_is_failed_and_cleaned_up(db, executor, tmp_path):
+    started, release = threading.Event(), threading.Event()
+    busy = job_service.create_job(db, kind="audio_message")
+    queued = job_service.create_job(db, kind="audio_message")
+    temp_file = tmp_path / "audio.ogg"
+    temp_file.write_bytes(b"OggS")
+    ran = []
+
+    job_service.submit_job(lambda job_id: started.set() or release.wait(5), busy.id)
+    job_service.submit_job(lambda job_id: ran.append(job_id), queued.id, temp_files=(str(temp_file),))
+    started.wait(5)
+    # Desligamento com um job rodando e outro ainda na fila
+    shutdown = threading.Thread(target=executor.shutdown, kwargs={"wait": True, "cancel_futures": True})
+    shutdown.start()
+    release.set()
+    shutdown.join(5)
+
+    assert ran == []
+    assert _status(db, queued.id) == "failed"
+    assert "cancelado" in job_service.get_job(db, queued.id).error
+    assert not temp_file.exists()
+    assert _status(db, busy.id) == "queued"  # o job em execução termina normalmente (aqui, sem tracker)
+
+
+def test_submit_after_shutdown_fails_the_job(db, executor, tmp_path):
+    executor.shutdown()
+    job = job_service.create_job(db, kind="audio_message")
+    temp_file = tmp_path / "audio.ogg"
+    temp_file.write_bytes(b"OggS")
+
+    with pytest.raises(RuntimeError):
+        job_service.submit_job(lambda job_id: None, job.id, temp_files=(str(temp_file),))
+
+    assert _status(db, job.id) == "failed"
+    assert not temp_file.exists()
+
+
+def test_audio_job_holds_no_connection_while_transcribing(db, tmp_path, monkeypatch):
+    lead = lead_service.create_lead(db, LeadCreate(phone_number="5547999995001"))
+    job = job_service.create_job(db, kind="audio_message")
+    db.commit()
+    temp_file = tmp_path / "audio.ogg"
+    temp_file.write_bytes(b"OggS")
+    checked_out = []
+
+    def transcribe(path, **kwargs):
+        checked_out.append(database.engine.pool.checkedout())
+        return "quero 3 quartos"
+
+    monkeypatch.setattr(media_service, "upload_audio_file_to_storage", lambda *args: None)
+    monkeypatch.setattr(media_service, "transcribe_audio_local", transcribe)
+    monkeypatch.setattr(nlu_service, "extract_lead_info_from_text", lambda text, current: LeadUpdate(bedrooms=3))
+
+    audio_service.run_audio_job(job.id, lead.phone_number, "obj", str(temp_file), "audio/ogg")
+
+    # Nenhuma conexão do pool em uso durante a transcrição
+    assert checked_out == [0]
+    assert _status(db, job.id) == "completed"
+    db.refresh(lead)
+    assert lead.bedrooms == 3
+    assert not temp_file.exists()
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import lead_routes
+from app.schemas.lead import Lead as LeadSchema, LeadCreate, LeadUpdate
+from app.services import lead_service
+from app.services import lead_cache as lead_cache_module
+from app.services.lead_cache import LeadSnapshotCache, lead_cache
+
+PHONE = "5547999998101"
+
+
+@pytest.fixture
+def client(db):
+    lead_service.create_lead(db, LeadCreate(phone_number=PHONE))
+    db.commit()
+    app = FastAPI()
+    app.include_router(lead_routes.router)
+    return TestClient(app)
+
+
+def test_etag_revalidation_returns_304(client):
+    first = client.get(f"/leads/{PHONE}")
+    etag = first.headers["etag"]
+
+    again = client.get(f"/leads/{PHONE}", headers={"If-None-Match": f"W/{etag}"})
+
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert lead_cache.stats["hits"] >= 1
+
+
+def test_patch_invalidates_cached_lead(client):
+    etag = client.get(f"/leads/{PHONE}").headers["etag"]
+
+    client.patch(f"/leads/{PHONE}", json={"location": "Itapema"})
+    response = client.get(f"/leads/{PHONE}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()["location"] == "Itapema"
+    assert response.headers["etag"] != etag
+
+
+def test_rolled_back_write_keeps_reads_consistent(client, db):
+    client.get(f"/leads/{PHONE}")
+    lead = lead_service.get_lead_by_phone(db, PHONE)
+    lead_service.update_lead(db, lead, LeadUpdate(location="Itapema"))
+    db.rollback()
+
+    assert client.get(f"/leads/{PHONE}").json()["location"] is None
+
+
+def _snapshot(db) -> LeadSchema:
+    return LeadSchema.model_validate(lead_service.get_lead_by_phone(db, PHONE))
+
+
+def test_read_started_before_write_is_not_cached(client, db):
+    cache = LeadSnapshotCache(ttl=60, max_entries=10)
+    generation = cache.generation(PHONE)
+    cache.invalidate(PHONE)
+
+    cache.put(PHONE, _snapshot(db), generation)
+
+    assert cache.get(PHONE) is None
+
+
+def test_cache_evicts_least_recently_used_and_expires(client, db, monkeypatch):
+    cache = LeadSnapshotCache(ttl=60, max_entries=2)
+    snapshot = _snapshot(db)
+    for phone in ("a", "b"):
+        cache.put(phone, snapshot, cache.generation(phone))
+    cache.get("a")
+    cache.put("c", snapshot, cache.generation("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    now = time.monotonic()
+    monkeypatch.setattr(lead_cache_module.time, "monotonic", lambda: now + 61)
+    assert cache.get("a") is None
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import lead_routes
+from app.schemas.lead import LeadCreate, LeadUpdate
+from app.services import lead_service
+
+
+@pytest.fixture
+def client(db):
+    for i in range(7):
+        lead = lead_service.create_lead(db, LeadCreate(phone_number=f"55479999980{i:02d}"))
+        lead_service.update_lead(db, lead, LeadUpdate(location="Itapema" if i % 2 == 0 else "Florianópolis"))
+    db.commit()
+    app = FastAPI()
+    app.include_router(lead_routes.router)
+    return TestClient(app)
+
+
+def _all_pages(client, **params):
+    phones, cursor, pages = [], None, 0
+    while True:
+        body = client.get("/leads", params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        phones += [lead["phone_number"] for lead in body["items"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return phones, pages
+
+
+def test_cursor_walks_every_lead_once(client):
+    phones, pages = _all_pages(client, limit=3)
+
+    assert phones == [f"55479999980{i:02d}" for i in range(7)]
+    assert pages == 3
+
+
+def test_exact_last_page_has_no_cursor(client):
+    phones, pages = _all_pages(client, limit=7)
+
+    assert len(phones) == 7 and pages == 1
+
+
+def test_filters_apply_to_every_page(client):
+    phones, _ = _all_pages(client, limit=2, location="itapema")
+
+    assert phones == [f"55479999980{i:02d}" for i in (0, 2, 4, 6)]
+
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": 10_000}, {"cursor": "abc"}])
+def test_invalid_paging_is_rejected(client, params):
+    assert client.get("/leads", params=params).status_code == 422
+
+
+def test_ndjson_export_streams_filtered_leads(client):
+    response = client.get("/leads/export", params={"location": "Florianópolis"})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["phone_number"] for row in rows] == [f"55479999980{i:02d}" for i in (1, 3, 5)]
+    assert set(rows[0]) == set(lead_service.EXPORT_COLUMNS)
+
+
+def test_csv_export_writes_header_and_rows(client):
+    chunks = list(lead_routes._export_chunks("csv", lead_routes._lead_filters(), rows_per_chunk=2))
+
+    # Cabeçalho + 7 linhas em blocos de 2
+    assert len(chunks) == 4
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == 7
+    assert rows[0]["location"] == "Itapema" and rows[0]["status"] == "new"
+    assert client.get("/leads/export", params={"format": "xml"}).status_code == 422
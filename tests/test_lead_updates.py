@@ -0,0 +1,84 @@
+from app.core.database import SessionLocal
+from app.schemas.lead import LeadCreate, LeadUpdate
+from app.services import conversation_service, lead_service
+from tests.conftest import FakeGeminiModel
+
+
+def _lead(db, phone="5547999991001"):
+    return lead_service.create_lead(db, LeadCreate(phone_number=phone))
+
+
+def _use_model(monkeypatch, model):
+    monkeypatch.setattr(conversation_service, "get_gemini_models", lambda: (model, model))
+
+
+def test_two_regions_in_one_sentence_follow_gemini(db, monkeypatch):
+    _use_model(monkeypatch, FakeGeminiModel(update_data={"location": "Itapema"}))
+    lead = _lead(db)
+
+    conversation_service.process_user_message(db, lead, "moro em Florianópolis mas quero comprar em Itapema")
+
+    assert lead.location == "Itapema"
+
+
+def test_gemini_value_wins_over_rules(db, monkeypatch):
+    _use_model(monkeypatch, FakeGeminiModel(update_data={"bedrooms": 4}))
+    lead = _lead(db)
+
+    conversation_service.process_user_message(db, lead, "3 quartos, ou melhor, 4")
+
+    assert lead.bedrooms == 4
+
+
+def test_rules_fill_fields_gemini_left_empty(db, monkeypatch):
+    _use_model(monkeypatch, FakeGeminiModel(update_data={"property_type": "apartamento", "location": None}))
+    lead = _lead(db)
+
+    conversation_service.process_user_message(db, lead, "apartamento em Itapema")
+
+    assert (lead.location, lead.property_type) == ("Itapema", "apartamento")
+
+
+def test_rules_still_apply_when_gemini_fails(db, monkeypatch):
+    class BrokenModel(FakeGeminiModel):
+        def generate_content(self, contents, **kwargs):
+            raise RuntimeError("fora do ar")
+
+    _use_model(monkeypatch, BrokenModel())
+    lead = _lead(db)
+
+    conversation_service.process_user_message(db, lead, "3 quartos em Itapema")
+
+    assert (lead.location, lead.bedrooms) == ("Itapema", 3)
+
+
+def test_turn_update_keeps_concurrent_write(db):
+    lead = _lead(db, "5547999991005")
+    db.commit()
+    # Snapshot lido no início do turno; outro processo altera o lead antes do UPDATE
+    snapshot = lead_service.get_lead_snapshot(db, "5547999991005").lead
+    with SessionLocal() as other:
+        lead_service.update_lead(other, lead_service.get_lead_by_phone(other, "5547999991005"),
+                                 LeadUpdate(location="Florianópolis"))
+        other.commit()
+
+    lead_service.apply_turn_update(db, snapshot, LeadUpdate(location="Itapema", bedrooms=3))
+    db.commit()
+
+    db.expire_all()
+    current = lead_service.get_lead_by_phone(db, "5547999991005")
+    assert (current.location, current.bedrooms) == ("Florianópolis", 3)
+
+
+def test_turn_update_without_conflict_applies_everything(db):
+    lead = _lead(db, "5547999991006")
+    db.commit()
+    snapshot = lead_service.get_lead_snapshot(db, "5547999991006").lead
+
+    lead_service.apply_turn_update(db, snapshot, LeadUpdate(location="Itapema", bedrooms=3))
+    db.commit()
+
+    db.expire_all()
+    current = lead_service.get_lead_by_phone(db, "5547999991006")
+    assert (current.location, current.bedrooms) == ("Itapema", 3)
+    assert current.updated_at is not None
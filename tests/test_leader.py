@@ -0,0 +1,119 @@
+import asyncio
+
+from sqlalchemy.pool import NullPool
+
+from app import scheduler
+from app.core import database
+from app.core.leader import AdvisoryLockLeader
+
+
+class FakeServer:
+    """Advisory locks de sessão de um Postgres falso: lock -> conexão dona."""
+
+    def __init__(self):
+        self.locks = {}
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.closed = False
+        self.broken = False
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def execute(self, statement, params=None):
+        if self.broken:
+            raise ConnectionError("conexão perdida")
+        sql = str(statement)
+        if "pg_try_advisory_lock" in sql:
+            owner = self.server.locks.setdefault(params["key"], self)
+            return FakeResult(owner is self)
+        if "pg_advisory_unlock" in sql:
+            return FakeResult(self.server.locks.pop(params["key"], None) is self)
+        return FakeResult(1)
+
+    def close(self):
+        self.closed = True
+        # O Postgres libera os locks de sessão junto com a conexão
+        for key, owner in list(self.server.locks.items()):
+            if owner is self:
+                del self.server.locks[key]
+
+
+class FakeDialect:
+    name = "postgresql"
+
+
+class FakeEngine:
+    dialect = FakeDialect()
+
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def connect(self):
+        return FakeConnection(self.server)
+
+
+def _leaders(count: int = 2):
+    server = FakeServer()
+    return server, [AdvisoryLockLeader(FakeEngine(server), 42) for _ in range(count)]
+
+
+def test_only_one_process_leads():
+    _, (first, second) = _leaders()
+
+    assert first.ensure() is True
+    assert second.ensure() is False
+    # O líder continua líder sem disputar o lock de novo
+    assert first.ensure() is True
+
+
+def test_release_hands_over_leadership():
+    _, (first, second) = _leaders()
+    first.ensure()
+
+    first.release()
+
+    assert not first.is_leader
+    assert second.ensure() is True
+
+
+def test_lost_connection_gives_up_leadership():
+    server, (first, second) = _leaders()
+    first.ensure()
+
+    # A conexão do líder caiu: o Postgres libera o lock e o líder percebe na próxima verificação
+    first._conn.broken = True
+    first._conn.close()
+    assert second.ensure() is True
+    assert first.ensure() is False
+    assert server.locks[42] is second._conn
+
+
+def test_followup_job_only_runs_on_the_leader(monkeypatch):
+    runs = []
+    monkeypatch.setattr(scheduler, "run_followup_dispatch", lambda: runs.append(1) or 0)
+
+    monkeypatch.setattr(scheduler.leader, "ensure", lambda: False)
+    asyncio.run(scheduler.check_followups_job())
+    assert runs == []
+
+    monkeypatch.setattr(scheduler.leader, "ensure", lambda: True)
+    asyncio.run(scheduler.check_followups_job())
+    assert len(runs) == scheduler.FOLLOWUP_DISPATCH_CONCURRENCY
+
+
+def test_leader_connection_does_not_come_from_the_request_pool():
+    assert scheduler.leader.engine is database.leader_engine
+    assert isinstance(scheduler.leader.engine.pool, NullPool)
+    assert scheduler.leader.engine.pool is not database.engine.pool
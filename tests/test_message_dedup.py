@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.models.processed_message import ProcessedMessage
+from app.services.message_dedup import MessageDeduplicator
+
+PHONE = "5547999992001"
+
+
+class FakeTurn:
+    def __init__(self, response: str = "Olá!", fail: bool = False):
+        self.response = response
+        self.fail = fail
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("Gemini fora do ar")
+        return self.response
+
+
+def _record(db, message_id: str):
+    db.expire_all()
+    return db.scalar(select(ProcessedMessage).where(ProcessedMessage.message_id == message_id))
+
+
+def test_redelivery_gets_the_stored_response(db):
+    dedup = MessageDeduplicator(100, 60)
+    turn = FakeTurn()
+
+    async def scenario():
+        first = await dedup.run_once("m1", PHONE, turn)
+        second = await dedup.run_once("m1", PHONE, turn)
+        # Outra réplica (ou após restart): sem a janela em memória, vale o registro no banco
+        dedup._entries.clear()
+        third = await dedup.run_once("m1", PHONE, turn)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+
+    assert turn.calls == 1
+    assert (first.response, first.duplicate) == ("Olá!", False)
+    assert (second.response, second.duplicate) == ("Olá!", True)
+    assert (third.response, third.duplicate, third.status) == ("Olá!", True, "done")
+    assert dedup.stats["memory_hits"] == 1 and dedup.stats["db_hits"] == 1
+
+
+def test_concurrent_deliveries_share_one_turn(db):
+    dedup = MessageDeduplicator(100, 60)
+    turn = FakeTurn()
+
+    async def scenario():
+        turn.release.clear()
+        first = asyncio.ensure_future(dedup.run_once("m2", PHONE, turn))
+        while turn.calls == 0:
+            await asyncio.sleep(0.001)
+        second = asyncio.ensure_future(dedup.run_once("m2", PHONE, turn))
+        await asyncio.sleep(0.01)
+        turn.release.set()
+        return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(scenario())
+
+    assert turn.calls == 1
+    assert not first.duplicate and second.duplicate
+    assert second.response == "Olá!"
+
+
+def test_cancelled_request_keeps_the_claim(db):
+    dedup = MessageDeduplicator(100, 60)
+    turn = FakeTurn()
+
+    async def scenario():
+        turn.release.clear()
+        request = asyncio.ensure_future(dedup.run_once("m3", PHONE, turn))
+        while turn.calls == 0:
+            await asyncio.sleep(0.001)
+        # O cliente desconecta no meio do turno, que continua e confirma
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        turn.release.set()
+        await asyncio.gather(*dedup._tasks)
+        return await dedup.run_once("m3", PHONE, turn)
+
+    redelivery = asyncio.run(scenario())
+
+    assert turn.calls == 1
+    assert (redelivery.response, redelivery.duplicate) == ("Olá!", True)
+    assert _record(db, "m3").status == "done"
+
+
+def test_failed_turn_releases_the_claim(db):
+    dedup = MessageDeduplicator(100, 60)
+    failing, working = FakeTurn(fail=True), FakeTurn("Agora sim")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await dedup.run_once("m4", PHONE, failing)
+        return await dedup.run_once("m4", PHONE, working)
+
+    retry = asyncio.run(scenario())
+
+    assert (retry.response, retry.duplicate) == ("Agora sim", False)
+    assert dedup.stats["failures"] == 1
+    assert _record(db, "m4").status == "done"
@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from app.api import ops_routes
+from app.core import logging_setup
+from app.core.logging_setup import JsonFormatter
+from app.core.metrics import MetricsMiddleware, observe_stage, record_stage
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_outcome_follows_the_block():
+    ok = _sample("aurora_stage_duration_seconds_count", stage="minio_upload", outcome="ok")
+    error = _sample("aurora_stage_duration_seconds_count", stage="minio_upload", outcome="error")
+
+    with observe_stage("minio_upload"):
+        pass
+    with pytest.raises(ValueError):
+        with observe_stage("minio_upload"):
+            raise ValueError("falhou")
+    record_stage("minio_upload", 0.2)
+
+    assert _sample("aurora_stage_duration_seconds_count", stage="minio_upload", outcome="ok") == ok + 2
+    assert _sample("aurora_stage_duration_seconds_count", stage="minio_upload", outcome="error") == error + 1
+
+
+def test_queries_are_timed_by_statement_kind(db):
+    before = _sample("aurora_db_query_duration_seconds_count", statement="SELECT")
+
+    db.execute(text("SELECT 1"))
+
+    assert _sample("aurora_db_query_duration_seconds_count", statement="SELECT") == before + 1
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(ops_routes.router)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware)
+    return TestClient(app)
+
+
+def test_http_latency_uses_the_route_template(client):
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _sample("aurora_http_request_duration_seconds_count", **labels)
+
+    client.get("/items/1")
+    client.get("/items/2")
+
+    assert _sample("aurora_http_request_duration_seconds_count", **labels) == before + 2
+    assert client.get("/nao-existe").status_code == 404
+    assert _sample("aurora_http_request_duration_seconds_count",
+                   method="GET", route="unmatched", status="404") >= 1
+
+
+def test_metrics_endpoint_exposes_runtime_gauges(client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("aurora_queue_depth{queue=\"history_write_behind\"}", "aurora_outbound_in_flight",
+                 "aurora_turn_active_leads", "aurora_stage_duration_seconds_bucket"):
+        assert name in response.text
+
+
+def test_json_log_lines_carry_extra_fields():
+    logger = logging.getLogger("tests.metrics")
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, "Turno do lead %s", (7,), None,
+                               extra={"lead_id": 7, "stage": "gemini_turn"})
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["message"] == "Turno do lead 7"
+    assert data["level"] == "INFO" and data["logger"] == "tests.metrics"
+    assert (data["lead_id"], data["stage"]) == (7, "gemini_turn")
+    assert "args" not in data and "msg" not in data
+
+
+def test_json_logs_keep_the_traceback_out_of_the_message(monkeypatch, capsys):
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    monkeypatch.setattr(logging_setup, "LOG_FORMAT", "json")
+    monkeypatch.setattr(logging_setup, "_listener", None)
+    logging_setup.setup_logging()
+    listener = logging_setup._listener
+    try:
+        try:
+            raise ValueError("payload inválido")
+        except ValueError:
+            logging.getLogger("tests.metrics").exception("Falha no lead %s", 7, extra={"lead_id": 7})
+    finally:
+        listener.stop()
+        atexit.unregister(listener.stop)
+        root.handlers, root.level = handlers, level
+
+    data = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+    assert data["message"] == "Falha no lead 7"
+    assert data["lead_id"] == 7
+    assert "Traceback" in data["exc_info"] and "ValueError: payload inválido" in data["exc_info"]
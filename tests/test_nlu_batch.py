@@ -0,0 +1,67 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api import nlu_routes
+from app.core.outbound import CircuitBreaker, ollama_backend
+from app.schemas.nlu import NLUBatchItem, NLUBatchRequest
+from app.services import nlu_service
+
+# Textos que as regras não resolvem sozinhas: sempre pedem o Ollama
+NEEDS_LLM = "Quero algo perto da praia com espaço para a família, investimento de uns 2 milhões"
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ollama_backend, "breaker", CircuitBreaker(1, 60))
+    nlu_service.extraction_cache._items.clear()
+
+
+def _request(*texts) -> NLUBatchRequest:
+    return NLUBatchRequest(items=[NLUBatchItem(text=text) for text in texts])
+
+
+def test_failed_items_are_reported(monkeypatch):
+    def fake_llm(text, keys, current_data=None):
+        if "falha" in text:
+            raise TimeoutError("Ollama não respondeu")
+        return {"location": "Itapema"}
+
+    monkeypatch.setattr(nlu_service, "_extract_with_llm", fake_llm)
+    response = nlu_routes.extract_batch(_request(NEEDS_LLM, NEEDS_LLM + " falha", NEEDS_LLM + " falha"))
+
+    assert response.results[0].location == "Itapema"
+    assert response.failed == 1 and response.unique == 2
+    assert set(response.errors) == {1, 2}
+    assert "TimeoutError" in response.errors[1]
+    # Falhas não vão para o cache: o próximo lote tenta o Ollama de novo
+    assert nlu_service.extraction_cache.snapshot()["entries"] == 1
+
+
+def test_successful_batch_has_no_errors(monkeypatch):
+    monkeypatch.setattr(nlu_service, "_extract_with_llm", lambda text, keys, current_data=None: {})
+    response = nlu_routes.extract_batch(_request(NEEDS_LLM))
+
+    assert response.failed == 0 and response.errors is None
+
+
+def test_batch_is_refused_while_circuit_is_open(monkeypatch):
+    calls = []
+    monkeypatch.setattr(nlu_service, "_extract_with_llm", lambda *args, **kwargs: calls.append(args) or {})
+    ollama_backend.breaker.record_failure()
+
+    with pytest.raises(HTTPException) as excinfo:
+        nlu_routes.extract_batch(_request(NEEDS_LLM))
+
+    assert excinfo.value.status_code == 503
+    assert int(excinfo.value.headers["Retry-After"]) > 0
+    assert calls == []
+
+
+def test_cached_batch_is_served_while_circuit_is_open(monkeypatch):
+    monkeypatch.setattr(nlu_service, "_extract_with_llm", lambda text, keys, current_data=None: {"bedrooms": 3})
+    nlu_routes.extract_batch(_request(NEEDS_LLM))
+    ollama_backend.breaker.record_failure()
+
+    response = nlu_routes.extract_batch(_request(NEEDS_LLM))
+
+    assert response.results[0].bedrooms == 3 and response.cache_hits == 1
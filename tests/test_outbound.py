@@ -0,0 +1,215 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from app.core.outbound import BulkheadFullError, CircuitBreaker, CircuitOpenError, OutboundBackend
+
+
+def _backend(**kwargs) -> OutboundBackend:
+    options = dict(timeout=1, max_concurrency=2, max_retries=0, backoff_base=0, breaker_threshold=2,
+                   breaker_reset_seconds=0, acquire_timeout=0.01)
+    options.update(kwargs)
+    return OutboundBackend("teste", **options)
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def _fail(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def _open(backend: OutboundBackend):
+    for _ in range(backend.breaker.failure_threshold):
+        with pytest.raises(requests.ConnectionError):
+            backend.call(_fail(requests.ConnectionError("fora do ar")))
+    assert backend.breaker.state == "open"
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    backend = _backend(breaker_reset_seconds=60)
+    _open(backend)
+
+    with pytest.raises(CircuitOpenError):
+        backend.call(lambda: "ok")
+    assert backend.snapshot()["rejected"] == 1
+
+
+def test_half_open_trial_success_closes():
+    backend = _backend()
+    _open(backend)
+
+    assert backend.call(lambda: "ok") == "ok"
+    assert backend.breaker.state == "closed"
+
+
+def test_half_open_trial_failure_reopens():
+    backend = _backend()
+    _open(backend)
+    backend.breaker.reset_timeout = 60
+    backend.breaker._opened_at -= 60
+
+    with pytest.raises(requests.ConnectionError):
+        backend.call(_fail(requests.ConnectionError("fora do ar")))
+    assert backend.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        backend.call(lambda: "ok")
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow() == "trial"
+    assert breaker.allow() is None
+    breaker.release_trial()
+    assert breaker.allow() == "trial"
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_client_errors_do_not_open_the_circuit(status):
+    backend = _backend(breaker_threshold=1)
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            backend.call(_fail(_http_error(status)))
+    assert backend.breaker.state == "closed"
+
+
+def test_server_errors_open_the_circuit():
+    backend = _backend(breaker_threshold=1)
+    with pytest.raises(requests.HTTPError):
+        backend.call(_fail(_http_error(500)))
+    assert backend.breaker.state == "open"
+
+
+def test_client_error_on_trial_frees_the_next_trial():
+    backend = _backend()
+    _open(backend)
+
+    with pytest.raises(requests.HTTPError):
+        backend.call(_fail(_http_error(400)))
+    assert backend.breaker.state == "half_open"
+    assert backend.call(lambda: "ok") == "ok"
+    assert backend.breaker.state == "closed"
+
+
+def test_full_bulkhead_does_not_consume_the_trial():
+    backend = _backend(max_concurrency=1)
+    _open(backend)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    # Ocupa a única vaga com a chamada de teste e tenta outra: o bulkhead recusa antes do circuito
+    worker = threading.Thread(target=backend.call, args=(slow,))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(BulkheadFullError):
+        backend.call(lambda: "ok")
+    release.set()
+    worker.join(5)
+    assert backend.breaker.state == "closed"
+
+
+def test_bulkhead_rejection_in_half_open_keeps_trial_available():
+    backend = _backend(max_concurrency=1)
+    _open(backend)
+    backend._bulkhead.acquire()
+    with pytest.raises(BulkheadFullError):
+        backend.call(lambda: "ok")
+    backend._bulkhead.release()
+
+    assert backend.call(lambda: "ok") == "ok"
+    assert backend.breaker.state == "closed"
+
+
+def test_cancelled_async_trial_is_released():
+    backend = _backend()
+    _open(backend)
+
+    async def scenario():
+        task = asyncio.create_task(backend.acall(asyncio.sleep, 10))
+        while backend.snapshot()["in_flight"] == 0:
+            await asyncio.sleep(0.001)
+        assert backend.breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await backend.acall(asyncio.sleep, 0, "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+    assert backend.breaker.state == "closed"
+    assert backend.snapshot()["in_flight"] == 0
+
+
+class FakeBody:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_holds_the_slot_until_the_body_ends(monkeypatch):
+    backend = _backend(max_concurrency=1, breaker_reset_seconds=60)
+    response = FakeBody([b"ab", b"cd"])
+    monkeypatch.setattr(backend, "_send", lambda *args, **kwargs: response)
+
+    body = backend.stream("POST", "http://tts", chunk_size=2)
+    chunks = iter(body)
+    assert next(chunks) == b"ab"
+    # Cabeçalhos recebidos não liberam a vaga
+    with pytest.raises(BulkheadFullError):
+        backend.call(lambda: "ok")
+
+    assert list(chunks) == [b"cd"]
+    assert response.closed
+    assert backend.snapshot()["in_flight"] == 0
+    assert backend.call(lambda: "ok") == "ok"
+
+
+def test_stream_failure_mid_body_counts_for_the_breaker(monkeypatch):
+    backend = _backend(breaker_threshold=1, breaker_reset_seconds=60)
+    monkeypatch.setattr(backend, "_send",
+                        lambda *args, **kwargs: FakeBody([b"ab"], requests.ConnectionError("caiu")))
+
+    body = backend.stream("POST", "http://tts", chunk_size=2)
+    # Só os cabeçalhos chegaram: ainda não é sucesso
+    assert backend.breaker._failures == 0
+    with pytest.raises(requests.ConnectionError):
+        list(body)
+
+    assert backend.breaker.state == "open"
+    assert backend.snapshot()["in_flight"] == 0
+
+
+def test_closed_stream_trial_is_released(monkeypatch):
+    backend = _backend()
+    _open(backend)
+    monkeypatch.setattr(backend, "_send", lambda *args, **kwargs: FakeBody([b"ab", b"cd"]))
+
+    chunks = iter(backend.stream("POST", "http://tts", chunk_size=2))
+    next(chunks)
+    assert backend.breaker.state == "half_open"
+    chunks.close()  # cliente desconectou
+
+    assert backend.snapshot()["in_flight"] == 0
+    assert backend.call(lambda: "ok") == "ok"
+    assert backend.breaker.state == "closed"
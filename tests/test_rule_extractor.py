@@ -0,0 +1,91 @@
+import pytest
+
+from app.services.rule_extractor import RuleExtractor, DEFAULT_REGIONS
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return RuleExtractor(DEFAULT_REGIONS)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("3 quartos em Itapema", {"location": "Itapema", "bedrooms": 3}),
+    ("Procuro um apartamento em Balneário Camboriú", {"location": "Balneário Camboriú",
+                                                     "property_type": "apartamento"}),
+    ("duas vagas de garagem", {"parking_spots": 2}),
+    ("uma suíte", {"bedrooms": 1}),
+    ("10 quartos", {"bedrooms": 10}),
+    ("2 quartos e 1 vaga", {"bedrooms": 2, "parking_spots": 1}),
+    ("cobertura em Floripa", {"location": "Florianópolis", "property_type": "cobertura"}),
+    ("uns 150 m2", {"min_area_sqm": 150}),
+    ("80 metros quadrados", {"min_area_sqm": 80}),
+])
+def test_simple_messages_are_resolved(extractor, text, expected):
+    result = extractor.extract(text)
+    assert result.confident_fields() == expected
+    assert result.covers_message()
+
+
+@pytest.mark.parametrize("text", [
+    # Números dentro de outras palavras ("nenhUMA", "algUM") ou de números maiores ("103")
+    "nenhuma vaga de garagem",
+    "algum quarto em Itapema",
+    "apartamento com 103 quartos",
+])
+def test_numbers_are_matched_on_word_boundaries(extractor, text):
+    fields = extractor.extract(text).confident_fields()
+    assert "bedrooms" not in fields
+    assert "parking_spots" not in fields
+
+
+@pytest.mark.parametrize("text", [
+    "moro a 200 metros da praia",
+    "quero ficar a uns 500 metros do mar",
+])
+def test_distances_are_not_areas(extractor, text):
+    result = extractor.extract(text)
+    assert "min_area_sqm" not in result.confident_fields()
+    assert not result.covers_message()
+
+
+def test_zero_words_are_not_confident(extractor):
+    result = extractor.extract("nenhuma vaga de garagem")
+    assert result.update.parking_spots == 0
+    assert result.confident_fields() == {}
+    assert not result.covers_message()
+
+
+def test_unexplained_numbers_go_to_the_llm(extractor):
+    result = extractor.extract("apartamento com 103 quartos")
+    assert result.confident_fields() == {"property_type": "apartamento"}
+    assert not result.covers_message()
+
+
+def test_negated_terms_are_skipped(extractor):
+    result = extractor.extract("não quero casa, prefiro apartamento")
+    assert result.confident_fields() == {"property_type": "apartamento"}
+    assert not result.covers_message()
+
+
+def test_sem_vaga_is_not_a_parking_count(extractor):
+    result = extractor.extract("pode ser sem vaga")
+    assert "parking_spots" not in result.confident_fields()
+    assert not result.covers_message()
+
+
+def test_long_free_text_is_left_to_the_llm(extractor):
+    result = extractor.extract("3 quartos, mas preciso que seja perto da escola dos meus filhos e tenha piscina")
+    assert result.confident_fields() == {"bedrooms": 3}
+    assert not result.covers_message()
+
+
+def test_regions_can_be_added(extractor):
+    local = RuleExtractor(["Garopaba"])
+    assert local.extract("casa em Garopaba").confident_fields() == {"location": "Garopaba",
+                                                                     "property_type": "casa"}
+
+
+def test_two_regions_leave_location_to_the_llm(extractor):
+    result = extractor.extract("moro em Florianópolis mas quero comprar em Itapema")
+    assert "location" not in result.confident_fields()
+    assert not result.covers_message()
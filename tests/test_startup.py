@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import ops_routes
+from app.core import minio_client, startup
+from app.core.startup import Readiness
+
+
+def _wait_for(condition, timeout=2.0):
+    # Não usa time.sleep: um dos testes o substitui para medir o backoff
+    deadline = time.monotonic() + timeout
+    pause = threading.Event()
+    while not condition():
+        assert time.monotonic() < deadline, "condição não atingida a tempo"
+        pause.wait(0.01)
+
+
+@pytest.fixture
+def readiness(monkeypatch):
+    state = Readiness(["database", "whisper"])
+    monkeypatch.setattr(ops_routes, "readiness", state)
+    return state
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(ops_routes.router)
+    return TestClient(app)
+
+
+def test_ready_only_after_required_components(readiness, client):
+    release = threading.Event()
+    readiness.warm_in_background("database", lambda: None)
+    readiness.warm_in_background("whisper", lambda: release.wait(2))
+    # Componente opcional sem aquecimento não segura o tráfego
+    readiness.warm_in_background("gemini", lambda: False, retry=False)
+    _wait_for(lambda: readiness.snapshot()["components"]["database"]["state"] == "ready")
+
+    assert client.get("/healthz").json() == {"status": "ok"}
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["components"]["whisper"]["state"] == "warming"
+
+    release.set()
+    _wait_for(readiness.is_ready)
+    body = client.get("/readyz").json()
+    assert body["ready"] is True
+    assert body["components"]["gemini"]["state"] == "lazy"
+    assert "warmup:whisper" in body["startup"]
+
+
+def test_failed_warmup_retries_with_backoff(readiness, monkeypatch):
+    delays = []
+    monkeypatch.setattr(startup.time, "sleep", delays.append)
+    attempts = iter([ConnectionError("banco fora"), ConnectionError("banco fora"), None])
+
+    def warmup():
+        error = next(attempts)
+        if error:
+            raise error
+
+    readiness.warm_in_background("database", warmup)
+    _wait_for(lambda: readiness.snapshot()["components"]["database"]["state"] == "ready")
+
+    component = readiness.snapshot()["components"]["database"]
+    assert component["attempts"] == 3 and component["error"] is None
+    assert delays == [1.0, 2.0]
+
+
+def test_failure_without_retry_stays_failed(readiness):
+    def warmup():
+        raise RuntimeError("sem chave")
+
+    readiness.warm_in_background("whisper", warmup, retry=False)
+    _wait_for(lambda: readiness.snapshot()["components"]["whisper"]["state"] == "failed")
+
+    assert readiness.snapshot()["components"]["whisper"]["error"] == "sem chave"
+    assert readiness.snapshot()["components"]["database"] == {"state": "unknown"}
+
+
+def test_draining_turns_readiness_off(readiness, client):
+    readiness._set("database", state="ready")
+    readiness._set("whisper", state="lazy")
+    assert client.get("/readyz").status_code == 200
+
+    readiness.draining = True
+
+    assert client.get("/readyz").status_code == 503
+
+
+def test_startup_profile_marks_sequential_phases():
+    profile = startup.StartupProfile()
+
+    profile.mark("imports")
+    profile.record("warmup:minio", 0.25)
+    snapshot = profile.snapshot()
+
+    assert set(snapshot) == {"imports", "warmup:minio"}
+    assert snapshot["warmup:minio"]["ms"] == 250.0
+
+
+def test_minio_outage_is_not_retried_on_every_call(monkeypatch):
+    calls = []
+
+    def ensure_buckets():
+        calls.append(1)
+        raise ConnectionError("MinIO fora do ar")
+
+    monkeypatch.setattr(minio_client, "ensure_buckets", ensure_buckets)
+    monkeypatch.setattr(minio_client, "_buckets_ready", False)
+    monkeypatch.setattr(minio_client, "_retry_at", 0.0)
+    monkeypatch.setattr(minio_client, "_client", None)
+
+    first = minio_client.get_minio_client()
+    second = minio_client.get_minio_client()
+
+    # Sem MinIO no ar ainda devolve o cliente; a verificação dos buckets fica para depois
+    assert first is second and first is not None
+    assert len(calls) == 1
+
+
+def test_api_does_not_create_the_schema_by_default(monkeypatch):
+    from app import main
+
+    calls = []
+    monkeypatch.setattr(main, "init_database", lambda: calls.append("init"))
+    monkeypatch.setattr(main.rule_extractor, "load_regions_from_db", lambda db: calls.append("regions"))
+    main.prepare_database()
+
+    # Tabelas e carga inicial ficam para `python -m app.init_db`
+    assert calls == ["regions"]
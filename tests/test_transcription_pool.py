@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import transcription_service
+from app.services.transcription_service import TranscriptionPool, TranscriptionQueueFull, TranscriptionUnavailable
+
+
+@pytest.fixture
+def pool():
+    # Threads no lugar de processos: os jobs falsos não precisam do Whisper nem de pickle
+    pool = TranscriptionPool(workers=4, max_queue=2, job_timeout=5)
+    pool._executor = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _fake_chunks(monkeypatch, count: int, chunk_job):
+    monkeypatch.setattr(transcription_service, "_split_job",
+                        lambda path, *args: [(float(i), float(i + 1)) for i in range(count)])
+    monkeypatch.setattr(transcription_service, "_transcribe_chunk_job", chunk_job)
+
+
+def _wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_chunks_respect_the_queue_limit(pool, monkeypatch):
+    lock = threading.Lock()
+    peak = {"in_flight": 0}
+
+    def chunk_job(path, start, end, beam_size):
+        with lock:
+            peak["in_flight"] = max(peak["in_flight"], pool.stats()["in_flight"])
+        time.sleep(0.01)
+        return f"t{int(start)}"
+
+    _fake_chunks(monkeypatch, 6, chunk_job)
+    partials = []
+
+    text = pool.transcribe_chunked("audio.ogg", on_partial=lambda ready, total, partial: partials.append(ready))
+
+    assert text == "t0 t1 t2 t3 t4 t5"
+    assert peak["in_flight"] <= pool.max_queue
+    assert partials[-1] == 6 and partials == sorted(partials)
+    _wait_until(lambda: pool.stats()["in_flight"] == 0)
+    assert pool.stats()["completed"] == 1
+
+
+def test_chunked_request_is_rejected_when_queue_is_full(pool, monkeypatch):
+    _fake_chunks(monkeypatch, 2, lambda *args: "x")
+    pool._in_flight = pool.max_queue
+
+    with pytest.raises(TranscriptionQueueFull):
+        pool.transcribe_chunked("audio.ogg")
+    assert pool.stats()["rejected"] == 1
+
+
+def test_chunk_timeout_cancels_queued_chunks(pool, monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def chunk_job(path, start, end, beam_size):
+        started.append(start)
+        release.wait(5)
+        return "x"
+
+    _fake_chunks(monkeypatch, 5, chunk_job)
+    pool.job_timeout = 0.2
+
+    with pytest.raises(TimeoutError):
+        pool.transcribe_chunked("audio.ogg")
+
+    # Só os trechos que couberam na fila chegaram a rodar; ao terminarem, as vagas voltam
+    assert len(started) <= pool.max_queue
+    release.set()
+    _wait_until(lambda: pool.stats()["in_flight"] == 0)
+    assert len(started) <= pool.max_queue
+    assert pool.stats()["failed"] == 1
+
+
+def test_deadline_reached_waiting_for_a_slot_is_a_timeout(pool, monkeypatch):
+    def split_job(path, *args):
+        # Outras requisições ocupam a fila inteira assim que a divisão termina
+        with pool._lock:
+            pool._in_flight += pool.max_queue
+        return [(0.0, 1.0), (1.0, 2.0)]
+
+    monkeypatch.setattr(transcription_service, "_split_job", split_job)
+    monkeypatch.setattr(transcription_service, "_transcribe_chunk_job", lambda *args: "x")
+    pool.job_timeout = 0.1
+
+    with pytest.raises(TimeoutError):
+        pool.transcribe_chunked("audio.ogg")
+    assert pool.stats()["rejected"] == 0
+    assert pool.stats()["failed"] == 1
+
+
+def test_failed_chunk_frees_every_slot(pool, monkeypatch):
+    def chunk_job(path, start, end, beam_size):
+        if start == 1.0:
+            raise RuntimeError("áudio corrompido")
+        return "x"
+
+    _fake_chunks(monkeypatch, 4, chunk_job)
+
+    with pytest.raises(RuntimeError):
+        pool.transcribe_chunked("audio.ogg")
+    _wait_until(lambda: pool.stats()["in_flight"] == 0)
+
+
+def test_pool_not_started_is_unavailable():
+    pool = TranscriptionPool(workers=2, max_queue=2, job_timeout=5)
+
+    with pytest.raises(TranscriptionUnavailable):
+        pool.transcribe("audio.ogg")
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_transcribe_timeout_keeps_slot_until_worker_finishes(pool, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(transcription_service, "_transcribe_job", lambda path, beam: (release.wait(5), 0.0))
+    pool.job_timeout = 0.05
+
+    with pytest.raises(TimeoutError):
+        pool.transcribe("audio.ogg")
+    assert pool.stats()["in_flight"] == 1
+    release.set()
+    _wait_until(lambda: pool.stats()["in_flight"] == 0)
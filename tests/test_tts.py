@@ -0,0 +1,146 @@
+import pytest
+
+from app.services import media_service, tts_cache as tts_cache_module
+from app.services.tts_cache import AudioLRUCache, TTSCache
+
+
+class NoSuchKey(Exception):
+    code = "NoSuchKey"
+
+
+class FakeObject:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, bucket, name):
+        if (bucket, name) not in self.objects:
+            raise NoSuchKey(name)
+        return FakeObject(self.objects[(bucket, name)])
+
+    def put_object(self, bucket, name, data, length, content_type=None):
+        self.objects[(bucket, name)] = data.read(length)
+
+
+@pytest.fixture
+def minio(monkeypatch):
+    fake = FakeMinio()
+    monkeypatch.setattr(tts_cache_module, "get_minio_client", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def cache(minio, monkeypatch):
+    cache = TTSCache(max_bytes=1024, bucket_name="tts")
+    monkeypatch.setattr(media_service, "tts_cache", cache)
+    yield cache
+    cache._uploader.shutdown(wait=True)
+
+
+def test_lru_is_bounded_by_bytes():
+    lru = AudioLRUCache(max_bytes=10)
+    lru.put("a", b"1234")
+    lru.put("b", b"1234")
+    lru.get("a")
+    lru.put("c", b"1234")
+
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1234" and lru.get("c") == b"1234"
+    assert lru.current_bytes == 8
+    lru.put("grande", b"x" * 11)
+    assert lru.get("grande") is None
+
+
+def test_speech_is_synthesized_once(cache, minio, monkeypatch):
+    calls = []
+    monkeypatch.setattr(media_service, "_synthesize_speech", lambda text: calls.append(text) or b"audio")
+
+    first = media_service.generate_speech_from_text("Olá!")
+    second = media_service.generate_speech_from_text("Olá!")
+    cache._uploader.shutdown(wait=True)
+
+    assert first == second == b"audio"
+    assert calls == ["Olá!"]
+    assert cache.stats["memory_hits"] == 1
+    # A cópia no MinIO fica para as outras réplicas
+    assert list(minio.objects.values()) == [first]
+
+
+def test_other_replica_reads_from_storage(cache, minio, monkeypatch):
+    monkeypatch.setattr(media_service, "_synthesize_speech", lambda text: b"audio")
+    media_service.generate_speech_from_text("Olá!")
+    cache._uploader.shutdown(wait=True)
+
+    replica = TTSCache(max_bytes=1024, bucket_name="tts")
+    monkeypatch.setattr(media_service, "tts_cache", replica)
+    monkeypatch.setattr(media_service, "_synthesize_speech", lambda text: pytest.fail("não deveria sintetizar"))
+
+    assert media_service.generate_speech_from_text("Olá!") == b"audio"
+    assert replica.stats["storage_hits"] == 1
+    replica._uploader.shutdown(wait=True)
+
+
+def test_cache_key_depends_on_voice_settings():
+    base = tts_cache_module.cache_key("Olá", "voz", "modelo", {"stability": 0.5})
+    assert base == tts_cache_module.cache_key("Olá", "voz", "modelo", {"stability": 0.5})
+    assert base != tts_cache_module.cache_key("Olá", "voz", "modelo", {"stability": 0.6})
+    assert base != tts_cache_module.cache_key("Olá", "outra", "modelo", {"stability": 0.5})
+
+
+class FakeStreamResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_relays_chunks_and_caches_the_audio(cache, monkeypatch):
+    response = FakeStreamResponse([b"ab", b"", b"cd"])
+    monkeypatch.setattr(media_service.elevenlabs_backend, "_send", lambda *args, **kwargs: response)
+
+    chunks = list(media_service.open_speech_stream("Olá!"))
+
+    assert chunks == [b"ab", b"cd"]
+    assert response.closed
+    # A segunda vez sai do cache, sem nova chamada
+    monkeypatch.setattr(media_service.elevenlabs_backend, "_send", lambda *args, **kwargs: pytest.fail("sem cache"))
+    assert b"".join(media_service.open_speech_stream("Olá!")) == b"abcd"
+
+
+def test_aborted_stream_is_not_cached(cache, monkeypatch):
+    response = FakeStreamResponse([b"ab", b"cd"])
+    monkeypatch.setattr(media_service.elevenlabs_backend, "_send", lambda *args, **kwargs: response)
+
+    stream = media_service.open_speech_stream("Olá!")
+    next(stream)
+    stream.close()  # cliente desconectou no meio
+
+    assert response.closed
+    assert cache.memory.get(media_service._speech_cache_key("Olá!")) is None
+
+
+def test_long_stream_is_not_cached(cache, monkeypatch):
+    monkeypatch.setattr(media_service, "TTS_STREAM_MAX_CACHEABLE_BYTES", 3)
+    monkeypatch.setattr(media_service.elevenlabs_backend, "_send",
+                        lambda *args, **kwargs: FakeStreamResponse([b"ab", b"cd"]))
+
+    assert b"".join(media_service.open_speech_stream("Olá!")) == b"abcd"
+    assert cache.memory.get(media_service._speech_cache_key("Olá!")) is None
@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from app.api import webhook_routes
+from app.core import database
+from app.services import conversation_service
+from app.services.turn_coordinator import LeadTurnCoordinator, join_messages
+from tests.conftest import BlockingGeminiModel
+
+
+class RecordingTurn:
+    """Turno falso: guarda o texto de cada chamada e quantos turnos rodavam juntos."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.texts = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, text: str) -> str:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.texts.append(text)
+        try:
+            await asyncio.sleep(self.delay)
+            return f"resposta para: {text}"
+        finally:
+            self.running -= 1
+
+
+def test_burst_is_coalesced_into_one_turn():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0.05, max_wait_seconds=1)
+    turn = RecordingTurn()
+
+    async def scenario():
+        return await asyncio.gather(*(coordinator.submit("lead-1", message, turn)
+                                      for message in ("Oi", "procuro apartamento", "em Itapema")))
+
+    outcomes = asyncio.run(scenario())
+
+    assert turn.texts == ["Oi\nprocuro apartamento\nem Itapema"]
+    assert {outcome.result for outcome in outcomes} == {"resposta para: " + turn.texts[0]}
+    assert [outcome.batch_size for outcome in outcomes] == [3, 3, 3]
+    # Só a última mensagem do lote responde no WhatsApp
+    assert [outcome.is_last for outcome in outcomes] == [False, False, True]
+    assert coordinator.snapshot()["llm_calls_saved"] == 2
+
+
+def test_turns_of_one_lead_never_overlap():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0, max_wait_seconds=0)
+    turn = RecordingTurn(delay=0.02)
+
+    async def scenario():
+        first = asyncio.ensure_future(coordinator.submit("lead-1", "primeira", turn))
+        while not turn.texts:
+            await asyncio.sleep(0.001)
+        # Chegam enquanto o primeiro turno roda: entram juntas no lote seguinte
+        rest = [asyncio.ensure_future(coordinator.submit("lead-1", text, turn)) for text in ("segunda", "terceira")]
+        return await asyncio.gather(first, *rest)
+
+    outcomes = asyncio.run(scenario())
+
+    assert turn.peak == 1
+    assert turn.texts == ["primeira", "segunda\nterceira"]
+    assert [outcome.batch_size for outcome in outcomes] == [1, 2, 2]
+
+
+def test_different_leads_run_in_parallel():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0, max_wait_seconds=0)
+    turn = RecordingTurn(delay=0.02)
+
+    async def scenario():
+        await asyncio.gather(*(coordinator.submit(f"lead-{i}", "Oi", turn) for i in range(3)))
+
+    asyncio.run(scenario())
+
+    assert turn.peak == 3
+    assert coordinator.snapshot()["active_leads"] == 0
+
+
+def test_max_wait_caps_the_debounce():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0.05, max_wait_seconds=0.08)
+    turn = RecordingTurn()
+
+    async def scenario():
+        tasks = []
+        # Uma mensagem a cada 30ms renovaria o debounce para sempre; o teto fecha o lote
+        for i in range(6):
+            tasks.append(asyncio.ensure_future(coordinator.submit("lead-1", f"m{i}", turn)))
+            await asyncio.sleep(0.03)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+    assert len(turn.texts) >= 2
+    assert join_messages(turn.texts).split("\n") == [f"m{i}" for i in range(6)]
+
+
+def test_failed_turn_reaches_every_caller_and_frees_the_lead():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0.01, max_wait_seconds=1)
+
+    async def failing(text):
+        raise RuntimeError("Gemini fora do ar")
+
+    async def scenario():
+        results = await asyncio.gather(coordinator.submit("lead-1", "a", failing),
+                                       coordinator.submit("lead-1", "b", failing), return_exceptions=True)
+        after = await coordinator.submit("lead-1", "c", RecordingTurn())
+        return results, after
+
+    results, after = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after.result == "resposta para: c"
+    assert coordinator.snapshot()["failed_turns"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_turn():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0.01, max_wait_seconds=1)
+    turn = RecordingTurn(delay=0.02)
+
+    async def scenario():
+        leaving = asyncio.ensure_future(coordinator.submit("lead-1", "a", turn))
+        staying = asyncio.ensure_future(coordinator.submit("lead-1", "b", turn))
+        await asyncio.sleep(0.015)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    outcome = asyncio.run(scenario())
+
+    assert outcome.result == "resposta para: a\nb"
+    assert outcome.batch_size == 2
+
+
+def test_serialized_waits_for_the_running_turn():
+    coordinator = LeadTurnCoordinator(debounce_seconds=0, max_wait_seconds=0)
+    turn = RecordingTurn(delay=0.03)
+    order = []
+
+    async def streaming():
+        async with coordinator.serialized("lead-1"):
+            # Só entra depois que o turno em andamento terminou
+            order.append(("stream", turn.running))
+
+    async def scenario():
+        batch = asyncio.ensure_future(coordinator.submit("lead-1", "Oi", turn))
+        while not turn.texts:
+            await asyncio.sleep(0.001)
+        await streaming()
+        order.append("after-stream")
+        await batch
+
+    asyncio.run(scenario())
+
+    assert order == [("stream", 0), "after-stream"]
+    assert turn.texts == ["Oi"]
+
+
+def _checked_out() -> int:
+    return database.async_engine.sync_engine.pool.checkedout()
+
+
+def test_waiting_turn_of_same_lead_holds_no_connection(db, monkeypatch):
+    async def scenario():
+        model = BlockingGeminiModel()
+        monkeypatch.setattr(conversation_service, "get_gemini_models", lambda: (model, model))
+        first = asyncio.ensure_future(webhook_routes._handle_message("5547999998301", "Oi", None))
+        await model.started.wait()
+        second = asyncio.ensure_future(webhook_routes._handle_message("5547999998301", "Procuro casa", None))
+        await asyncio.sleep(0.05)
+
+        # O segundo turno espera no coordenador (e não num lock do banco) sem conexão do pool
+        in_flight = _checked_out()
+        model.release.set()
+        await asyncio.gather(first, second)
+        return in_flight, len(model.calls)
+
+    in_flight, calls = asyncio.run(scenario())
+
+    assert in_flight <= 1
+    assert calls == 2
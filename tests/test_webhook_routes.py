@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.api import webhook_routes
+from app.core import database
+from app.models.lead import Lead
+from app.services import conversation_cache, conversation_service
+from tests.conftest import BlockingGeminiModel
+
+
+@pytest.fixture
+def client(fake_gemini):
+    app = FastAPI()
+    app.include_router(webhook_routes.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_webhook_runs_the_turn_and_creates_the_lead(client, db):
+    response = client.post("/conversation/webhook", json={"phone_number": "5547999995001", "message": "Oi"})
+
+    assert response.status_code == 200
+    assert response.json() == {"response": "Olá! Em qual região você procura?", "coalesced_messages": 1}
+    assert db.scalar(select(func.count()).select_from(Lead)) == 1
+    assert conversation_cache.history_writer.flush() == 2
+
+
+def test_each_lead_gets_its_own_turn(client, db, fake_gemini):
+    for i in range(3):
+        assert client.post("/conversation/webhook",
+                           json={"phone_number": f"554799999510{i}", "message": "Oi"}).status_code == 200
+
+    assert db.scalar(select(func.count()).select_from(Lead)) == 3
+    assert len(fake_gemini.calls) == 3
+
+
+def _checked_out() -> int:
+    return database.async_engine.sync_engine.pool.checkedout()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_no_connection_is_held_during_the_gemini_call(db, monkeypatch, stream):
+    model = BlockingGeminiModel()
+    monkeypatch.setattr(conversation_service, "get_gemini_models", lambda: (model, model))
+
+    async def scenario():
+        if stream:
+            events = webhook_routes._conversation_events(
+                webhook_routes.WebhookPayload(phone_number="5547999995201", message="Oi"))
+            turn = asyncio.ensure_future(_drain(events))
+        else:
+            turn = asyncio.ensure_future(webhook_routes._run_turn("5547999995201", "Oi"))
+        await model.started.wait()
+        in_flight = _checked_out()
+        model.release.set()
+        await turn
+        return in_flight
+
+    assert asyncio.run(scenario()) == 0
+    # O lead criado na primeira fase e o turno gravado na terceira
+    assert db.scalar(select(func.count()).select_from(Lead)) == 1
+    assert conversation_cache.history_writer.flush() == 2
+
+
+async def _drain(events) -> list:
+    return [event async for event in events]